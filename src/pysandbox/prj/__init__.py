@@ -6,3 +6,4 @@ from . import words
 from . import pydnsbl
 from . import iplists
 from . import whois
+from . import whoisbench
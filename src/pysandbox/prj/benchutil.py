@@ -0,0 +1,23 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Helpers shared by the benchmarks"""
+
+import functools
+import os
+import subprocess
+
+
+@functools.cache
+def git_commit() -> str:
+    """Short hash of the ``HEAD`` commit of the source tree, the commit is
+    recorded in the results of a benchmark (empty if git is not available)."""
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return proc.stdout.strip()
@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Persistent (SQLite) cache with a time to live and a bounded size"""
+
+from __future__ import annotations
+from typing import Any, Iterable
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "pysandbox"
+)
+"""Folder of the cache files (``$XDG_CACHE_HOME/pysandbox``)."""
+
+CACHE_MAX_ENTRIES = 100_000
+"""Default maximum number of entries in a cache."""
+
+_SQL_BATCH = 500  # max. number of keys in one SQL statement
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+  key      TEXT PRIMARY KEY,
+  value    TEXT NOT NULL,
+  fetched  REAL NOT NULL,
+  expires  REAL NOT NULL,
+  accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+
+def cache_path(name: str) -> str:
+    """Name of the cache file ``name`` in the :py:obj:`CACHE_DIR`."""
+    return os.path.join(CACHE_DIR, f"{name}.sqlite")
+
+
+class SQLiteCache:
+    """A key / value store in a SQLite file, the values are JSON serializable
+    objects.  Each entry has a time when it was fetched and a time when it
+    expires (``ttl`` of :py:obj:`set_many`).  The cache holds not more than
+    ``max_entries``, the entries that have not been read for the longest time
+    are removed (LRU).  The cache can be used from more than one thread.
+
+    .. code:: python
+
+       with SQLiteCache(cache_path("example")) as cache:
+           cache.set_many({"foo": [1, 2]}, ttl=3600)
+           cache.get_many(["foo", "bar"])  # --> {"foo": [1, 2]}
+
+    :param path: name of the SQLite file (the folder is created)
+    :param max_entries: maximum number of entries
+    """
+
+    def __init__(self, path: str, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the SQLite file."""
+        self._db.close()
+
+    def get_many(
+        self, keys: Iterable[str], max_age: float | None = None, stale: bool = False
+    ) -> dict[str, Any]:
+        """Values of the ``keys`` in the cache, keys not in the cache or with an
+        expired entry are not in the returned dictionary.
+
+        :param keys: keys to look up
+        :param max_age: entries fetched more than ``max_age`` seconds ago are
+          expired (independent of their ``ttl``)
+        :param stale: return also the expired entries
+        """
+        now = time.time()
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock, self._db:
+            for pos in range(0, len(keys), _SQL_BATCH):
+                batch = keys[pos : pos + _SQL_BATCH]
+                rows = self._db.execute(
+                    "SELECT key, value, fetched, expires FROM cache"
+                    f" WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, value, fetched, expires in rows:
+                    if stale or (
+                        now < expires and (max_age is None or now - fetched < max_age)
+                    ):
+                        found[key] = value
+            hits = list(found)
+            for pos in range(0, len(hits), _SQL_BATCH):
+                batch = hits[pos : pos + _SQL_BATCH]
+                self._db.execute(
+                    f"UPDATE cache SET accessed = ? WHERE key IN ({','.join('?' * len(batch))})",
+                    [now, *batch],
+                )
+        return {key: json.loads(value) for key, value in found.items()}
+
+    def set_many(self, items: dict[str, Any], ttl: float):
+        """Store the ``items`` in the cache, the entries expire in ``ttl``
+        seconds.  When the cache is larger than ``max_entries`` the least
+        recently used entries are removed."""
+        now = time.time()
+        rows = [
+            (key, json.dumps(value), now, now + ttl, now)
+            for key, value in items.items()
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN"
+                " (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
@@ -0,0 +1,782 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Work with IP lists"""
+
+# pylint: disable = too-many-arguments, too-many-positional-arguments
+
+from __future__ import annotations
+from collections import Counter
+import contextlib
+import json
+import os
+import tempfile
+
+import click
+
+from .._cli import prj
+from .networks import (
+    IPV4SEG,
+    IPV4ADDR,
+    IPV6SEG,
+    IPV6GROUPS,
+    IPV6ADDR,
+    CIDR,
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    filter_networks,
+    parse_networks,
+    ip_to_int,
+    int_to_ip,
+    iter_blocks,
+    collect_networks,
+    collect_networks_buffer,
+    collect_networks_mmap,
+    collect_networks_parallel,
+    new_networks,
+    file_chunks,
+    merge_networks,
+    range_to_cidrs,
+)
+from .cidrset import CidrSet, CidrIndexError, U128Array, diff_networks, str_to_network
+from .lookup import CidrLookup, load_cidrs
+from .follow import follow_networks
+from .aggregate import aggregate_networks, merge_counts
+from .formats import DIFF_FORMATS, FORMATS, NFT_TABLE, write_diff, write_networks
+from .logformats import LOG_FORMATS, LogFormat
+from .external import ExternalMerge, parse_size
+from .compressed import (
+    COMPRESSIONS,
+    DecompressReader,
+    InputFile,
+    compression,
+    open_decompressed,
+)
+from .bench import (
+    BENCH_LINES,
+    BENCH_SEED,
+    BENCHMARKS,
+    iter_log_lines,
+    run_benchmark,
+    write_log,
+)
+
+__all__ = [
+    "IPV4SEG",
+    "IPV4ADDR",
+    "IPV6SEG",
+    "IPV6GROUPS",
+    "IPV6ADDR",
+    "CIDR",
+    "IPV4_BITS",
+    "IPV6_BITS",
+    "IPListOptions",
+    "filter_networks",
+    "parse_networks",
+    "ip_to_int",
+    "int_to_ip",
+    "iter_blocks",
+    "collect_networks",
+    "collect_networks_buffer",
+    "collect_networks_mmap",
+    "collect_networks_parallel",
+    "new_networks",
+    "file_chunks",
+    "merge_networks",
+    "range_to_cidrs",
+    "CidrSet",
+    "CidrIndexError",
+    "U128Array",
+    "str_to_network",
+    "diff_networks",
+    "CidrLookup",
+    "load_cidrs",
+    "follow_networks",
+    "aggregate_networks",
+    "merge_counts",
+    "FORMATS",
+    "write_networks",
+    "DIFF_FORMATS",
+    "write_diff",
+    "LOG_FORMATS",
+    "LogFormat",
+    "ExternalMerge",
+    "parse_size",
+    "COMPRESSIONS",
+    "DecompressReader",
+    "InputFile",
+    "compression",
+    "open_decompressed",
+    "iter_log_lines",
+    "write_log",
+    "run_benchmark",
+]
+
+# command line
+# ------------
+
+
+@prj.group()
+def iplists():
+    """comandline for experimantal IP tools"""
+
+
+@iplists.command("ip-filter")
+@click.option(
+    "--ipv4-min-pref",
+    type=int,
+    show_default=True,
+    default=32,
+    help="minimum IPv4 prefix (max. subnet)",
+)
+@click.option(
+    "--ipv6-min-pref",
+    type=int,
+    show_default=True,
+    default=48,
+    help="minimum IPv6 prefix (max. subnet)",
+)
+@click.option(
+    "--ipv6-norm-pref",
+    type=int,
+    show_default=True,
+    default=128,
+    help="normalize IPv6 addresses to this prefix (e.g. 64)",
+)
+@click.option(
+    "--re-substring",
+    type=str,
+    default=None,
+    help="regular expression to parse only a substring from incomming line",
+)
+@click.option(
+    "--log-format",
+    type=click.Choice(["generic", *LOG_FORMATS]),
+    show_default=True,
+    default="generic",
+    help="take the IPs from the fields of a known log format (generic: scan lines by regexp)",
+)
+@click.option(
+    "--ignore-zone-id",
+    is_flag=True,
+    default=True,
+    help="ignore link-local IPv6 addresses with zone ID",
+)
+@click.option(
+    "--merge/--no-merge",
+    default=True,
+    help="merge IPs and subnets to smallest possible list of CIDR subnets",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    show_default=True,
+    default=1,
+    help="number of worker processes (merge)",
+)
+@click.option(
+    "--mmap",
+    "use_mmap",
+    is_flag=True,
+    default=False,
+    help="scan memory mapped files as bytes (stdin: block reads)",
+)
+@click.option(
+    "--memory-budget",
+    type=str,
+    default=None,
+    help="memory for networks (e.g. 512M), spill sorted runs to temporary files (TMPDIR)"
+    " when reached",
+)
+@click.option(
+    "--aggregate",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=0,
+    help="aggregate networks into their parent prefix when it has (at least) N networks",
+)
+@click.option(
+    "--ipv4-agg-pref",
+    type=click.IntRange(0, 32),
+    show_default=True,
+    default=24,
+    help="--aggregate: IPv4 parent prefix",
+)
+@click.option(
+    "--ipv6-agg-pref",
+    type=click.IntRange(0, 128),
+    show_default=True,
+    default=48,
+    help="--aggregate: IPv6 parent prefix",
+)
+@click.option(
+    "--counts",
+    is_flag=True,
+    default=False,
+    help="print the number of hits after each network",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(FORMATS),
+    show_default=True,
+    default="text",
+    help="format of OUTPUT (ipset restore, nft -f, packed binary LPM prefixes)",
+)
+@click.option(
+    "--family",
+    type=click.Choice(["ipv4", "ipv6"]),
+    default=None,
+    help="write only the networks of this address family (required by --format=binary)"
+    "  [default: both]",
+)
+@click.option(
+    "--set-name",
+    show_default=True,
+    default="ip_filter",
+    help="--format: name of the set (+ _v4/_v6)",
+)
+@click.option(
+    "--nft-table",
+    show_default=True,
+    default=NFT_TABLE,
+    help="--format=nft: table of the set",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    default=False,
+    help="follow a growing file or pipe and update OUTPUT (atomically)",
+)
+@click.option(
+    "--flush-interval",
+    type=float,
+    show_default=True,
+    default=10,
+    help="--follow: update OUTPUT after seconds",
+)
+@click.option(
+    "--flush-every",
+    type=int,
+    show_default=True,
+    default=1000,
+    help="--follow: update OUTPUT after new networks",
+)
+@click.argument("streams", type=InputFile(), nargs=-1)
+@click.argument("output", type=click.File("w", lazy=True))
+def _ip_filter(  # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    ipv4_min_pref,
+    ipv6_min_pref,
+    ipv6_norm_pref,
+    re_substring,
+    log_format,
+    ignore_zone_id,
+    merge,
+    jobs,
+    use_mmap,
+    memory_budget,
+    aggregate,
+    ipv4_agg_pref,
+    ipv6_agg_pref,
+    counts,
+    output_format,
+    family,
+    set_name,
+    nft_table,
+    follow,
+    flush_interval,
+    flush_every,
+    streams,
+    output,
+):
+    """Filter out IP adresses and subnets from streams (files)
+
+    IPv6 clients usually get a whole prefix (e.g. a /64) from their provider,
+    with ``--ipv6-norm-pref=64`` the IPv6 addresses (and longer IPv6 prefixes)
+    are normalized to the /64 network they belong to::
+
+      $ iplists ip-filter --ipv6-norm-pref=64 access.log botnet.lst
+
+    With ``--follow`` the (one) stream is followed (like ``tail -f``) and the
+    merged list of networks in OUTPUT is updated (replaced atomically) when new
+    networks are found, the networks already in OUTPUT are kept::
+
+      $ journalctl -f -u "uwsgi@searxng" | iplists ip-filter --follow - botnet.lst
+
+    With ``--memory-budget`` the memory used for the networks is limited, large
+    inputs (e.g. months of archived logs) are merged in sorted runs on disk::
+
+      $ iplists ip-filter --memory-budget=256M archive/*.log botnet.lst
+
+    With ``--aggregate=N`` the hits of each network are counted, when a parent
+    prefix (``--ipv4-agg-pref``, ``--ipv6-agg-pref``) contains N or more
+    networks, these networks are replaced by the parent prefix.  The minimum
+    prefix (``--ipv4-min-pref``, ``--ipv6-min-pref``) filters only the networks
+    from the streams, not the parent prefixes, no other options are needed.
+    With ``--counts`` the number of hits is printed after each network::
+
+      $ iplists ip-filter --aggregate=8 --counts access.log -
+      10.20.30.0/24 172
+      192.0.2.17/32 3
+
+    With ``--format`` the networks are written in a format that can be loaded
+    by the firewall in one bulk operation (see :py:obj:`write_networks`).  The
+    records of the ``binary`` format differ in size for IPv4 and IPv6, a binary
+    file holds only one address family (``--family``)::
+
+      $ iplists ip-filter --format=ipset --set-name=botnet access.log botnet.ipset
+      $ ipset restore < botnet.ipset
+      $ iplists ip-filter --format=binary --family=ipv4 access.log botnet_v4.bin
+      $ iplists ip-filter --format=binary --family=ipv6 access.log botnet_v6.bin
+
+    With ``--log-format`` the IPs are taken from the fields of a known log
+    format (see :py:obj:`LOG_FORMATS`) instead of scanning the whole line::
+
+      $ journalctl -o json -u "uwsgi@searxng" | iplists ip-filter --log-format=journald - -
+      $ iplists ip-filter --log-format=searxng searxng.log botnet.lst
+    """
+    _check_ipv6_norm_pref(ipv6_min_pref, ipv6_norm_pref)
+    opts = IPListOptions(
+        ipv4_min_pref=ipv4_min_pref,
+        ipv6_min_pref=ipv6_min_pref,
+        ipv6_norm_pref=ipv6_norm_pref,
+        ipv4_agg_pref=ipv4_agg_pref,
+        ipv6_agg_pref=ipv6_agg_pref,
+        agg_threshold=aggregate,
+        re_substring=re_substring,
+        log_format=log_format,
+        ignore_zone_id=ignore_zone_id,
+    )
+
+    if output_format != "text" and (follow or counts):
+        raise click.UsageError("--follow and --counts can't be combined with --format")
+    if output_format == "binary" and family is None:
+        raise click.UsageError(
+            "--format=binary needs --family=ipv4 or --family=ipv6 (one address family per file)"
+        )
+    if follow and family:
+        raise click.UsageError("--family can't be combined with --follow")
+    families = {"ipv4": (IPV4_BITS,), "ipv6": (IPV6_BITS,)}.get(
+        family, (IPV4_BITS, IPV6_BITS)
+    )
+    write_opts = {"fmt": output_format, "name": set_name, "table": nft_table}
+
+    if follow:
+        if len(streams) != 1 or output.name == "-":
+            raise click.UsageError(
+                "--follow needs exactly one stream and an OUTPUT file"
+            )
+        ignored = {
+            "--aggregate": aggregate,
+            "--counts": counts,
+            "--memory-budget": memory_budget,
+            "--jobs": jobs > 1,
+            "--mmap": use_mmap,
+            "--no-merge": not merge,
+        }
+        for name, value in ignored.items():
+            if value:
+                raise click.UsageError(f"{name} can't be combined with --follow")
+        cidrs = None
+        if os.path.isfile(output.name):
+            with open(output.name, encoding="utf-8") as f:
+                cidrs = CidrSet.load(f)
+        follow_networks(
+            opts,
+            streams[0],
+            output.name,
+            interval=flush_interval,
+            every=flush_every,
+            cidrs=cidrs,
+        )
+        return
+
+    if merge and (aggregate or counts):
+        if jobs > 1 or memory_budget:
+            raise click.UsageError(
+                "--aggregate and --counts can't be combined with --jobs or --memory-budget"
+            )
+        collect = collect_networks_mmap if use_mmap else collect_networks
+        hits = new_networks(Counter)
+        for f in streams:
+            collect(opts, f, hits)
+        counted = {
+            bits: merge_counts(aggregate_networks(opts, hits[bits], bits), bits)
+            for bits in families
+        }
+        if not counts:
+            write_networks(
+                output,
+                {
+                    bits: [(net, prefixlen) for net, prefixlen, _ in items]
+                    for bits, items in counted.items()
+                },
+                **write_opts,
+            )
+            return
+        for bits, items in counted.items():
+            for net, prefixlen, count in items:
+                output.write(f"{int_to_ip(net, bits)}/{prefixlen} {count}\n")
+        return
+
+    if merge and memory_budget:
+        if jobs > 1:
+            raise click.UsageError("--memory-budget can't be combined with --jobs")
+        try:
+            budget = parse_size(memory_budget)
+        except ValueError as exc:
+            raise click.BadParameter(str(exc), param_hint="--memory-budget") from exc
+        with ExternalMerge(budget) as ext:
+            for f in streams:
+                ext.collect(opts, f, use_mmap)
+            write_networks(
+                output, {bits: ext.merged(bits) for bits in families}, **write_opts
+            )
+        return
+
+    if merge:
+        if jobs > 1:
+            networks = collect_networks_parallel(opts, streams, jobs)
+        else:
+            collect = collect_networks_mmap if use_mmap else collect_networks
+            networks = new_networks()
+            for f in streams:
+                collect(opts, f, networks)
+        write_networks(
+            output,
+            {bits: merge_networks(networks[bits], bits) for bits in families},
+            **write_opts,
+        )
+        return
+
+    for f in streams:
+        for ip, cidr in filter_networks(opts, f):
+            if (IPV6_BITS if ":" in ip else IPV4_BITS) not in families:
+                continue
+            if cidr:
+                output.write(f"{ip}/{cidr}\n")
+            else:
+                output.write(f"{ip}\n")
+
+
+def _check_ipv6_norm_pref(ipv6_min_pref, ipv6_norm_pref):
+    if not ipv6_min_pref <= ipv6_norm_pref <= IPV6_BITS:
+        raise click.BadParameter(
+            f"must be in the range --ipv6-min-pref ({ipv6_min_pref}) .. 128",
+            param_hint="--ipv6-norm-pref",
+        )
+
+
+@iplists.command("add")
+@click.option(
+    "--ipv4-min-pref",
+    type=int,
+    show_default=True,
+    default=32,
+    help="minimum IPv4 prefix (max. subnet)",
+)
+@click.option(
+    "--ipv6-min-pref",
+    type=int,
+    show_default=True,
+    default=48,
+    help="minimum IPv6 prefix (max. subnet)",
+)
+@click.option(
+    "--ipv6-norm-pref",
+    type=int,
+    show_default=True,
+    default=128,
+    help="normalize IPv6 addresses to this prefix (e.g. 64)",
+)
+@click.option(
+    "--re-substring",
+    type=str,
+    default=None,
+    help="regular expression to parse only a substring from incomming line",
+)
+@click.option(
+    "--log-format",
+    type=click.Choice(["generic", *LOG_FORMATS]),
+    show_default=True,
+    default="generic",
+    help="take the IPs from the fields of a known log format (generic: scan lines by regexp)",
+)
+@click.argument("index", type=click.Path(dir_okay=False))
+@click.argument("streams", type=InputFile(), nargs=-1)
+def _add(
+    ipv4_min_pref,
+    ipv6_min_pref,
+    ipv6_norm_pref,
+    re_substring,
+    log_format,
+    index,
+    streams,
+):
+    """Add IP adresses and subnets from streams (files) to a binary INDEX file
+
+    The INDEX is created if it does not exist, the networks from the streams
+    are merged into the INDEX and the INDEX file is replaced atomically.  To
+    get a (text) list of the networks use command ``export``.
+
+    Only the merge of the new networks (in Python) depends on the number of
+    new networks: the whole INDEX is still read and written again, these
+    (block) copies grow with the size of the INDEX.
+
+    usage::
+
+      $ iplists add --ipv4-min-pref=8 botnet.idx botnet.lst  # create index from list
+      $ iplists add botnet.idx log/ipv4/*.log
+      $ iplists export botnet.idx botnet.lst
+    """
+    _check_ipv6_norm_pref(ipv6_min_pref, ipv6_norm_pref)
+    opts = IPListOptions(
+        ipv4_min_pref=ipv4_min_pref,
+        ipv6_min_pref=ipv6_min_pref,
+        ipv6_norm_pref=ipv6_norm_pref,
+        re_substring=re_substring,
+        log_format=log_format,
+    )
+    networks = new_networks()
+    for f in streams:
+        collect_networks(opts, f, networks)
+
+    try:
+        cidrs = CidrSet.load_index(index) if os.path.exists(index) else CidrSet()
+    except CidrIndexError as exc:
+        raise click.ClickException(str(exc)) from exc
+    cidrs.update(
+        CidrSet.from_networks(ipv4=networks[IPV4_BITS], ipv6=networks[IPV6_BITS])
+    )
+    cidrs.save_index(index)
+
+
+@iplists.command("export")
+@click.argument("index", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.File("w", atomic=True))
+def _export(index, output):
+    """Export networks from a binary INDEX file to a list (one CIDR per line)"""
+    try:
+        cidrs = CidrSet.load_index(index)
+    except CidrIndexError as exc:
+        raise click.ClickException(str(exc)) from exc
+    for net in cidrs:
+        output.write(f"{net}\n")
+
+
+@iplists.command("diff")
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(DIFF_FORMATS),
+    show_default=True,
+    default="text",
+    help="format of the changes (ipset restore, nft -f)",
+)
+@click.option(
+    "--set-name",
+    show_default=True,
+    default="ip_filter",
+    help="--format: name of the set (+ _v4/_v6)",
+)
+@click.option(
+    "--nft-table",
+    show_default=True,
+    default=NFT_TABLE,
+    help="--format=nft: table of the set",
+)
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.File("w", lazy=True), default="-")
+def _diff(output_format, set_name, nft_table, old, new, output):
+    """Changes from the OLD to the NEW list of networks (text or binary index)
+
+    The networks of both lists are merged, a network that is only in one of the
+    lists is removed or added.  The changes are written as an update script of
+    the (firewall) set that contains the OLD networks::
+
+      $ iplists diff --format=ipset --set-name=botnet botnet.lst.old botnet.lst | ipset restore
+
+    The changes are the elements of the sets, not the address ranges: when a
+    /24 of the OLD list is replaced by the /23 that contains it, the /24 is
+    removed and the /23 is added (not only the other /24).  This script is not
+    the shortest, but the set then holds exactly the networks of the NEW list
+    (the next diff applies) and an element is never deleted partially (the
+    ipset and nftables sets delete only elements they contain).
+    """
+    try:
+        old_cidrs, new_cidrs = load_cidrs(old), load_cidrs(new)
+    except (CidrIndexError, ValueError) as exc:
+        raise click.ClickException(str(exc)) from exc
+    diffs = {
+        bits: diff_networks(old_cidrs.networks(bits), new_cidrs.networks(bits))
+        for bits in (IPV4_BITS, IPV6_BITS)
+    }
+    write_diff(output, diffs, fmt=output_format, name=set_name, table=nft_table)
+
+
+@iplists.command("lookup")
+@click.option(
+    "-l",
+    "--list",
+    "lists",
+    multiple=True,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="CIDR list (text or binary index), can be given more than once",
+)
+@click.option(
+    "--all",
+    "show_all",
+    is_flag=True,
+    default=False,
+    help="also print addresses not in any list",
+)
+@click.argument("streams", type=InputFile(), nargs=-1)
+def _lookup(lists, show_all, streams):
+    """Lookup IP adresses from streams (one per line) in CIDR lists
+
+    For each address contained in a list, the address, the name of the list and
+    the network in the list is printed.
+
+    usage::
+
+      $ iplists lookup -l searxng/ipv4_botnet.lst -l spamhaus/ipv4_spamhaus_ASN-DROP.lst ips.txt
+    """
+    try:
+        lookup = CidrLookup(
+            {os.path.basename(path): load_cidrs(path) for path in lists}
+        )
+    except (CidrIndexError, ValueError) as exc:
+        raise click.ClickException(str(exc)) from exc
+
+    out = click.get_text_stream("stdout")
+    for f in streams:
+        for addr, matches in lookup.lookup_stream(f):
+            for name, net in matches:
+                out.write(f"{addr} {name} {net}\n")
+            if show_all and not matches:
+                out.write(f"{addr} - -\n")
+
+
+@iplists.command("gen-log")
+@click.option(
+    "-n",
+    "--lines",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=10**5,
+    help="number of lines",
+)
+@click.option(
+    "--seed",
+    type=int,
+    show_default=True,
+    default=BENCH_SEED,
+    help="seed of the random generator",
+)
+@click.argument("output", type=click.File("w", lazy=True))
+def _gen_log(lines, seed, output):
+    """Generate a synthetic log file (deterministic) with IPv4 & IPv6 adresses
+
+    The log is a mix of SearXNG ``BLOCK: ... SUSPICIOUS_IP_WINDOW`` lines, nginx
+    access log lines and noise, the same ``--seed`` generates the same log::
+
+      $ iplists gen-log --lines=1000000 test.log
+      $ iplists ip-filter --re-substring '.*BLOCK: .* SUSPICIOUS_IP_WINDOW' test.log -
+    """
+    for line in iter_log_lines(lines, seed):
+        output.write(line + "\n")
+
+
+@iplists.command("bench")
+@click.option(
+    "-n",
+    "--lines",
+    "sizes",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=BENCH_LINES,
+    show_default=True,
+    help="number of log lines, can be given more than once",
+)
+@click.option(
+    "-b",
+    "--benchmark",
+    "names",
+    type=click.Choice(list(BENCHMARKS)),
+    multiple=True,
+    help="benchmark to run, can be given more than once (default: all)",
+)
+@click.option(
+    "--seed",
+    type=int,
+    show_default=True,
+    default=BENCH_SEED,
+    help="seed of the log generator",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="folder for the generated logs, reused by later runs (default: temporary folder)",
+)
+@click.option(
+    "--json",
+    "json_file",
+    type=click.File("a"),
+    default=None,
+    help="append the results (JSON lines)",
+)
+@click.option(
+    "--compare",
+    type=click.File("r"),
+    default=None,
+    help="compare with results from --json of a former run",
+)
+def _bench(sizes, names, seed, work_dir, json_file, compare):
+    """Benchmark the IP list pipeline on synthetic logs
+
+    Each benchmark runs in a new process, it prints the throughput (lines/sec)
+    and the peak RSS of the process.  Logs from 10^4 up to 10^7 lines
+    (``--lines=10000000``) are useful.  The logs are generated by ``gen-log``
+    with the same seed, results from different commits are comparable::
+
+      $ iplists bench --work-dir=/tmp/bench --json=main.jsonl
+      $ git checkout my-branch
+      $ iplists bench --work-dir=/tmp/bench --compare=main.jsonl
+    """
+    former = {}
+    if compare:
+        for line in compare:
+            if line.strip():
+                result = json.loads(line)
+                former[(result["benchmark"], result["lines"])] = result
+
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix="pysandbox-bench-")
+            )
+        os.makedirs(work_dir, exist_ok=True)
+
+        for lines in sizes:
+            path = os.path.join(work_dir, f"bench-{lines}-{seed}.log")
+            if not os.path.exists(path):
+                write_log(path, lines, seed)
+            for name in names or BENCHMARKS:
+                result = run_benchmark(name, path, lines)
+                msg = (
+                    f"{name:<26} {lines:>9} lines {result['seconds']:>9.3f}s"
+                    f" {result['lines_per_sec']:>11,} lines/s {result['max_rss']:>9,} KiB"
+                )
+                old = former.get((name, lines))
+                if old and old["lines_per_sec"]:
+                    msg += (
+                        f"  {result['lines_per_sec'] / old['lines_per_sec']:5.2f}x"
+                        f" ({old['commit']})"
+                    )
+                click.echo(msg)
+                if json_file:
+                    json_file.write(json.dumps(result) + "\n")
+                    json_file.flush()
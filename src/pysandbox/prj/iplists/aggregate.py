@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Count the hits of networks and aggregate dense neighborhoods into their
+parent prefix"""
+
+from __future__ import annotations
+from collections import Counter
+
+from .networks import IPV4_BITS, IPListOptions, merge_networks, prefix_masks
+
+
+def aggregate_networks(
+    opts: IPListOptions, hits: Counter, bits: int = IPV4_BITS
+) -> Counter:
+    """Collapse the networks in a dense parent prefix into the parent.
+
+    The parent of a network is the network with the prefix length
+    :py:obj:`IPListOptions.ipv4_agg_pref` (:py:obj:`IPListOptions.ipv6_agg_pref`
+    for IPv6).  When a parent contains :py:obj:`IPListOptions.agg_threshold` or
+    more (distinct) networks, these are replaced by the parent and the hits of
+    the networks are summed up (no aggregation if ``agg_threshold`` is 0).
+    Networks which are larger than the parent prefix are not changed.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param hits: ``(network, prefixlen)`` pairs and their number of hits (see
+      :py:obj:`collect_networks <.networks.collect_networks>`)
+    :param bits: size of the address space (32 for IPv4, 128 for IPv6)
+    """
+    if not opts.agg_threshold:
+        return hits
+    parent_pref = opts.ipv4_agg_pref if bits == IPV4_BITS else opts.ipv6_agg_pref
+    mask = prefix_masks(bits)[parent_pref]
+
+    children = Counter()
+    for net, prefixlen in hits:
+        if prefixlen > parent_pref:
+            children[net & mask] += 1
+
+    aggregated = Counter()
+    for (net, prefixlen), count in hits.items():
+        if prefixlen > parent_pref and children[net & mask] >= opts.agg_threshold:
+            aggregated[net & mask, parent_pref] += count
+        else:
+            aggregated[net, prefixlen] += count
+    return aggregated
+
+
+def merge_counts(hits: Counter, bits: int = IPV4_BITS) -> list[tuple[int, int, int]]:
+    """Merge the networks in ``hits`` like :py:obj:`merge_networks
+    <.networks.merge_networks>`, returns ``(network, prefixlen, hits)`` where
+    ``hits`` is the sum of the hits of the networks in the merged network.
+
+    :param hits: ``(network, prefixlen)`` pairs and their number of hits
+    :param bits: size of the address space (32 for IPv4, 128 for IPv6)
+    """
+    counted = []
+    items = sorted(hits.items())
+    i = 0
+    for net, prefixlen in merge_networks(hits, bits):
+        last = net + (1 << (bits - prefixlen)) - 1
+        count = 0
+        # the networks are aligned, a network is part of the merged network
+        # which contains the first address of the network
+        while i < len(items) and items[i][0][0] <= last:
+            count += items[i][1]
+            i += 1
+        counted.append((net, prefixlen, count))
+    return counted
@@ -0,0 +1,207 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Benchmarks of the IP list pipeline and a generator of synthetic log files"""
+
+# pylint: disable = import-outside-toplevel, cyclic-import
+
+from __future__ import annotations
+from typing import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import time
+
+from ..benchutil import git_commit
+from .networks import (
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    collect_networks,
+    filter_networks,
+    int_to_ip,
+    merge_networks,
+    parse_networks,
+)
+
+BENCH_LINES = (10**4, 10**5, 10**6)
+"""Default sizes (number of log lines) of the benchmarks."""
+
+BENCH_SEED = 42
+"""Default seed of the log generator (:py:obj:`iter_log_lines`)."""
+
+BLOCK_SUBSTRING = r".*BLOCK: .* SUSPICIOUS_IP_WINDOW"
+"""``--re-substring`` that matches the ``BLOCK`` lines of the generated logs
+(the expression is matched at the beginning of the line)."""
+
+_AGENTS = [
+    "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"
+    " Chrome/120.0.6099.109",
+    "python-requests/2.31.0",
+    "curl/8.5.0",
+]
+
+_NOISE = [
+    "Traceback (most recent call last):",
+    '  File "/usr/local/searxng/searx/webapp.py", line 1042, in search',
+    "searx.engines: engine timeout after 3.0 sec (wikipedia)",
+    "pysandbox 1.2.3 / python 3.12.1 / uwsgi 2.0.23",
+    "invalid address 010.001.002.003 from upstream 256.1.2.3",
+    "",
+]
+
+
+def iter_log_lines(lines: int, seed: int = BENCH_SEED) -> Iterator[str]:
+    """Generate ``lines`` synthetic log lines (without line breaks).  The lines
+    depend only on ``lines`` and ``seed``, the logs are the same on every run.
+
+    The log is a mix of SearXNG ``BLOCK: ... SUSPICIOUS_IP_WINDOW`` lines (IPv4
+    and IPv6 with CIDR suffix, see :py:obj:`BLOCK_SUBSTRING`), access log lines
+    of nginx (IPv4 and IPv6 clients) and noise text without valid addresses.
+    The clients are picked from a pool of subnets, most addresses are seen
+    more than once and many networks can be merged.
+    """
+    rnd = random.Random(seed)
+    pool = max(16, lines // 64)
+    nets4 = [rnd.randrange(1 << 24, 224 << 24) & 0xFFFFFF00 for _ in range(pool)]
+    nets6 = [(0x2000 << 112) | (rnd.getrandbits(45) << 80) for _ in range(pool // 4)]
+
+    def ipv4():
+        return int_to_ip(nets4[rnd.randrange(pool)] | rnd.randrange(256), IPV4_BITS)
+
+    def ipv6():
+        return int_to_ip(
+            nets6[rnd.randrange(len(nets6))] | rnd.getrandbits(16), IPV6_BITS
+        )
+
+    for i in range(lines):
+        stamp = (
+            f"2024-10-{1 + i * 30 // lines:02d}"
+            f" {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+        )
+        uwsgi = f"searxng uwsgi[{1000 + i % 7}]"
+        kind = rnd.random()
+        if kind < 0.30:
+            cidr = "/24" if rnd.random() < 0.1 else "/32"
+            yield f"{stamp} {uwsgi}: BLOCK: {ipv4()}{cidr} SUSPICIOUS_IP_WINDOW 21/20"
+        elif kind < 0.35:
+            yield f"{stamp} {uwsgi}: BLOCK: {ipv6()}/64 SUSPICIOUS_IP_WINDOW 31/30"
+        elif kind < 0.75:
+            yield (
+                f'{ipv4()} - - [{stamp}] "GET /search?q=q{i % 997} HTTP/1.1"'
+                f" {rnd.choice((200, 429))}"
+                f' {rnd.randrange(10000)} "-" "{rnd.choice(_AGENTS)}"'
+            )
+        elif kind < 0.85:
+            yield (
+                f'{ipv6()} - - [{stamp}] "GET /static/themes/simple/img/favicon.png HTTP/2.0"'
+                ' 304 0 "-" "-"'
+            )
+        else:
+            yield f"{stamp} searxng uwsgi[{1000 + i % 7}]: {rnd.choice(_NOISE)}"
+
+
+def write_log(path: str, lines: int, seed: int = BENCH_SEED):
+    """Write a synthetic log with ``lines`` lines (:py:obj:`iter_log_lines`)
+    to the file ``path``."""
+    with open(path, "w", encoding="utf-8") as f:
+        for line in iter_log_lines(lines, seed):
+            f.write(line + "\n")
+
+
+# benchmarks
+# ----------
+#
+# A benchmark is a function that is called with the name of a log file, it
+# prepares the data (not measured) and returns the function which is timed.
+
+
+def _bench_parse_networks(path: str) -> Callable:
+    opts = IPListOptions()
+
+    def run():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                for _ in parse_networks(opts, line, opts.ipv4, opts.ipv4_min_pref):
+                    pass
+
+    return run
+
+
+def _bench_filter_networks(path: str) -> Callable:
+    opts = IPListOptions()
+
+    def run():
+        with open(path, encoding="utf-8") as f:
+            for _ in filter_networks(opts, f):
+                pass
+
+    return run
+
+
+def _bench_collect_networks(path: str) -> Callable:
+    opts = IPListOptions()
+
+    def run():
+        with open(path, encoding="utf-8") as f:
+            collect_networks(opts, f)
+
+    return run
+
+
+def _bench_merge_networks(path: str) -> Callable:
+    with open(path, encoding="utf-8") as f:
+        networks = collect_networks(IPListOptions(), f)
+    return lambda: [merge_networks(items, bits) for bits, items in networks.items()]
+
+
+def _bench_ip_filter(*args: str) -> Callable[[str], Callable]:
+    def bench(path: str) -> Callable:
+        from . import _ip_filter
+
+        return lambda: _ip_filter.main([*args, path, os.devnull], standalone_mode=False)
+
+    return bench
+
+
+BENCHMARKS: dict[str, Callable[[str], Callable]] = {
+    "parse_networks": _bench_parse_networks,
+    "filter_networks": _bench_filter_networks,
+    "collect_networks": _bench_collect_networks,
+    "merge_networks": _bench_merge_networks,
+    "ip-filter": _bench_ip_filter(),
+    "ip-filter --mmap": _bench_ip_filter("--mmap"),
+    "ip-filter --re-substring": _bench_ip_filter("--re-substring", BLOCK_SUBSTRING),
+    "ip-filter --memory-budget": _bench_ip_filter("--memory-budget", "1M"),
+    "ip-filter --log-format=access": _bench_ip_filter("--log-format", "access"),
+    "ip-filter --log-format=searxng": _bench_ip_filter("--log-format", "searxng"),
+}
+"""Benchmarks by name, see :py:obj:`run_benchmark`."""
+
+
+def run_benchmark(name: str, path: str, lines: int) -> dict:
+    """Run the benchmark ``name`` on the log file ``path`` (with ``lines``
+    lines) in a new process and return the result.  The peak RSS (``max_rss``,
+    KiB) is the maximum resident set size of this process."""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        seconds, max_rss = pool.submit(_run_benchmark, name, path).result()
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "benchmark": name,
+        "lines": lines,
+        "seconds": round(seconds, 4),
+        "lines_per_sec": round(lines / seconds) if seconds else 0,
+        "max_rss": max_rss,
+    }
+
+
+def _run_benchmark(name: str, path: str) -> tuple[float, int]:
+    run = BENCHMARKS[name](path)
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,541 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Compact sets of IPv4 and IPv6 networks and their binary index files"""
+
+from __future__ import annotations
+from typing import IO, Iterable, Iterator
+from array import array
+import bisect
+import contextlib
+import heapq
+import mmap
+import operator
+import os
+import struct
+import sys
+import tempfile
+
+from .networks import (
+    IPV4_BITS,
+    IPV6_BITS,
+    int_to_ip,
+    ip_to_int,
+    prefix_masks,
+    range_to_cidrs,
+)
+
+
+def str_to_network(text: str) -> tuple[int, int, int]:
+    """Parse an IP address or a CIDR network (``ip/prefixlen``) string, returns
+    ``(bits, network, prefixlen)``, host bits of the network are masked out.
+    Raises :py:obj:`ValueError` if ``text`` is not a valid network."""
+    ip, _, prefixlen = text.strip().partition("/")
+    bits = IPV6_BITS if ":" in ip else IPV4_BITS
+    try:
+        net = ip_to_int(ip, bits)
+        prefixlen = int(prefixlen) if prefixlen else bits
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"invalid network: {text!r}") from exc
+    if not 0 <= prefixlen <= bits:
+        raise ValueError(f"invalid prefix length: {text!r}")
+    return bits, net & prefix_masks(bits)[prefixlen], prefixlen
+
+
+def merge_intervals(intervals: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Merge overlapping and adjacent ``[first, last]`` intervals, the
+    ``intervals`` have to be sorted."""
+    return list(iter_merged_intervals(intervals))
+
+
+def iter_merged_intervals(
+    intervals: Iterable[tuple[int, int]],
+) -> Iterator[tuple[int, int]]:
+    """Like :py:obj:`merge_intervals` but the merged intervals are yielded in
+    one sweep over the (sorted) ``intervals``, e.g. over a :py:obj:`heapq.merge`
+    of sorted runs that don't fit in memory."""
+    intervals = iter(intervals)
+    first, last = next(intervals, (None, None))
+    if first is None:
+        return
+    for start, end in intervals:
+        if start > last + 1:
+            yield first, last
+            first, last = start, end
+        elif end > last:
+            last = end
+    yield first, last
+
+
+def intersect_intervals(
+    a: Iterable[tuple[int, int]], b: Iterable[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    """Intersection of two sorted lists of merged intervals."""
+    result = []
+    a, b = iter(a), iter(b)
+    x, y = next(a, None), next(b, None)
+    while x and y:
+        first = x[0] if x[0] > y[0] else y[0]
+        last = x[1] if x[1] < y[1] else y[1]
+        if first <= last:
+            result.append((first, last))
+        if x[1] < y[1]:
+            x = next(a, None)
+        else:
+            y = next(b, None)
+    return result
+
+
+def subtract_intervals(
+    a: Iterable[tuple[int, int]], b: Iterable[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    """Difference ``a - b`` of two sorted lists of merged intervals."""
+    result = []
+    b = list(b)
+    j = 0
+    for first, last in a:
+        while j < len(b) and b[j][1] < first:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= last:
+            if b[k][0] > first:
+                result.append((first, b[k][0] - 1))
+            first = b[k][1] + 1
+            if first > last:
+                break
+            k += 1
+        if first <= last:
+            result.append((first, last))
+    return result
+
+
+def diff_networks(
+    old: Iterable[tuple[int, int]], new: Iterable[tuple[int, int]]
+) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    """Compare two sorted lists of merged ``(network, prefixlen)`` pairs (e.g.
+    from :py:obj:`CidrSet.networks`) in one sweep, returns the networks
+    ``(removed, added)``.  A network that is in one list but not (with the same
+    prefix length) in the other list is removed or added.
+
+    To update a firewall set that contains the ``old`` networks, the
+    ``removed`` networks are deleted from the set and the ``added`` networks
+    are added to the set.  The networks are compared (not the address ranges),
+    a network replaced by a larger network is removed and the larger network
+    is added: the changes are not minimal but the elements of the set are
+    always the ``new`` networks.
+    """
+    removed, added = [], []
+    old, new = iter(old), iter(new)
+    x, y = next(old, None), next(new, None)
+    while x and y:
+        if x == y:
+            x, y = next(old, None), next(new, None)
+        elif x < y:
+            removed.append(x)
+            x = next(old, None)
+        else:
+            added.append(y)
+            y = next(new, None)
+    if x:
+        removed.append(x)
+        removed.extend(old)
+    if y:
+        added.append(y)
+        added.extend(new)
+    return removed, added
+
+
+class U128Array:
+    """Array of unsigned 128 bit integers, each item is stored in two 64 bit
+    words (high, low) of an :py:obj:`array.array` (or of a read-only
+    :py:obj:`memoryview` of an index file, see :py:obj:`CidrSet.load_index`)."""
+
+    __slots__ = ("words",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self.words = array("Q")
+        self.extend(values)
+
+    def extend(self, values: Iterable[int]):
+        """Append the integers from ``values``."""
+        words = self.words
+        if isinstance(values, U128Array):
+            words.extend(values.words)
+            return
+        for value in values:
+            words.append(value >> 64)
+            words.append(value & 0xFFFFFFFFFFFFFFFF)
+
+    def append(self, value: int):
+        """Append integer ``value``."""
+        self.words.append(value >> 64)
+        self.words.append(value & 0xFFFFFFFFFFFFFFFF)
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, i: int | slice) -> int | U128Array:
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError("U128Array slice step is not supported")
+            items = U128Array()
+            items.words = self.words[2 * start : 2 * stop]
+            return items
+        return (self.words[2 * self._index(i)] << 64) | self.words[
+            2 * self._index(i) + 1
+        ]
+
+    def __setitem__(self, i: int, value: int):
+        i = self._index(i)
+        self.words[2 * i] = value >> 64
+        self.words[2 * i + 1] = value & 0xFFFFFFFFFFFFFFFF
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("U128Array index out of range")
+        return i
+
+    def __iter__(self) -> Iterator[int]:
+        words = iter(self.words)
+        return ((high << 64) | low for high, low in zip(words, words))
+
+    def __eq__(self, other):
+        return isinstance(other, U128Array) and self.words == other.words
+
+    def __hash__(self):
+        return hash(self.words.tobytes())
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the buffer in bytes."""
+        return self.words.itemsize * len(self.words)
+
+
+def _u32_typecode():
+    for typecode in "IL":
+        if array(typecode).itemsize == 4:
+            return typecode
+    raise RuntimeError("no array type for unsigned 32 bit integers")
+
+
+U32 = _u32_typecode()
+"""Typecode of the :py:obj:`array.array` used for IPv4 addresses."""
+
+
+def new_array(bits: int, values: Iterable[int] = ()) -> array | U128Array:
+    """New array of the addresses of an address family, :py:obj:`U32` items
+    for IPv4 and :py:obj:`U128Array` for IPv6."""
+    if bits == IPV4_BITS:
+        return array(U32, values)
+    return U128Array(values)
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = "w"):
+    """Context manager to write a file atomically: the content is written to a
+    temporary file in the same folder which replaces ``path`` when the context
+    is left without an exception."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    encoding = None if "b" in mode else "utf-8"
+    with tempfile.NamedTemporaryFile(
+        mode, dir=dirname, prefix=".tmp-", encoding=encoding, delete=False
+    ) as f:
+        try:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+INDEX_MAGIC = b"PYSBCIDR"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sH6xQQ")
+"""Header of a CIDR index file: magic, version, number of IPv4 intervals and
+number of IPv6 intervals (see :py:obj:`CidrSet.save_index`)."""
+
+
+class CidrIndexError(Exception):
+    """Exception when a CIDR index file can't be read."""
+
+
+def _mapped_array(bits: int, buf: mmap.mmap, offset: int, size: int):
+    # array of the addresses at offset of the (little endian) index file buf, a
+    # read-only memoryview of the file or a copy on a big endian machine
+    view = memoryview(buf)[offset : offset + size]
+    words_type = U32 if bits == IPV4_BITS else "Q"
+    if sys.byteorder == "little":
+        words = view.cast(words_type)
+    else:
+        words = array(words_type, view.tobytes())
+        words.byteswap()
+    if bits == IPV4_BITS:
+        return words
+    values = U128Array()
+    values.words = words
+    return values
+
+
+class CidrSet:
+    """A set of IPv4 and IPv6 networks.
+
+    The networks are merged and stored as sorted ``[first, last]`` intervals
+    of integers, the first and last addresses are stored in compact arrays
+    (:py:obj:`array.array` for IPv4, :py:obj:`U128Array` for IPv6).  Compared to
+    a list of :py:obj:`netaddr.IPNetwork` objects, this needs only a fraction
+    of the memory:
+
+    .. code:: python
+
+       >>> s = CidrSet(["10.0.0.0/24", "10.0.1.0/24", "2001:db8::/32"])
+       >>> list(s)
+       ['10.0.0.0/23', '2001:db8::/32']
+       >>> "10.0.1.17" in s, "10.0.2.0/30" in s
+       (True, False)
+       >>> list(s - CidrSet(["10.0.0.128/25"]))
+       ['10.0.0.0/25', '10.0.1.0/24', '2001:db8::/32']
+
+    Building a set from strings is dominated by parsing them, 150 000 networks
+    take about 0.3 sec.  :py:obj:`from_networks` builds the set from integer
+    ``(network, prefixlen)`` pairs (e.g. from :py:obj:`collect_networks
+    <.networks.collect_networks>`) in about half of the time.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        pairs = {IPV4_BITS: [], IPV6_BITS: []}
+        for text in networks:
+            bits, net, prefixlen = str_to_network(text)
+            pairs[bits].append((net, prefixlen))
+        self._intervals = {}
+        for bits, items in pairs.items():
+            self._set_networks(bits, items)
+
+    @classmethod
+    def from_networks(
+        cls, ipv4: Iterable[tuple[int, int]] = (), ipv6: Iterable[tuple[int, int]] = ()
+    ) -> CidrSet:
+        """Create set from integer ``(network, prefixlen)`` pairs (host bits
+        must be masked out), e.g. from :py:obj:`collect_networks`."""
+        obj = cls()
+        obj._set_networks(IPV4_BITS, ipv4)
+        obj._set_networks(IPV6_BITS, ipv6)
+        return obj
+
+    @classmethod
+    def from_intervals(
+        cls, ipv4: Iterable[tuple[int, int]] = (), ipv6: Iterable[tuple[int, int]] = ()
+    ) -> CidrSet:
+        """Create set from sorted and merged ``[first, last]`` intervals."""
+        obj = cls()
+        obj._set_intervals(IPV4_BITS, ipv4)
+        obj._set_intervals(IPV6_BITS, ipv6)
+        return obj
+
+    @classmethod
+    def load(cls, stream: IO) -> CidrSet:
+        """Load set from a stream with one IP or network per line (e.g. a
+        ``.lst`` file), empty lines and comments (``#``) are ignored."""
+        lines = (line.split("#", 1)[0] for line in stream)
+        return cls(line for line in lines if line.strip())
+
+    def _set_networks(self, bits: int, networks: Iterable[tuple[int, int]]):
+        # merge_intervals needs the intervals sorted by their first address
+        # only, sorting by an integer key is faster than comparing the tuples
+        size = 1 << bits
+        intervals = [
+            (net, net + (size >> prefixlen) - 1) for net, prefixlen in networks
+        ]
+        intervals.sort(key=operator.itemgetter(0))
+        self._set_intervals(bits, merge_intervals(intervals))
+
+    def _set_intervals(self, bits: int, intervals: Iterable[tuple[int, int]]):
+        intervals = list(intervals)
+        first = new_array(bits, [start for start, _ in intervals])
+        last = new_array(bits, [end for _, end in intervals])
+        self._intervals[bits] = (first, last)
+
+    def intervals(self, bits: int) -> Iterator[tuple[int, int]]:
+        """Iterate over the sorted ``[first, last]`` intervals of the IPv4
+        (``bits=32``) or IPv6 (``bits=128``) networks."""
+        first, last = self._intervals[bits]
+        return zip(first, last)
+
+    def networks(self, bits: int) -> Iterator[tuple[int, int]]:
+        """Iterate over the (merged) IPv4 or IPv6 networks as integer
+        ``(network, prefixlen)`` pairs."""
+        for first, last in self.intervals(bits):
+            yield from range_to_cidrs(first, last, bits)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the merged networks (CIDR strings), IPv4 networks
+        first."""
+        for bits in (IPV4_BITS, IPV6_BITS):
+            for net, prefixlen in self.networks(bits):
+                yield f"{int_to_ip(net, bits)}/{prefixlen}"
+
+    def __contains__(self, item: str) -> bool:
+        """Test whether an IP address or network (string) is in the set."""
+        bits, net, prefixlen = str_to_network(item)
+        return self.contains(bits, net, net + (1 << (bits - prefixlen)) - 1)
+
+    def contains(self, bits: int, first: int, last: int | None = None) -> bool:
+        """Test whether the address range ``[first, last]`` is in the set."""
+        starts, ends = self._intervals[bits]
+        i = bisect.bisect_right(starts, first) - 1
+        return i >= 0 and ends[i] >= (first if last is None else last)
+
+    def __bool__(self):
+        return any(len(first) for first, _ in self._intervals.values())
+
+    def __eq__(self, other):
+        return isinstance(other, CidrSet) and self._intervals == other._intervals
+
+    __hash__ = None
+
+    def _combine(self, other: CidrSet, func) -> CidrSet:
+        if not isinstance(other, CidrSet):
+            return NotImplemented
+        return CidrSet.from_intervals(
+            *[
+                func(self.intervals(bits), other.intervals(bits))
+                for bits in (IPV4_BITS, IPV6_BITS)
+            ]
+        )
+
+    def __or__(self, other: CidrSet) -> CidrSet:
+        return self._combine(other, lambda a, b: merge_intervals(heapq.merge(a, b)))
+
+    def __and__(self, other: CidrSet) -> CidrSet:
+        return self._combine(other, intersect_intervals)
+
+    def __sub__(self, other: CidrSet) -> CidrSet:
+        return self._combine(other, subtract_intervals)
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def update(self, other: CidrSet):
+        """Add the networks of ``other`` to this set (in place).
+
+        Only the intervals of ``other`` are processed one by one (binary search
+        in this set), the unchanged ranges of this set are copied as a whole.
+        The Python work depends on the size of ``other``, the (block) copies of
+        the arrays still grow with the size of this set.
+        """
+        for bits in (IPV4_BITS, IPV6_BITS):
+            new = list(other.intervals(bits))
+            if not new:
+                continue
+            firsts, lasts = self._intervals[bits]
+            out_firsts, out_lasts = new_array(bits), new_array(bits)
+            prev = 0
+            for start, end in new:
+                i = bisect.bisect_left(lasts, start - 1, prev)
+                j = bisect.bisect_right(firsts, end + 1, i)
+                out_firsts.extend(firsts[prev:i])
+                out_lasts.extend(lasts[prev:i])
+                if i < j:
+                    start, end = min(start, firsts[i]), max(end, lasts[j - 1])
+                if out_lasts and out_lasts[-1] + 1 >= start:
+                    out_lasts[-1] = max(out_lasts[-1], end)
+                else:
+                    out_firsts.append(start)
+                    out_lasts.append(end)
+                prev = j
+            out_firsts.extend(firsts[prev:])
+            out_lasts.extend(lasts[prev:])
+            self._intervals[bits] = (out_firsts, out_lasts)
+
+    @classmethod
+    def load_index(cls, path: str) -> CidrSet:
+        """Load set from a binary index file (see :py:obj:`save_index`).
+
+        The file is memory mapped and the intervals are used in place (on a
+        little endian machine), a lookup (:py:obj:`contains`) reads only the
+        pages of its binary search.  The file stays mapped as long as the set
+        (or a set that shares its unchanged intervals) is alive.
+        """
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:  # empty file
+                raise CidrIndexError(f"{path}: not a CIDR index") from exc
+        try:
+            counts = cls._index_counts(path, buf)
+        except CidrIndexError:
+            buf.close()
+            raise
+        obj = cls()
+        offset = INDEX_HEADER.size
+        for bits, count in zip((IPV4_BITS, IPV6_BITS), counts):
+            size = count * bits // 8
+            first = _mapped_array(bits, buf, offset, size)
+            last = _mapped_array(bits, buf, offset + size, size)
+            obj._intervals[bits] = (first, last)
+            offset += 2 * size
+        return obj
+
+    @staticmethod
+    def _index_counts(path: str, buf: mmap.mmap) -> tuple[int, int]:
+        if len(buf) < INDEX_HEADER.size:
+            raise CidrIndexError(f"{path}: not a CIDR index")
+        magic, version, count_ipv4, count_ipv6 = INDEX_HEADER.unpack_from(buf)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise CidrIndexError(f"{path}: not a CIDR index (version {INDEX_VERSION})")
+        if len(buf) != INDEX_HEADER.size + 2 * (4 * count_ipv4 + 16 * count_ipv6):
+            raise CidrIndexError(f"{path}: CIDR index is truncated")
+        return count_ipv4, count_ipv6
+
+    def save_index(self, path: str):
+        """Save set to a binary index file, the file is replaced atomically.
+
+        The index file starts with a header (:py:obj:`INDEX_HEADER`) followed
+        by the sorted first and last addresses of the IPv4 intervals (32 bit
+        words) and of the IPv6 intervals (two 64 bit words: high, low).  All
+        values are little endian, the arrays can be used directly from a
+        memory mapped file.
+        """
+        count_ipv4, count_ipv6 = (
+            len(self._intervals[bits][0]) for bits in (IPV4_BITS, IPV6_BITS)
+        )
+        header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, count_ipv4, count_ipv6)
+        with atomic_write(path, "wb") as f:
+            f.write(header)
+            for bits in (IPV4_BITS, IPV6_BITS):
+                for arr in self._intervals[bits]:
+                    words = arr.words if bits == IPV6_BITS else arr
+                    if sys.byteorder == "big":
+                        words = array(words.typecode, words)
+                        words.byteswap()
+                    f.write(words)
+
+    def save(self, path: str):
+        """Save set to a text file (one CIDR per line, see :py:obj:`__iter__`),
+        the file is replaced atomically."""
+        with atomic_write(path, "w") as f:
+            for net in self:
+                f.write(f"{net}\n")
+
+    @property
+    def nbytes(self) -> int:
+        """Memory size (bytes) of the interval buffers."""
+        size = 0
+        for first, last in self._intervals.values():
+            for buf in (first, last):
+                size += (
+                    buf.nbytes
+                    if isinstance(buf, U128Array)
+                    else buf.itemsize * len(buf)
+                )
+        return size
+
+    def __repr__(self):
+        count = ", ".join(
+            f"IPv{4 if bits == IPV4_BITS else 6}: {len(first)}"
+            for bits, (first, _) in self._intervals.items()
+        )
+        return f"<CidrSet intervals {count}>"
@@ -0,0 +1,230 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Read compressed (e.g. rotated) log files as streams of decompressed lines"""
+
+from __future__ import annotations
+from typing import IO
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import sys
+import threading
+
+import click
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .networks import BLOCK_SIZE
+
+COMPRESSIONS: dict[str, bytes] = {
+    "gzip": b"\x1f\x8b",
+    "xz": b"\xfd7zXZ\x00",
+    "bzip2": b"BZh",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+"""Magic numbers of the compression formats, the format of a file is detected
+by its first bytes (not by the file name)."""
+
+MAGIC_SIZE = max(len(magic) for magic in COMPRESSIONS.values())
+
+READ_AHEAD = 4
+"""Number of decompressed blocks (of :py:obj:`BLOCK_SIZE
+<.networks.BLOCK_SIZE>`) the background thread of a :py:obj:`DecompressReader`
+reads ahead."""
+
+
+def compression(head: bytes) -> str | None:
+    """Name of the compression format (see :py:obj:`COMPRESSIONS`) of the data
+    that starts with ``head`` or ``None`` if the data is not compressed."""
+    for name, magic in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_decompressed(
+    source: str | IO,
+    fmt: str,
+    encoding: str | None = None,
+    errors: str | None = "strict",
+    threaded: bool | None = None,
+) -> IO:
+    """Text stream of the decompressed data from ``source``.  With
+    ``threaded`` the data is decompressed in a background thread
+    (:py:obj:`DecompressReader`), the decompressors of the standard library
+    release the GIL, decompression overlaps with the parsing of the lines.  On
+    a single CPU the thread only adds overhead, by default (``None``) the data
+    is decompressed in a thread if there is more than one CPU.
+
+    The returned stream has no file name (like a pipe), the functions that
+    memory map or split regular files read it block by block.
+
+    :param source: name of a compressed file or a binary stream with compressed
+      data (a stream is not closed by closing the returned stream)
+    :param fmt: compression format, one of :py:obj:`COMPRESSIONS`
+    :param encoding, errors: see :py:obj:`io.TextIOWrapper`
+    :param threaded: decompress in a background thread
+    """
+    if fmt == "gzip":
+        reader = gzip.open(source, "rb")
+    elif fmt == "xz":
+        reader = lzma.open(source, "rb")
+    elif fmt == "bzip2":
+        reader = bz2.open(source, "rb")
+    elif fmt == "zstd":
+        if zstandard is None:
+            raise ValueError(
+                "zstd compressed input needs the zstandard package (pip install zstandard)"
+            )
+        closefd = isinstance(source, str)
+        # pylint: disable-next=consider-using-with
+        stream = open(source, "rb") if closefd else source
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            stream, read_across_frames=True, closefd=closefd
+        )
+    else:
+        raise ValueError(f"unknown compression format: {fmt!r}")
+    if threaded is None:
+        threaded = (os.cpu_count() or 1) > 1
+    return io.TextIOWrapper(
+        io.BufferedReader(DecompressReader(reader, threaded=threaded)),
+        encoding=encoding,
+        errors=errors,
+    )
+
+
+class DecompressReader(io.RawIOBase):
+    """Read the binary ``stream`` of a decompressor in blocks, a truncated input
+    raises an :py:obj:`OSError` (not an :py:obj:`EOFError`).  ``stream`` is
+    closed when the reader is closed.
+
+    With ``threaded`` the blocks are read in a background thread, the thread
+    reads up to :py:obj:`READ_AHEAD` blocks ahead (the memory is bounded).
+    Errors of the thread are raised by the next read.
+
+    :param stream: binary stream, e.g. a decompressor
+    :param size: size of the blocks
+    :param threaded: read in a background thread
+    """
+
+    def __init__(self, stream: IO, size: int = BLOCK_SIZE, threaded: bool = True):
+        super().__init__()
+        self._stream = stream
+        self._size = size
+        self._block = memoryview(b"")
+        self._eof = False
+        self._queue: queue.Queue | None = None
+        self._stop = threading.Event()
+        if threaded:
+            self._queue = queue.Queue(maxsize=READ_AHEAD)
+            threading.Thread(target=self._read_ahead, daemon=True).start()
+
+    def _read_ahead(self):
+        try:
+            with self._stream:
+                while not self._stop.is_set():
+                    block = self._stream.read(self._size)
+                    self._put(block)
+                    if not block:
+                        return
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._put(exc)
+
+    def _put(self, item: bytes | Exception):
+        # don't block forever when the reader has been closed
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _next_block(self) -> bytes:
+        if self._queue is None:
+            return self._stream.read(self._size)
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._block:
+            if self._eof:
+                return 0
+            try:
+                block = self._next_block()
+            except EOFError as exc:
+                self._eof = True
+                raise OSError(f"truncated compressed input: {exc}") from exc
+            except Exception:
+                self._eof = True
+                raise
+            if not block:
+                self._eof = True
+                return 0
+            self._block = memoryview(block)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        self._stop.set()
+        if self._queue is None:
+            self._stream.close()
+        super().close()
+
+
+class InputFile(click.File):
+    """Like ``click.File("r")`` but compressed files (see :py:obj:`COMPRESSIONS`)
+    are decompressed transparently (:py:obj:`open_decompressed`), also when
+    they are read from ``stdin`` (``-``)::
+
+      $ iplists ip-filter access.log access.log.1 access.log.2.gz botnet.lst
+      $ zcat -f access.log.*.gz | iplists ip-filter - botnet.lst   # same as ..
+      $ cat access.log.*.gz | iplists ip-filter - botnet.lst
+    """
+
+    name = "input file"
+
+    def __init__(self, encoding: str | None = None, errors: str | None = "strict"):
+        super().__init__("r", encoding=encoding, errors=errors)
+
+    def convert(self, value, param, ctx):
+        if hasattr(value, "read"):
+            return super().convert(value, param, ctx)
+        name = click.format_filename(value)
+        try:
+            # pylint: disable-next=consider-using-with
+            raw = sys.stdin.buffer if value == "-" else open(value, "rb")
+        except OSError as exc:
+            self.fail(f"'{name}': {exc.strerror}", param, ctx)
+        fmt = (
+            compression(raw.peek(MAGIC_SIZE)[:MAGIC_SIZE])
+            if hasattr(raw, "peek")
+            else None
+        )
+        if raw is not sys.stdin.buffer:
+            raw.close()
+        if fmt is None:
+            return super().convert(value, param, ctx)
+        try:
+            stream = open_decompressed(
+                sys.stdin.buffer if value == "-" else value,
+                fmt,
+                self.encoding,
+                self.errors,
+            )
+        except (OSError, ValueError) as exc:
+            self.fail(f"'{name}': {exc}", param, ctx)
+        if ctx is not None:
+            ctx.call_on_close(stream.close)
+        return stream
@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Merge networks from inputs larger than the memory (external merge)"""
+
+from __future__ import annotations
+from typing import IO, Iterator
+from array import array
+import heapq
+import itertools
+import os
+import re
+import tempfile
+
+from .networks import (
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    add_networks,
+    iter_found,
+    iter_found_buffer,
+    iter_windows,
+    new_networks,
+    range_to_cidrs,
+)
+from .cidrset import U32, iter_merged_intervals, new_array
+
+NETWORK_SIZE = 128
+"""Estimated memory (bytes) of one ``(network, prefixlen)`` pair in a
+:py:obj:`set`, used to translate a memory budget into a number of networks."""
+
+RUN_BATCH = 64 * 1024
+"""Number of intervals read at once from a run file."""
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(text: str) -> int:
+    """Parse a size in bytes with an optional unit ``K``, ``M``, ``G`` or ``T``
+    (e.g. ``512M``).  Raises :py:obj:`ValueError` if ``text`` is not a valid
+    size."""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)i?B?\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+class ExternalMerge:
+    """Merge ``(network, prefixlen)`` pairs with a bounded memory usage.
+
+    The networks are collected in a set for each address family, when the sets
+    reach the memory ``budget`` the networks are merged into sorted ``[first,
+    last]`` intervals and this *run* is written to a temporary file.
+    :py:obj:`merged` does a k-way streaming merge of the runs of an address
+    family, the result is the same as the one from :py:obj:`merge_networks
+    <.networks.merge_networks>`.
+
+    usage::
+
+        with ExternalMerge(512 * 1024**2) as ext:
+            for stream in streams:
+                ext.collect(opts, stream)
+            for net, prefixlen in ext.merged(IPV4_BITS):
+                ...
+
+    :param budget: memory budget (bytes) for the networks held in memory
+    :param tmpdir: folder for the temporary files, see :py:obj:`tempfile.mkdtemp`
+    """
+
+    def __init__(self, budget: int, tmpdir: str | None = None):
+        self.max_networks = max(1, budget // NETWORK_SIZE)
+        self.networks: dict[int, set[tuple[int, int]]] = new_networks()
+        self.runs: dict[int, list[str]] = {IPV4_BITS: [], IPV6_BITS: []}
+        # pylint: disable-next=consider-using-with
+        self._tmp = tempfile.TemporaryDirectory(prefix="pysandbox-merge-", dir=tmpdir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Remove the temporary files of the runs."""
+        self.runs = {IPV4_BITS: [], IPV6_BITS: []}
+        self._tmp.cleanup()
+
+    def collect(self, opts: IPListOptions, stream: IO, use_mmap: bool = False):
+        """Collect the networks from ``stream`` (like :py:obj:`collect_networks
+        <.networks.collect_networks>`), the budget is checked after each block
+        of lines.
+
+        :param opts: :py:obj:`IPListOptions` container with filter options
+        :param stream: A stream with IP adresses in.  For example, a server log.
+        :param use_mmap: scan the windows of :py:obj:`iter_windows
+          <.networks.iter_windows>` instead of the text lines
+        """
+        if use_mmap:
+            blocks = (
+                (found, not opts.extractor)
+                for buf, start, stop in iter_windows(stream)
+                for found in iter_found_buffer(opts, buf, start, stop)
+            )
+        else:
+            blocks = ((found, False) for found in iter_found(opts, stream))
+        for found, binary in blocks:
+            add_networks(opts, self.networks, [found], binary)
+            if (
+                len(self.networks[IPV4_BITS]) + len(self.networks[IPV6_BITS])
+                >= self.max_networks
+            ):
+                self.spill()
+
+    def spill(self):
+        """Write the networks in memory as sorted runs of merged intervals (one
+        run for each address family) to temporary files."""
+        for bits, networks in self.networks.items():
+            if not networks:
+                continue
+            name = os.path.join(
+                self._tmp.name,
+                f"run-v{4 if bits == IPV4_BITS else 6}-{len(self.runs[bits]):05d}",
+            )
+            values = new_array(
+                bits, itertools.chain.from_iterable(self._intervals(bits))
+            )
+            with open(name, "wb") as f:
+                getattr(values, "words", values).tofile(f)
+            self.runs[bits].append(name)
+            networks.clear()
+
+    def _intervals(self, bits: int) -> Iterator[tuple[int, int]]:
+        networks = sorted(self.networks[bits])
+        return iter_merged_intervals(
+            (net, net + (1 << (bits - prefixlen)) - 1) for net, prefixlen in networks
+        )
+
+    def merged(self, bits: int = IPV4_BITS) -> Iterator[tuple[int, int]]:
+        """Iterate over the merged (sorted) list of CIDR networks of all runs
+        and the networks in memory of an address family.
+
+        :param bits: size of the address space (32 for IPv4, 128 for IPv6)
+        """
+        sources = [_read_run(name, bits) for name in self.runs[bits]]
+        sources.append(self._intervals(bits))
+        for first, last in iter_merged_intervals(heapq.merge(*sources)):
+            yield from range_to_cidrs(first, last, bits)
+
+
+def _read_run(name: str, bits: int) -> Iterator[tuple[int, int]]:
+    words = 2 if bits == IPV4_BITS else 4  # words of an interval
+    with open(name, "rb") as f:
+        while True:
+            batch = array(U32 if bits == IPV4_BITS else "Q")
+            try:
+                batch.fromfile(f, RUN_BATCH * words)
+            except EOFError:
+                pass
+            if not batch:
+                return
+            if bits == IPV4_BITS:
+                values = iter(batch)
+            else:
+                values = new_array(bits)
+                values.words = batch
+                values = iter(values)
+            yield from zip(values, values)
@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Follow growing log files (or pipes) and keep a merged list of networks up
+to date"""
+
+# pylint: disable = too-many-arguments, too-many-positional-arguments
+
+from __future__ import annotations
+from typing import IO, Iterable, Iterator
+import os
+import select
+import time
+
+from .networks import (
+    BLOCK_SIZE,
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    collect_networks_buffer,
+    iter_blocks,
+)
+from .cidrset import CidrSet
+
+FOLLOW_POLL = 0.5
+"""Seconds to wait for new data before the stream is checked again."""
+
+
+def follow_networks(
+    opts: IPListOptions,
+    stream: IO,
+    path: str,
+    interval: float = 10,
+    every: int = 1000,
+    cidrs: CidrSet | None = None,
+) -> CidrSet:
+    """Follow ``stream`` (a growing file or a pipe, see :py:obj:`iter_follow`)
+    and collect the networks into ``cidrs``.  Only networks which are not
+    already in ``cidrs`` are merged into the set (:py:obj:`CidrSet.update`),
+    the lines are processed only once.
+
+    The (text) list in ``path`` is replaced atomically (:py:obj:`CidrSet.save`)
+    when there are new networks and ``interval`` seconds have elapsed since
+    the last update or when there are ``every`` new networks.  Following ends
+    when a pipe is closed or with a :py:obj:`KeyboardInterrupt`, the list is
+    saved a last time.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param stream: stream to follow
+    :param path: name of the file with the list of networks
+    :param interval: update interval in seconds
+    :param every: update after this number of new networks
+    :param cidrs: set of known networks (optional)
+    """
+
+    cidrs = CidrSet() if cidrs is None else cidrs
+    new = 0
+    last_save = time.monotonic()
+    rest = b""
+
+    try:
+        for data in iter_follow(stream):
+            if data:
+                data = rest + data
+                pos = data.rfind(b"\n") + 1
+                rest = data[pos:]
+                new += add_new_networks(
+                    cidrs, collect_networks_buffer(opts, data, end=pos)
+                )
+            if new and (new >= every or time.monotonic() - last_save >= interval):
+                cidrs.save(path)
+                new, last_save = 0, time.monotonic()
+    except KeyboardInterrupt:
+        pass
+
+    if rest:
+        add_new_networks(cidrs, collect_networks_buffer(opts, rest))
+    cidrs.save(path)
+    return cidrs
+
+
+def add_new_networks(
+    cidrs: CidrSet, networks: dict[int, Iterable[tuple[int, int]]]
+) -> int:
+    """Add the ``(network, prefixlen)`` pairs (``{bits: networks}``) which are
+    not already contained in ``cidrs``, returns the number of added networks."""
+    new = {
+        bits: [
+            (net, prefixlen)
+            for net, prefixlen in items
+            if not cidrs.contains(bits, net, net + (1 << (bits - prefixlen)) - 1)
+        ]
+        for bits, items in networks.items()
+    }
+    count = len(new[IPV4_BITS]) + len(new[IPV6_BITS])
+    if count:
+        cidrs.update(CidrSet.from_networks(ipv4=new[IPV4_BITS], ipv6=new[IPV6_BITS]))
+    return count
+
+
+def iter_follow(stream: IO, poll: float = FOLLOW_POLL) -> Iterator[bytes]:
+    """Read ``stream`` and wait for new data when the end is reached (like
+    ``tail -f``), yields blocks of bytes and ``b""`` when there is no new data
+    for ``poll`` seconds.
+
+    A regular file is followed by its name: if the file is truncated it is read
+    again from the beginning, if the file is rotated (a new file with the same
+    name) the rest of the old file is read before the new file is opened.  A
+    pipe is read until it is closed, a stream without a file descriptor (e.g. a
+    decompressed file) is read to the end.
+    """
+    name = getattr(stream, "name", "")
+    if os.path.isfile(name):
+        yield from _follow_file(name, poll)
+        return
+    try:
+        stream.fileno()
+    except (OSError, ValueError):
+        yield from iter_blocks(getattr(stream, "buffer", stream))
+        return
+    yield from _follow_pipe(stream, poll)
+
+
+def _follow_file(name: str, poll: float) -> Iterator[bytes]:
+    f = open(name, "rb")  # pylint: disable=consider-using-with
+    try:
+        while True:
+            data = f.read(BLOCK_SIZE)
+            if data:
+                yield data
+                continue
+            yield b""
+            time.sleep(poll)
+            try:
+                stat = os.stat(name)
+            except FileNotFoundError:
+                continue  # rotated, the new file does not yet exist
+            if stat.st_ino != os.fstat(f.fileno()).st_ino:
+                yield f.read() + b"\n"
+                f.close()
+                f = open(name, "rb")  # pylint: disable=consider-using-with
+            elif stat.st_size < f.tell():
+                f.seek(0)
+    finally:
+        f.close()
+
+
+def _follow_pipe(stream: IO, poll: float) -> Iterator[bytes]:
+    fd = stream.fileno()
+    data = _read_buffered(getattr(stream, "buffer", stream), fd)
+    if data:
+        yield data
+    while True:
+        ready, _, _ = select.select([fd], [], [], poll)
+        if not ready:
+            yield b""
+            continue
+        data = os.read(fd, BLOCK_SIZE)
+        if not data:
+            return
+        yield data
+
+
+def _read_buffered(buffer: IO, fd: int) -> bytes:
+    # Bytes that have already been read into the buffer of the stream (e.g. by
+    # the peek at the magic number of InputFile) are not seen by select() and
+    # os.read() on the file descriptor.  In non-blocking mode read1() returns
+    # the buffered bytes without waiting for new data.
+    if not hasattr(buffer, "read1"):
+        return b""
+    blocking = os.get_blocking(fd)
+    os.set_blocking(fd, False)
+    try:
+        return buffer.read1(BLOCK_SIZE) or b""
+    except BlockingIOError:
+        return b""
+    finally:
+        os.set_blocking(fd, blocking)
@@ -0,0 +1,206 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Write lists of networks in the formats of firewall tools (ipset, nftables)
+and in a packed binary format"""
+
+from __future__ import annotations
+from typing import IO, Iterable
+import struct
+
+from .networks import IPV4_BITS, int_to_ip
+
+FORMATS = ("text", "ipset", "nft", "binary")
+"""Names of the output formats, see :py:obj:`write_networks`."""
+
+DIFF_FORMATS = ("text", "ipset", "nft")
+"""Names of the output formats of changes, see :py:obj:`write_diff`."""
+
+NFT_TABLE = "inet filter"
+"""Default nftables table (``family name``) of the sets."""
+
+IPSET_MAXELEM = 65536
+"""Minimal ``maxelem`` of an ipset, larger lists set ``maxelem`` to their
+length (if known in advance) or to ``16 * IPSET_MAXELEM``."""
+
+_PREFIXLEN = struct.Struct("<I")
+
+
+def write_networks(
+    output: IO,
+    networks: dict[int, Iterable[tuple[int, int]]],
+    fmt: str = "text",
+    name: str = "pysandbox",
+    table: str = NFT_TABLE,
+) -> int:
+    """Write the ``(network, prefixlen)`` pairs of each address family to
+    ``output``, returns the number of networks written.  The networks are
+    written as they come, a generator (e.g. from a merge) is not read into
+    memory.
+
+    ``text``:
+      One ``ip/prefixlen`` per line.
+
+    ``ipset``:
+      Commands for ``ipset restore`` (one bulk load), a ``hash:net`` set for
+      each address family is created (or flushed) and filled::
+
+        $ ipset restore < botnet.ipset
+
+    ``nft``:
+      A nftables script for ``nft -f`` (one transaction), a set with the
+      ``interval`` flag for each address family is created (or flushed) in
+      ``table`` and filled with a single ``add element`` block::
+
+        $ nft -f botnet.nft
+
+    ``binary``:
+      Packed records of the prefix length (32 bit, little endian) followed by
+      the network address (4 or 16 bytes, network byte order).  A record is the
+      key of a ``BPF_MAP_TYPE_LPM_TRIE`` map (``struct bpf_lpm_trie_key``) and
+      the records of a file can be loaded by one batch update.  IPv4 and IPv6
+      records differ in size and the file has no header, ``networks`` must
+      contain only one address family (:py:obj:`ValueError`).
+
+    The name of the set of an address family is ``name`` with the suffix
+    ``_v4`` or ``_v6``.
+
+    :param output: text stream (``binary``: binary stream or a text stream with
+      a ``buffer``)
+    :param networks: ``{bits: networks}`` the sorted ``(network, prefixlen)``
+      pairs of an address family (``bits`` is 32 for IPv4 and 128 for IPv6)
+    :param fmt: output format, one of :py:obj:`FORMATS`
+    :param name: name of the ipset / nftables set
+    :param table: nftables table of the set
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt!r}")
+    if fmt == "binary" and len(networks) > 1:
+        raise ValueError(
+            "binary format: a file holds the networks of only one address family"
+        )
+    count = 0
+    for bits, items in networks.items():
+        set_name = f"{name}_v{4 if bits == IPV4_BITS else 6}"
+        if fmt == "text":
+            count += _write_text(output, bits, items)
+        elif fmt == "ipset":
+            count += _write_ipset(output, bits, items, set_name)
+        elif fmt == "nft":
+            count += _write_nft(output, bits, items, set_name, table)
+        else:
+            count += _write_binary(getattr(output, "buffer", output), bits, items)
+    return count
+
+
+def write_diff(
+    output: IO,
+    diffs: dict[int, tuple[list[tuple[int, int]], list[tuple[int, int]]]],
+    fmt: str = "text",
+    name: str = "pysandbox",
+    table: str = NFT_TABLE,
+) -> int:
+    """Write the changes of a list of networks (see :py:obj:`diff_networks
+    <.cidrset.diff_networks>`) as an update script for the set that contains
+    the old list, returns the number of changes.  The removed networks are
+    deleted before the added networks are added (a nftables interval set does
+    not accept overlapping elements).
+
+    ``text``:
+      ``-ip/prefixlen`` for a removed and ``+ip/prefixlen`` for an added network.
+
+    ``ipset``:
+      ``del`` and ``add`` commands for ``ipset restore``.
+
+    ``nft``:
+      One ``delete element`` and one ``add element`` block for ``nft -f``.
+
+    :param diffs: ``{bits: (removed, added)}`` the changes of an address family
+    :param fmt: output format, one of :py:obj:`DIFF_FORMATS`
+    :param name: name of the ipset / nftables set (suffix ``_v4`` or ``_v6``)
+    :param table: nftables table of the set
+    """
+    if fmt not in DIFF_FORMATS:
+        raise ValueError(f"unknown diff format: {fmt!r}")
+    count = 0
+    for bits, (removed, added) in diffs.items():
+        set_name = f"{name}_v{4 if bits == IPV4_BITS else 6}"
+        for op, networks in (("delete", removed), ("add", added)):
+            cidrs = [
+                f"{int_to_ip(net, bits)}/{prefixlen}" for net, prefixlen in networks
+            ]
+            if not cidrs:
+                continue
+            if fmt == "text":
+                sign = "-" if op == "delete" else "+"
+                output.writelines(f"{sign}{cidr}\n" for cidr in cidrs)
+            elif fmt == "ipset":
+                output.writelines(
+                    f"{op[:3]} {set_name} {cidr} -exist\n" for cidr in cidrs
+                )
+            else:
+                elements = ",\n    ".join(cidrs)
+                output.write(
+                    f"{op} element {table} {set_name} {{\n    {elements}\n}}\n"
+                )
+            count += len(cidrs)
+    return count
+
+
+def _write_text(output: IO, bits: int, networks: Iterable[tuple[int, int]]) -> int:
+    count = 0
+    for net, prefixlen in networks:
+        output.write(f"{int_to_ip(net, bits)}/{prefixlen}\n")
+        count += 1
+    return count
+
+
+def _write_ipset(
+    output: IO, bits: int, networks: Iterable[tuple[int, int]], set_name: str
+) -> int:
+    try:
+        maxelem = max(IPSET_MAXELEM, len(networks))
+    except TypeError:
+        maxelem = 16 * IPSET_MAXELEM
+    family = "inet" if bits == IPV4_BITS else "inet6"
+    output.write(
+        f"create {set_name} hash:net family {family} maxelem {maxelem} -exist\n"
+    )
+    output.write(f"flush {set_name}\n")
+    count = 0
+    for net, prefixlen in networks:
+        output.write(f"add {set_name} {int_to_ip(net, bits)}/{prefixlen}\n")
+        count += 1
+    return count
+
+
+def _write_nft(
+    output: IO,
+    bits: int,
+    networks: Iterable[tuple[int, int]],
+    set_name: str,
+    table: str,
+) -> int:
+    addr_type = "ipv4_addr" if bits == IPV4_BITS else "ipv6_addr"
+    output.write(f"add table {table}\n")
+    output.write(
+        f"add set {table} {set_name} {{ type {addr_type}; flags interval; }}\n"
+    )
+    output.write(f"flush set {table} {set_name}\n")
+    count = 0
+    for net, prefixlen in networks:
+        # an empty element block is a syntax error, open the block with the
+        # first element
+        output.write(f"add element {table} {set_name} {{\n" if not count else ",\n")
+        output.write(f"    {int_to_ip(net, bits)}/{prefixlen}")
+        count += 1
+    if count:
+        output.write("\n}\n")
+    return count
+
+
+def _write_binary(output: IO, bits: int, networks: Iterable[tuple[int, int]]) -> int:
+    pack, size = _PREFIXLEN.pack, bits // 8
+    count = 0
+    for net, prefixlen in networks:
+        output.write(pack(prefixlen) + net.to_bytes(size, "big"))
+        count += 1
+    return count
@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Extract IP adresses from the lines of known log formats"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Callable
+from dataclasses import dataclass
+import json
+
+if TYPE_CHECKING:
+    from .networks import IPListOptions
+
+
+@dataclass
+class LogFormat:
+    """A log format and its extractor, see :py:obj:`LOG_FORMATS`."""
+
+    extract: Callable[[IPListOptions, str], list[tuple[str, str]]]
+    """Function that returns the ``(ip, cidr)`` pairs of a line, ``cidr`` is the
+    CIDR suffix (e.g. ``/24``) or an empty string.  The IP adresses are not
+    validated by the extractor (done by the caller)."""
+
+    literal: str = ""
+    """Cheap prefilter: lines (and whole blocks of lines) that do not contain
+    this string are skipped before the extractor is called."""
+
+
+def _pairs(token: str, opts: IPListOptions) -> list[tuple[str, str]]:
+    ip, sep, prefixlen = token.strip("()[],;'\"").partition("/")
+    if not ip or (sep and not prefixlen.isdigit()):
+        return []
+    if "%" in ip and opts.ignore_zone_id:
+        return []
+    if ip[:7].lower() == "::ffff:" and "." in ip:
+        # IPv4-mapped address (dual-stack server), the client is an IPv4 client
+        if sep and int(prefixlen) < 96:
+            return []
+        ip, prefixlen = ip[7:], str(int(prefixlen) - 96) if sep else ""
+    return [(ip, sep + prefixlen)]
+
+
+def extract_access(opts: IPListOptions, line: str) -> list[tuple[str, str]]:
+    """Client address of an access log line, the address is the first field of
+    a nginx (or apache) log line::
+
+      192.0.2.17 - - [17/Oct/2024:05:47:58 +0000] "GET /search?q=foo HTTP/1.1" 200 ..
+
+    or the first field after the ``[pid: ..]`` prefix of an uWSGI log line::
+
+      [pid: 1234|app: 0|req: 5/17] 192.0.2.17 () {34 vars in 612 bytes} [Thu Oct 17 ..
+    """
+    if line.startswith("[pid:"):
+        line = line.partition("] ")[2]
+    return _pairs(line.partition(" ")[0], opts)
+
+
+def extract_journald(opts: IPListOptions, line: str) -> list[tuple[str, str]]:
+    """IP adresses in the ``MESSAGE`` field of a journal entry exported by
+    ``journalctl --output=json`` (one JSON object per line).  Only the message
+    is scanned by the regular expression, the other fields of the entry (IDs,
+    hostnames, ..) are ignored."""
+    try:
+        message = json.loads(line).get("MESSAGE")
+    except (ValueError, AttributeError):
+        return []
+    if isinstance(message, list):
+        # journald exports messages that are not valid UTF-8 as array of bytes
+        message = bytes(message).decode("utf-8", errors="replace")
+    if not isinstance(message, str):
+        return []
+    return opts.ipv4_pairs.findall(message) + opts.ipv6_pairs.findall(message)
+
+
+def extract_searxng(opts: IPListOptions, line: str) -> list[tuple[str, str]]:
+    """IP adresses and networks of a line from the SearXNG bot detection::
+
+      BLOCK: too many request from 192.0.2.0/24 in SUSPICIOUS_IP_WINDOW (redirect to /)
+
+    Only the words between ``BLOCK`` and ``SUSPICIOUS_IP_WINDOW`` that look like
+    an address (contain a ``.`` or ``:``) are taken.
+    """
+    start = line.find("BLOCK")
+    if start < 0:
+        return []
+    end = line.find("SUSPICIOUS_IP_WINDOW", start)
+    if end < 0:
+        return []
+    found = []
+    for token in line[start + 5 : end].lstrip(":").split():  # "BLOCK: .."
+        if "." in token or ":" in token:
+            found.extend(_pairs(token, opts))
+    return found
+
+
+LOG_FORMATS: dict[str, LogFormat] = {
+    "access": LogFormat(extract_access),
+    "journald": LogFormat(extract_journald, literal='"MESSAGE"'),
+    "searxng": LogFormat(extract_searxng, literal="SUSPICIOUS_IP_WINDOW"),
+}
+"""Known log formats (see :py:obj:`IPListOptions.log_format
+<.networks.IPListOptions.log_format>`), other formats can be registered here.
+Lines of other log formats are scanned by the regular expressions (log format
+``generic``)."""
@@ -0,0 +1,222 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Bulk lookup of IP addresses in CIDR lists"""
+
+from __future__ import annotations
+from typing import IO, Iterator
+from array import array
+import bisect
+import socket
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .networks import IPV4_BITS, IPV6_BITS, int_to_ip, ip_to_int
+from .cidrset import INDEX_MAGIC, CidrSet
+
+LOOKUP_BATCH_SIZE = 64 * 1024
+"""Number of addresses classified at once by :py:obj:`CidrLookup.lookup_stream`."""
+
+_MASK64 = (1 << 64) - 1
+
+U128_DTYPE = (
+    numpy.dtype([("hi", numpy.uint64), ("lo", numpy.uint64)])
+    if numpy is not None
+    else None
+)
+"""numpy type of an IPv6 address (``None`` without numpy), the structured type
+is sorted (and searched) like the 128 bit integer."""
+
+_BE_DTYPE = (
+    {
+        IPV4_BITS: numpy.dtype(">u4"),
+        IPV6_BITS: numpy.dtype([("hi", ">u8"), ("lo", ">u8")]),
+    }
+    if numpy is not None
+    else None
+)
+
+
+def load_cidrs(path: str) -> CidrSet:
+    """Load a :py:obj:`CidrSet` from a binary index file or from a text list
+    (one network per line)."""
+    with open(path, "rb") as f:
+        is_index = f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    if is_index:
+        return CidrSet.load_index(path)
+    with open(path, encoding="utf-8") as f:
+        return CidrSet.load(f)
+
+
+class CidrLookup:
+    """Lookup of IP addresses in one or more CIDR lists.
+
+    The merged networks of each list are stored as sorted arrays of first and
+    last addresses of the networks.  The addresses of a batch are classified
+    by a vectorized binary search (:py:obj:`numpy.searchsorted`), an IPv6
+    address is a ``(hi, lo)`` pair of 64 bit integers (:py:obj:`U128_DTYPE`).
+    Without numpy :py:obj:`bisect` is used.
+
+    .. code:: python
+
+       >>> lists = {"botnet": CidrSet(["10.0.0.0/23"]), "drop": CidrSet(["10.0.1.0/24"])}
+       >>> lookup = CidrLookup(lists)
+       >>> lookup.lookup(["10.0.1.1", "192.168.0.1"])
+       [(('botnet', '10.0.0.0/23'), ('drop', '10.0.1.0/24')), ()]
+
+    """
+
+    def __init__(self, lists: dict[str, CidrSet]):
+        self.names = list(lists)
+        self._numpy = numpy is not None
+        self._tables = {IPV4_BITS: [], IPV6_BITS: []}
+        for cidrs in lists.values():
+            for bits, tables in self._tables.items():
+                nets = list(cidrs.networks(bits))
+                firsts = [net for net, _ in nets]
+                lasts = [net + (1 << (bits - prefixlen)) - 1 for net, prefixlen in nets]
+                prefixlens = array("B", [prefixlen for _, prefixlen in nets])
+                if self._numpy:
+                    firsts, lasts = _numpy_array(bits, firsts), _numpy_array(
+                        bits, lasts
+                    )
+                tables.append((firsts, lasts, prefixlens))
+
+    def lookup(self, addresses: list[str]) -> list[tuple[tuple[str, str], ...]]:
+        """Classify a batch of IP addresses, returns for each address a tuple
+        of ``(list name, network)`` pairs of the lists in which the address is
+        contained.  Raises :py:obj:`ValueError` on an invalid address."""
+        result = [()] * len(addresses)
+        ipv6 = [i for i, addr in enumerate(addresses) if ":" in addr]
+        ipv4 = (
+            sorted(set(range(len(addresses))) - set(ipv6))
+            if ipv6
+            else range(len(addresses))
+        )
+        for bits, indices in ((IPV4_BITS, ipv4), (IPV6_BITS, ipv6)):
+            if not indices:
+                continue
+            batch = (
+                addresses
+                if len(indices) == len(addresses)
+                else [addresses[i] for i in indices]
+            )
+            search = self._search_numpy if self._numpy else self._search_bisect
+            for i, name, net in search(bits, batch):
+                result[indices[i]] += ((name, net),)
+        return result
+
+    def _search_numpy(
+        self, bits: int, addresses: list[str]
+    ) -> Iterator[tuple[int, str, str]]:
+        try:
+            pton, family = socket.inet_pton, (
+                socket.AF_INET if bits == IPV4_BITS else socket.AF_INET6
+            )
+            values = numpy.frombuffer(
+                b"".join([pton(family, addr) for addr in addresses]),
+                dtype=_BE_DTYPE[bits],
+            )
+        except OSError as exc:
+            raise ValueError(
+                f"invalid IPv{4 if bits == IPV4_BITS else 6} address in batch: {exc}"
+            ) from exc
+        values = values.astype(numpy.uint32 if bits == IPV4_BITS else U128_DTYPE)
+        for name, (firsts, lasts, prefixlens) in zip(self.names, self._tables[bits]):
+            if not len(firsts):  # pylint: disable=use-implicit-booleaness-not-len
+                continue
+            idx = _searchsorted_right(firsts, values) - 1
+            hits = numpy.flatnonzero(
+                (idx >= 0) & _less_equal(values, lasts[numpy.maximum(idx, 0)])
+            )
+            for i, j in zip(hits.tolist(), idx[hits].tolist()):
+                yield i, name, f"{int_to_ip(_to_int(firsts[j]), bits)}/{prefixlens[j]}"
+
+    def _search_bisect(
+        self, bits: int, addresses: list[str]
+    ) -> Iterator[tuple[int, str, str]]:
+        values = []
+        for addr in addresses:
+            try:
+                values.append(ip_to_int(addr, bits))
+            except OSError as exc:
+                raise ValueError(f"invalid IP address: {addr!r}") from exc
+        for name, (firsts, lasts, prefixlens) in zip(self.names, self._tables[bits]):
+            for i, value in enumerate(values):
+                j = bisect.bisect_right(firsts, value) - 1
+                if j >= 0 and value <= lasts[j]:
+                    yield i, name, f"{int_to_ip(firsts[j], bits)}/{prefixlens[j]}"
+
+    def lookup_stream(
+        self, stream: IO
+    ) -> Iterator[tuple[str, tuple[tuple[str, str], ...]]]:
+        """Classify the IP addresses from ``stream`` (one per line) in batches
+        of :py:obj:`LOOKUP_BATCH_SIZE`, yields ``(address, matches)`` (see
+        :py:obj:`lookup`).  Empty lines, comments (``#``) and invalid addresses
+        are skipped."""
+        batch = []
+        for line in stream:
+            addr = line.split("#", 1)[0].strip()
+            if addr:
+                batch.append(addr)
+            if len(batch) >= LOOKUP_BATCH_SIZE:
+                yield from self._lookup_batch(batch)
+                batch = []
+        if batch:
+            yield from self._lookup_batch(batch)
+
+    def _lookup_batch(
+        self, batch: list[str]
+    ) -> Iterator[tuple[str, tuple[tuple[str, str], ...]]]:
+        try:
+            matches = self.lookup(batch)
+        except ValueError:
+            batch = [addr for addr in batch if _is_ip(addr)]
+            matches = self.lookup(batch)
+        return zip(batch, matches)
+
+
+def _numpy_array(bits: int, values: list[int]):
+    if bits == IPV4_BITS:
+        return numpy.array(values, dtype=numpy.uint32)
+    arr = numpy.empty(len(values), dtype=U128_DTYPE)
+    arr["hi"] = [value >> 64 for value in values]
+    arr["lo"] = [value & _MASK64 for value in values]
+    return arr
+
+
+def _searchsorted_right(firsts, values):
+    if firsts.dtype != U128_DTYPE:
+        return numpy.searchsorted(firsts, values, side="right")
+    # The search in the structured array compares the (hi, lo) pairs one by one
+    # (slow), the high words are searched first (uint64), only the addresses
+    # with the same high word as a first address need the search of the pairs.
+    hi = firsts["hi"]
+    idx = numpy.searchsorted(hi, values["hi"], side="right")
+    ties = numpy.flatnonzero(
+        (idx > 0) & (hi[numpy.maximum(idx - 1, 0)] == values["hi"])
+    )
+    if len(ties):  # pylint: disable=use-implicit-booleaness-not-len
+        idx[ties] = numpy.searchsorted(firsts, values[ties], side="right")
+    return idx
+
+
+def _less_equal(a, b):
+    if a.dtype != U128_DTYPE:
+        return a <= b
+    return (a["hi"] < b["hi"]) | ((a["hi"] == b["hi"]) & (a["lo"] <= b["lo"]))
+
+
+def _to_int(value) -> int:
+    if value.dtype != U128_DTYPE:
+        return int(value)
+    return (int(value["hi"]) << 64) | int(value["lo"])
+
+
+def _is_ip(addr: str) -> bool:
+    try:
+        ip_to_int(addr, IPV6_BITS if ":" in addr else IPV4_BITS)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,683 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Parse IP adresses and networks from streams (e.g. log files) and merge them"""
+
+# pylint: disable = consider-using-f-string
+
+from __future__ import annotations
+from typing import IO, Callable, Iterable, Iterator
+from collections import Counter
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import mmap
+import os
+import re
+import socket
+
+from .logformats import LOG_FORMATS
+
+# Regular expressions
+# -------------------
+#
+# Stolen from .. and slightly modified
+# https://gist.github.com/dfee/6ed3a4b05cfe7a6faf40a2102408d5d8
+
+# pylint: disable = line-too-long
+IPV4SEG = r"(?:25[0-5]|(?:2[0-4]|1{0,1}[0-9]){0,1}[0-9])"
+# The look-ahead does not change what is matched, but it lets the regex engine
+# skip all positions that can't start an address (most of a log line).
+IPV4ADDR = r"(?=[0-9])(?:(?:" + IPV4SEG + r"\.){3,3}" + IPV4SEG + r")"
+IPV6SEG = r"(?:(?:[0-9a-fA-F]){1,4})"
+IPV6GROUPS = (
+    r"(?:" + IPV6SEG + r":){7,7}" + IPV6SEG,  # 1:2:3:4:5:6:7:8
+    r"(?:"
+    + IPV6SEG
+    + r":){1,7}:",  # 1::                                 1:2:3:4:5:6:7::
+    r"(?:"
+    + IPV6SEG
+    + r":){1,6}:"
+    + IPV6SEG,  # 1::8               1:2:3:4:5:6::8   1:2:3:4:5:6::8
+    r"(?:"
+    + IPV6SEG
+    + r":){1,5}(?::"
+    + IPV6SEG
+    + r"){1,2}",  # 1::7:8             1:2:3:4:5::7:8   1:2:3:4:5::8
+    r"(?:"
+    + IPV6SEG
+    + r":){1,4}(?::"
+    + IPV6SEG
+    + r"){1,3}",  # 1::6:7:8           1:2:3:4::6:7:8   1:2:3:4::8
+    r"(?:"
+    + IPV6SEG
+    + r":){1,3}(?::"
+    + IPV6SEG
+    + r"){1,4}",  # 1::5:6:7:8         1:2:3::5:6:7:8   1:2:3::8
+    r"(?:"
+    + IPV6SEG
+    + r":){1,2}(?::"
+    + IPV6SEG
+    + r"){1,5}",  # 1::4:5:6:7:8       1:2::4:5:6:7:8   1:2::8
+    IPV6SEG
+    + r":(?:(?::"
+    + IPV6SEG
+    + r"){1,6})",  # 1::3:4:5:6:7:8     1::3:4:5:6:7:8   1::8
+    r":(?:(?::"
+    + IPV6SEG
+    + r"){1,7}|:)",  # ::2:3:4:5:6:7:8    ::2:3:4:5:6:7:8  ::8       ::
+    r"fe80:(?::"
+    + IPV6SEG
+    + r"){0,4}%[0-9a-zA-Z]{1,}",  # fe80::7:8%eth0     fe80::7:8%1  (link-local IPv6 addresses with zone ID)
+    r"::(?i:ffff(?::0{1,4}){0,1}:){0,1}[^\s:]"
+    + IPV4ADDR,  # ::255.255.255.255  ::ffff:255.255.255.255  ::ffff:0:255.255.255.255 (IPv4-mapped IPv6 addresses and IPv4-translated addresses)
+    r"(?:"
+    + IPV6SEG
+    + r":){1,6}:?[^\s:]"
+    + IPV4ADDR,  # 2001:db8:3:4::192.0.2.33  64:ff9b::192.0.2.33 (IPv4-Embedded IPv6 Address)
+)
+# Reverse rows for greedy match.  Every IPv6 address starts with up to 4 hex
+# digits and a colon followed by a hex digit or colon (and not in the middle of
+# a word), the look-behind and look-ahead skip all other positions before the
+# (expensive) alternation is tried.  An address is not followed by a word
+# character, a colon that continues a word (``std::string``) or a dot that
+# continues a number.
+IPV6ADDR = (
+    r"(?<![0-9a-zA-Z_:.])(?=[0-9a-fA-F]{0,4}:[0-9a-fA-F:])(?:"
+    + "|".join(["(?:{})".format(g) for g in IPV6GROUPS[::-1]])
+    + r")(?![0-9a-zA-Z_]|:[0-9a-zA-Z_:]|\.[0-9])"
+)
+CIDR = r"(?:\/1[01][0-9]|12[0-8]|[0-9]{1,2})"
+# pylint: enable = line-too-long
+
+# implementations
+# ---------------
+
+
+def filter_networks(opts: IPListOptions, stream: IO):
+    """Parse IP adresses and subnets from ``stream``.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param stream: A stream with IP adresses in.  For example, a server log.
+    """
+
+    for line in stream:
+
+        for ipvx, ipvx_min_pref in [
+            (opts.ipv4, opts.ipv4_min_pref),
+            (opts.ipv6, opts.ipv6_min_pref),
+        ]:
+            ip_cidr_set = set()
+            for ip_cidr in parse_networks(opts, line, ipvx, ipvx_min_pref):
+                if opts.unique:
+                    ip_cidr_set.add(ip_cidr)
+                else:
+                    yield ip_cidr
+            if opts.unique:
+                yield from ip_cidr_set
+
+
+def parse_networks(opts: IPListOptions, line: str, ip_re: re.Pattern, ip_min_pref: int):
+    """Parse IP adresses and subnets from ``line``.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param line: A line with IP adresse(s) in.  For example, a line from the
+      server log from which the IPs should be collected.
+    :param ip_re: :py:obj:`IPV4ADDR` or :py:obj:`IPV6ADDR`
+    :param ip_min_pref: minimal CIDR prefix
+    """
+
+    if opts.substring:
+        match = opts.substring.match(line)
+        if not match:
+            return
+        line = line[match.start() : match.end()]
+
+    ip_cidr_set = set()
+    for match in ip_re.finditer(line):
+        ip, cidr = (line[match.start() : match.end()].split("/") + [""])[:2]
+        if opts.ignore_zone_id and r"%" in ip:
+            continue
+        if ":" in ip and not is_ipv6_match(ip):
+            continue
+        if cidr:
+            cidr = int(cidr)
+            if cidr < ip_min_pref:
+                continue
+        if opts.unique:
+            ip_cidr_set.add((ip, cidr))
+        else:
+            yield ip, cidr
+
+    if opts.unique:
+        yield from ip_cidr_set
+
+
+# integer engine
+# --------------
+#
+# The functions below do not build "ip/cidr" strings that have to be parsed
+# again (e.g. by netaddr), a network is a pair of integers ``(network,
+# prefixlen)`` from the regex match up to the final output.
+
+IPV4_BITS = 32
+IPV6_BITS = 128
+
+_ADDR_FAMILY = {IPV4_BITS: socket.AF_INET, IPV6_BITS: socket.AF_INET6}
+
+BLOCK_SIZE = 1024 * 1024
+"""Number of characters (bytes) read at once from a stream by
+:py:obj:`iter_blocks`."""
+
+WINDOW_SIZE = 4 * 1024 * 1024
+"""Size (bytes) of the window that is scanned at once in a memory mapped file
+(see :py:obj:`collect_networks_buffer`)."""
+
+CHUNK_SIZE = 64 * 1024 * 1024
+"""Maximal size (bytes) of a file chunk parsed by a worker process (see
+:py:obj:`collect_networks_parallel`)."""
+
+
+def ip_to_int(ip: str, bits: int = IPV4_BITS) -> int:
+    """Convert the IP address ``ip`` to an integer.  Raises :py:obj:`OSError`
+    if ``ip`` is not a valid address (e.g. ``010.1.2.3``)."""
+    return int.from_bytes(socket.inet_pton(_ADDR_FAMILY[bits], ip), "big")
+
+
+def int_to_ip(value: int, bits: int = IPV4_BITS) -> str:
+    """Convert the integer ``value`` to an IP address string."""
+    return socket.inet_ntop(_ADDR_FAMILY[bits], value.to_bytes(bits // 8, "big"))
+
+
+def iter_blocks(stream: IO, size: int = BLOCK_SIZE) -> Iterator[str | bytes]:
+    """Read ``stream`` (text or binary) in blocks of (about) ``size``
+    characters, a block always ends at a line boundary."""
+
+    rest = None
+    while True:
+        block = stream.read(size)
+        if not block:
+            break
+        if rest:
+            block = rest + block
+        pos = block.rfind(b"\n" if isinstance(block, bytes) else "\n") + 1
+        rest = block[pos:]
+        if pos:
+            yield block[:pos]
+    if rest:
+        yield rest
+
+
+def is_ipv6_match(ip: str) -> bool:
+    """Check a match of :py:obj:`IPV6ADDR`, returns ``False`` for matches that
+    are likely not an IPv6 address of a log line:
+
+    - An address with less than three groups (``a::b``, ``d::``) is a scope
+      operator of a programming language (``class a::b``) unless each group
+      has a decimal digit (``1::8``, ``fe80::1``, ``2001:db8::``).
+
+    - An IPv4-mapped address in dotted form (``::ffff:192.0.2.1``) is counted
+      as the IPv4 address that the IPv4 expression finds in it.
+    """
+    if "." in ip:
+        try:
+            return ip_to_int(ip, IPV6_BITS) >> 32 != 0xFFFF
+        except OSError:
+            return True
+    groups = [group for group in ip.split(":") if group]
+    return len(groups) >= 3 or all(
+        any(c in "0123456789" for c in group) for group in groups
+    )
+
+
+def new_networks(factory: Callable = set) -> dict[int, set | Counter]:
+    """New (empty) containers ``{bits: networks}`` for the IPv4 (``bits=32``)
+    and the IPv6 (``bits=128``) networks.  A :py:obj:`set` (``factory``)
+    collects the networks, a :py:obj:`collections.Counter` counts the hits of
+    each network."""
+    return {IPV4_BITS: factory(), IPV6_BITS: factory()}
+
+
+def iter_found(
+    opts: IPListOptions, stream: IO
+) -> Iterator[tuple[int, list[tuple[str, str]]]]:
+    """Yield the ``(bits, [(ip, cidr), ..])`` matches of the IP addresses in
+    the (text) ``stream`` block by block, the matches are converted to networks
+    by :py:obj:`add_networks`."""
+    if opts.extractor:
+        yield from _iter_extracted(opts, iter_blocks(stream))
+        return
+    if not opts.substring:
+        # No match of the IP regular expressions can span over a newline,
+        # scanning whole blocks of lines is the same as scanning line by line.
+        for block in iter_blocks(stream):
+            yield IPV4_BITS, opts.ipv4_pairs.findall(block)
+            yield IPV6_BITS, opts.ipv6_pairs.findall(block)
+        return
+    for line in stream:
+        match = opts.substring.match(line)
+        if match:
+            yield IPV4_BITS, opts.ipv4_pairs.findall(line, match.start(), match.end())
+            yield IPV6_BITS, opts.ipv6_pairs.findall(line, match.start(), match.end())
+
+
+def iter_found_buffer(
+    opts: IPListOptions, buf, start: int, end: int
+) -> Iterator[tuple[int, list[tuple]]]:
+    """Like :py:obj:`iter_found` but the matches are found in the byte range
+    ``start`` to ``end`` of the bytes-like object ``buf``, the matches are bytes
+    unless the IP addresses are extracted by a log format."""
+    if opts.extractor:
+        blocks = (
+            buf[a:b].decode("utf-8", errors="replace")
+            for a, b in _iter_ranges(buf, start, end)
+        )
+        yield from _iter_extracted(opts, blocks)
+        return
+    ipv4, ipv6 = opts.ipv4_pairs_bytes, opts.ipv6_pairs_bytes
+    if not opts.substring:
+        for a, b in _iter_ranges(buf, start, end):
+            yield IPV4_BITS, ipv4.findall(buf, a, b)
+            yield IPV6_BITS, ipv6.findall(buf, a, b)
+        return
+    substring = opts.substring_bytes
+    while start < end:
+        stop = buf.find(b"\n", start, end) + 1 or end
+        match = substring.match(buf, start, stop)
+        if match:
+            yield IPV4_BITS, ipv4.findall(buf, match.start(), match.end())
+            yield IPV6_BITS, ipv6.findall(buf, match.start(), match.end())
+        start = stop
+
+
+def _iter_ranges(buf, start: int, end: int) -> Iterator[tuple[int, int]]:
+    # line aligned ranges of (about) WINDOW_SIZE bytes
+    while start < end:
+        stop = buf.find(b"\n", min(start + WINDOW_SIZE, end) - 1, end) + 1 or end
+        yield start, stop
+        start = stop
+
+
+def _iter_extracted(
+    opts: IPListOptions, blocks: Iterable[str]
+) -> Iterator[tuple[int, list[tuple[str, str]]]]:
+    # Known log format: blocks and lines without the literal of the format are
+    # skipped before the extractor of the format is called.
+    extract, literal, substring = (
+        opts.extractor.extract,
+        opts.extractor.literal,
+        opts.substring,
+    )
+    for block in blocks:
+        if literal not in block:
+            continue
+        found = {IPV4_BITS: [], IPV6_BITS: []}
+        for line in block.splitlines():
+            if literal not in line:
+                continue
+            if substring:
+                match = substring.match(line)
+                if not match:
+                    continue
+                line = match.group()
+            for pair in extract(opts, line):
+                found[IPV6_BITS if ":" in pair[0] else IPV4_BITS].append(pair)
+        yield from found.items()
+
+
+def add_networks(
+    opts: IPListOptions,
+    networks: dict[int, set | Counter],
+    found: Iterable[tuple[int, list]],
+    binary: bool = False,
+):
+    """Add the ``(network, prefixlen)`` pairs of the matches in ``found`` (see
+    :py:obj:`iter_found`) to the ``networks`` (see :py:obj:`new_networks`).
+
+    :param binary: the matches are bytes (see :py:obj:`iter_found_buffer`)
+    """
+    for bits, pairs in found:
+        if pairs:
+            networks[bits].update(_iter_networks(opts, bits, pairs, binary))
+
+
+def _iter_networks(
+    opts: IPListOptions, bits: int, pairs: list[tuple], binary: bool
+) -> Iterator[tuple[int, int]]:
+    masks = prefix_masks(bits)
+    if bits == IPV4_BITS:
+        min_pref, norm_pref = opts.ipv4_min_pref, IPV4_BITS
+    else:
+        min_pref, norm_pref = opts.ipv6_min_pref, opts.ipv6_norm_pref
+    pton, family, from_bytes = socket.inet_pton, _ADDR_FAMILY[bits], int.from_bytes
+
+    for ip, cidr in pairs:
+        if binary:
+            ip = ip.decode()
+        if bits == IPV6_BITS and not is_ipv6_match(ip):
+            continue
+        try:
+            net = from_bytes(pton(family, ip), "big")
+        except OSError:
+            continue
+        if not cidr:
+            if norm_pref == bits:
+                yield net, bits
+            else:
+                yield net & masks[norm_pref], norm_pref
+            continue
+        prefixlen = int(cidr[1:])
+        if min_pref <= prefixlen <= bits:
+            prefixlen = min(prefixlen, norm_pref)
+            yield net & masks[prefixlen], prefixlen
+
+
+def collect_networks(
+    opts: IPListOptions, stream: IO, networks: dict[int, set | Counter] | None = None
+) -> dict[int, set | Counter]:
+    """Collect IPv4 and IPv6 networks from ``stream`` as integer ``(network,
+    prefixlen)`` pairs, host bits of the network are masked out.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param stream: A (text) stream with IP adresses in.  For example, a server
+      log.
+    :param networks: containers to add the networks to (optional, see
+      :py:obj:`new_networks`)
+    """
+    if networks is None:
+        networks = new_networks()
+    add_networks(opts, networks, iter_found(opts, stream))
+    return networks
+
+
+def collect_networks_buffer(
+    opts: IPListOptions,
+    buf,
+    networks: dict[int, set | Counter] | None = None,
+    start: int = 0,
+    end: int | None = None,
+) -> dict[int, set | Counter]:
+    """Like :py:obj:`collect_networks` but the networks are collected from the
+    lines in a bytes-like object, e.g. a :py:obj:`mmap.mmap`.  The regular
+    expressions run directly on ``buf`` (in windows of :py:obj:`WINDOW_SIZE`),
+    lines are neither copied nor decoded.
+
+    :param buf: bytes-like object
+    :param start, end: byte range of ``buf`` to scan, the range has to be
+      aligned to line boundaries
+    """
+    if networks is None:
+        networks = new_networks()
+    end = len(buf) if end is None else end
+    add_networks(
+        opts,
+        networks,
+        iter_found_buffer(opts, buf, start, end),
+        binary=not opts.extractor,
+    )
+    return networks
+
+
+def collect_networks_mmap(
+    opts: IPListOptions, stream: IO, networks: dict[int, set | Counter] | None = None
+) -> dict[int, set | Counter]:
+    """Like :py:obj:`collect_networks` but the windows of :py:obj:`iter_windows`
+    are scanned by :py:obj:`collect_networks_buffer`.
+
+    :param stream: A stream with IP adresses in.  For example, a server log.
+    """
+    if networks is None:
+        networks = new_networks()
+    for buf, start, stop in iter_windows(stream):
+        collect_networks_buffer(opts, buf, networks, start, stop)
+    return networks
+
+
+def iter_windows(stream: IO) -> Iterator[tuple[bytes | mmap.mmap, int, int]]:
+    """Iterate over line aligned windows ``(buffer, start, stop)`` of a stream.
+    A regular file is memory mapped, the pages of a window are dropped from the
+    resident memory once the window has been processed.  Other streams
+    (``stdin``, pipes) are read in large binary blocks.
+
+    :param stream: A stream with IP adresses in.  For example, a server log.
+    """
+    name = getattr(stream, "name", "")
+    if not os.path.isfile(name):
+        stream = getattr(stream, "buffer", stream)
+        for block in iter_blocks(stream, WINDOW_SIZE):
+            yield block, 0, len(block)
+        return
+    if not os.path.getsize(name):
+        return
+    with (
+        open(name, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf,
+    ):
+        start, size = 0, len(buf)
+        while start < size:
+            stop = buf.find(b"\n", min(start + WINDOW_SIZE, size) - 1) + 1 or size
+            yield buf, start, stop
+            if hasattr(mmap, "MADV_DONTNEED"):
+                # drop the scanned pages from the resident memory of the process
+                page = start - start % mmap.PAGESIZE
+                buf.madvise(mmap.MADV_DONTNEED, page, stop - page)
+            start = stop
+
+
+def collect_networks_parallel(
+    opts: IPListOptions, streams: list[IO], jobs: int
+) -> dict[int, set]:
+    """Like :py:obj:`collect_networks` but the (regular) files in ``streams``
+    are split into chunks (:py:obj:`file_chunks`) which are parsed in ``jobs``
+    worker processes.  Each worker returns a merged list of networks (see
+    :py:obj:`merge_networks`), the caller has to do the final merge.  Streams
+    that are not regular files (e.g. ``stdin``) are parsed in this process.
+
+    :param opts: :py:obj:`IPListOptions` container with filter options
+    :param streams: streams with IP adresses in.  For example, server logs.
+    :param jobs: number of worker processes
+    """
+
+    files = [f.name for f in streams if os.path.isfile(getattr(f, "name", ""))]
+    total = sum(os.path.getsize(name) for name in files)
+    chunk_size = min(CHUNK_SIZE, max(BLOCK_SIZE, total // jobs + 1))
+
+    networks = new_networks()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(_collect_chunk, opts, name, start, end)
+            for name in files
+            for start, end in file_chunks(name, chunk_size)
+        ]
+        for f in streams:
+            if getattr(f, "name", "") not in files:
+                collect_networks(opts, f, networks)
+        for future in futures:
+            for bits, merged in future.result().items():
+                networks[bits].update(merged)
+    return networks
+
+
+def file_chunks(name: str, chunk_size: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    """Split file ``name`` into byte ranges ``(start, end)`` of ``chunk_size``.
+    A line belongs to the range in which its first byte is located."""
+    size = os.path.getsize(name)
+    return [
+        (start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)
+    ]
+
+
+def _collect_chunk(
+    opts: IPListOptions, name: str, start: int, end: int
+) -> dict[int, list[tuple[int, int]]]:
+    networks = new_networks()
+    with (
+        open(name, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf,
+    ):
+        # align the chunk to the lines that begin in [start, end)
+        stop = buf.find(b"\n", end - 1) + 1 or len(buf)
+        if start:
+            start = buf.find(b"\n", start - 1, end) + 1 or stop
+        collect_networks_buffer(opts, buf, networks, start, stop)
+    return {bits: merge_networks(items, bits) for bits, items in networks.items()}
+
+
+def merge_networks(
+    networks: Iterable[tuple[int, int]], bits: int
+) -> list[tuple[int, int]]:
+    """Merge ``(network, prefixlen)`` pairs to the smallest possible (sorted)
+    list of CIDR networks (like :py:obj:`netaddr.cidr_merge`).
+
+    The networks are sorted and merged in one sweep into ``[first, last]``
+    intervals, the merged intervals are split into CIDR networks.
+
+    :param networks: pairs of integers, host bits must be masked out
+    :param bits: size of the address space (32 for IPv4, 128 for IPv6)
+    """
+    merged = []
+    networks = sorted(networks)
+    if not networks:
+        return merged
+
+    first, prefixlen = networks[0]
+    last = first + (1 << (bits - prefixlen)) - 1
+    single = networks[0]  # interval is covered by a single network (most common case)
+
+    for net in networks:
+        start, prefixlen = net
+        end = start + (1 << (bits - prefixlen)) - 1
+        if start > last + 1:
+            if single:
+                merged.append(single)
+            else:
+                merged.extend(range_to_cidrs(first, last, bits))
+            first, last, single = start, end, net
+        elif end > last:
+            last, single = end, None
+    if single:
+        merged.append(single)
+    else:
+        merged.extend(range_to_cidrs(first, last, bits))
+    return merged
+
+
+def range_to_cidrs(first: int, last: int, bits: int) -> Iterator[tuple[int, int]]:
+    """Split the address range ``[first, last]`` into the smallest possible
+    list of ``(network, prefixlen)`` pairs."""
+    while first <= last:
+        size = first & -first or 1 << bits  # largest block aligned at first
+        span = 1 << ((last - first + 1).bit_length() - 1)  # largest block that fits
+        size = min(size, span)
+        yield first, bits + 1 - size.bit_length()
+        first += size
+
+
+@functools.cache
+def prefix_masks(bits: int) -> list[int]:
+    """List of the network masks (integers) for prefix lengths ``0 .. bits``."""
+    full = (1 << bits) - 1
+    return [full ^ (full >> prefixlen) for prefixlen in range(bits + 1)]
+
+
+@dataclass
+class IPListOptions:  # pylint:disable = too-many-instance-attributes
+    """container with filter options that will be passed through IP list
+    operations"""
+
+    ipv4_min_pref: int = 32
+    """The prefix defines the number of leading bits in an address that are
+    compared to determine whether or not an address is part of a network.  This
+    value is used, for example, to filter out IPs from the IP list whose CIDR
+    suffix addresses a parent network.  For example, a /24 network is a subnet
+    of a /23 network, and a single IPv4 address has a network mask of /32 bit
+    length (a single IPv6 address is /128 bits long).
+
+    In an IPv4 network, the client usually has only one IP address (aka class
+    E), which has a /32 prefix. In IPv6 networks, providers often assign a /48
+    or /56 subnet to their customers, from which a single client then has an
+    IPv6 /128 address.
+    """
+
+    ipv6_min_pref: int = 128
+    """see :py:obj:`ipv4_min_pref` (max. 128)"""
+
+    ipv6_norm_pref: int = 128
+    """Normalize IPv6 addresses (and longer prefixes) to a network with this
+    prefix length, e.g. ``64`` or ``48``.  A provider assigns a whole subnet to
+    a customer, blocking the single addresses (``/128``) of a client is
+    pointless.  The default ``128`` does not change the networks."""
+
+    ipv4_agg_pref: int = 24
+    """Prefix length of the parent network (the neighborhood) of an IPv4
+    network.  When a parent contains :py:obj:`agg_threshold` or more networks,
+    these networks are aggregated into the parent.  The parent prefix may be
+    smaller than :py:obj:`ipv4_min_pref` (which filters only the networks of
+    the input)."""
+
+    ipv6_agg_pref: int = 48
+    """see :py:obj:`ipv4_agg_pref` (providers often assign a /48 to their
+    customers)"""
+
+    agg_threshold: int = 0
+    """Minimal number of networks in a parent network to aggregate them into
+    the parent (0: no aggregation), see :py:obj:`aggregate_networks
+    <.aggregate.aggregate_networks>`."""
+
+    # regular expressions
+
+    re_ipv4: str = IPV4ADDR
+    """Regular Expression that matches an IPv4 address"""
+
+    re_ipv6: str = IPV6ADDR
+    """Regular Expression that matches an IPv6 address"""
+
+    re_cidr: str = r"(/\d{1,3})?"
+    """Regular Expression that matches an CIDR suffix of an IP address."""
+
+    re_substring: str = ""
+    """Regular expression to parse IPs only from a substring of the incoming
+    line.  If you have log files with lines like::
+
+        YYYY-mm-dd HH:MM:SS foo 0.0.0.0 BLOCK 206.41.169.186/32 bar
+
+    and dont want to parse the IP 0.0.0.0 you can define a regular expression
+    like ``BLOCK.*$`` to parse the IP from the substring::
+
+        BLOCK 206.41.169.186/32 bar
+
+    Lines where the regular expression do not match will be ignored.
+    """
+
+    ignore_zone_id: bool = True
+    """Ignore link-local IPv6 addresses with zone ID.  The purpose of zone IDs
+    is to distinguish these addresses.  For instance, if host A has two NICs
+    that are connected to two different links (subnets), the same local-link
+    address could have been used for ``fe80::7:8%eth0`` and ``fe80::7:8%eth1``.
+    """
+
+    unique: bool = True
+    """Filter out duplicates."""
+
+    log_format: str = "generic"
+    """Name of a known log format (see :py:obj:`LOG_FORMATS
+    <.logformats.LOG_FORMATS>`), the IP adresses are taken from the fields of
+    the format.  The ``generic`` format scans the whole line with the regular
+    expressions (:py:obj:`re_ipv4`)."""
+
+    def __post_init__(self):
+        self.substring = None
+        if self.re_substring:
+            self.substring = re.compile(self.re_substring)
+        self.ipv4 = re.compile(self.re_ipv4 + self.re_cidr)
+        self.ipv4_pairs = re.compile("(" + self.re_ipv4 + ")" + self.re_cidr)
+        self.ipv4_pairs_bytes = re.compile(self.ipv4_pairs.pattern.encode())
+        self.substring_bytes = (
+            re.compile(self.re_substring.encode()) if self.re_substring else None
+        )
+        self.ipv6 = re.compile("(?:" + self.re_ipv6 + ")" + self.re_cidr)
+        self.ipv6_pairs = re.compile("(" + self.re_ipv6 + ")" + self.re_cidr)
+        self.ipv6_pairs_bytes = re.compile(self.ipv6_pairs.pattern.encode())
+        self.extractor = None
+        if self.log_format != "generic":
+            if self.log_format not in LOG_FORMATS:
+                raise ValueError(f"unknown log format: {self.log_format!r}")
+            self.extractor = LOG_FORMATS[self.log_format]
@@ -1,9 +1,18 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
-"""Print words from ``words.dat``"""
+"""DNSBL checks of IPs and domains (pydnsbl, asyncio/aiodns) with a persistent
+cache of the answers"""
 
-import socket
+from __future__ import annotations
+from typing import AsyncIterator, Iterable, Iterator
+import asyncio
 import ipaddress
+import json
+import time
+import types
+
+import aiodns
 import pydnsbl
+from pydnsbl.checker import DNSBLResult
 from pydnsbl.providers import (
     DNSBL_CATEGORY_UNKNOWN,
     DNSBL_CATEGORY_SPAM,
@@ -17,6 +26,8 @@ from pydnsbl.providers import (
 import click
 
 from ._cli import prj
+from .cache import CACHE_MAX_ENTRIES, SQLiteCache, cache_path
+from .iplists import InputFile
 
 
 @prj.group()
@@ -28,41 +39,186 @@ def dnsbl():
     """
 
 
+def _cache_options(func):
+    func = click.option(
+        "--no-cache", is_flag=True, default=False, help="don't use the cache"
+    )(func)
+    func = click.option(
+        "--refresh",
+        is_flag=True,
+        default=False,
+        help="query all IPs (don't read the cache) and update the cache",
+    )(func)
+    func = click.option(
+        "--negative-ttl",
+        type=click.IntRange(min=0),
+        default=None,
+        help="seconds a *not listed* answer is cached  [default: 900]",
+    )(func)
+    return func
+
+
+def _dnsbl_cache(negative_ttl, refresh, no_cache) -> DNSBLCache | None:
+    if no_cache:
+        return None
+    return DNSBLCache(
+        negative_ttl=DNSBL_NEGATIVE_TTL if negative_ttl is None else negative_ttl,
+        refresh=refresh,
+    )
+
+
 @dnsbl.command("py")
-@click.argument("streams", type=click.File("r"), nargs=-1)
-def _py(streams):
-    """check IPs from a stream (pydnsbl)"""
+@_cache_options
+@click.argument("streams", type=InputFile(), nargs=-1)
+def _py(negative_ttl, refresh, no_cache, streams):
+    """check IPs from a stream (pydnsbl)
 
-    ip_checker = pydnsbl.DNSBLIpChecker()
+    The answers of the providers are cached (:py:obj:`DNSBLCache`), an IP that
+    is in the cache for all providers is not queried again.
+    """
 
-    for f in streams:
-        for ip in f.readlines():
-            ip = ip.strip()
-            chk = ip_checker.check(ip)
-            _echo_check_result(chk)
+    ip_checker = _IpChecker()
+    hosts = [provider.host for provider in ip_checker.providers]
+    cache = _dnsbl_cache(negative_ttl, refresh, no_cache)
+
+    try:
+        for f in streams:
+            for ip in f.readlines():
+                ip = ip.strip()
+                cached = (
+                    cache.get_results((host, ip) for host in hosts)
+                    if cache is not None
+                    else {}
+                )
+                if len(cached) == len(hosts):
+                    _echo_check_result(_cached_check_result(ip, cached.values()))
+                    continue
+                chk = ip_checker.check(ip)
+                _echo_check_result(chk)
+                if cache is not None:
+                    cache.set_results(
+                        _provider_result(ip, response) for response in chk.responses
+                    )
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 @dnsbl.command("socket")
-@click.argument("streams", type=click.File("r"), nargs=-1)
-def _socket(streams):
-    """check IPs from a stream (socket.gethostbyname)"""
-
-    dns_zone = "zen.spamhaus.org"
-    dnsbl_setup = DNSBL_ZONES[dns_zone]
-
-    for f in streams:
-        for ip in f.readlines():
-            ip = ip.strip()
-            try:
-                ret_code = socket.gethostbyname(dnsxl_hostname(ip.strip(), dns_zone))
-                result = dnsbl_setup["result"].get(ret_code, "dnsbl error")
-            except socket.gaierror as exc:
-                if exc.args[0] == socket.EAI_NONAME:
-                    result = "not listed"
-                    ret_code = socket.EAI_NONAME
-                else:
-                    raise
-            click.echo(f"{ip} --> {result} ({ret_code})")
+@click.option(
+    "--zone",
+    "zones",
+    multiple=True,
+    default=["zen.spamhaus.org"],
+    show_default=True,
+    help="DNSBL zone (DNSBL_ZONES) to query, can be given more than once",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="max. number of DNS queries at once  [default: 500]",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=None,
+    help="seconds to wait for a DNS answer  [default: 5]",
+)
+@click.option(
+    "--nameserver",
+    "nameservers",
+    multiple=True,
+    help="IP of the DNS server, can be given more than once  [default: system resolver]",
+)
+@click.option(
+    "--dns-port",
+    type=int,
+    show_default=True,
+    default=53,
+    help="UDP/TCP port of the DNS servers",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "jsonl"]),
+    show_default=True,
+    default="text",
+    help="output format (jsonl: one JSON object per result)",
+)
+@_cache_options
+@click.argument("streams", type=InputFile(), nargs=-1)
+def _socket(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    zones,
+    concurrency,
+    timeout,
+    nameservers,
+    dns_port,
+    output_format,
+    negative_ttl,
+    refresh,
+    no_cache,
+    streams,
+):
+    """check IPs from a stream (asyncio/aiodns)
+
+    usage::
+
+      $ dnsbl socket ips.txt
+      $ dnsbl socket --zone sbl.spamhaus.org --zone xbl.spamhaus.org --format jsonl ips.txt.gz
+
+    The IPs (one per line) are checked in each of the DNSBL zones, the queries
+    are sent concurrently (not more than ``--concurrency`` at once) and the
+    results are printed as they arrive (see :py:obj:`iter_dnsbl_results`).  An
+    IP that is not in a zone (``NXDOMAIN``) is *not listed*.
+
+    The answers are cached until their DNS TTL expires, a *not listed* answer
+    for ``--negative-ttl`` seconds (see :py:obj:`DNSBLCache`).  The IPs are
+    looked up in the cache in batches of :py:obj:`DNSBL_CACHE_BATCH` (zone, IP)
+    pairs, the IPs of a batch that are in the cache are printed before the
+    queries of the batch are sent.
+    """
+
+    unknown = [zone for zone in zones if zone not in DNSBL_ZONES]
+    if unknown:
+        raise click.BadParameter(
+            f"unknown DNSBL zones: {', '.join(unknown)}", param_hint="--zone"
+        )
+
+    def iter_ips():
+        for f in streams:
+            for line in f:
+                ip = line.split("#", 1)[0].strip()
+                if ip:
+                    yield ip
+
+    cache = _dnsbl_cache(negative_ttl, refresh, no_cache)
+
+    async def check():
+        resolver = aiodns.DNSResolver(
+            nameservers=list(nameservers) or None,
+            timeout=timeout or DNSBL_TIMEOUT,
+            tries=2,
+            udp_port=dns_port,
+            tcp_port=dns_port,
+        )
+        results = iter_dnsbl_results(
+            iter_ips(), zones, resolver, concurrency or DNSBL_CONCURRENCY, cache=cache
+        )
+        async for result in results:
+            if output_format == "jsonl":
+                click.echo(json.dumps(result))
+                continue
+            zone = f" {result['zone']}" if len(zones) > 1 else ""
+            click.echo(
+                f"{result['ip']} --> {result['result']} ({result['ret_code']}){zone}"
+            )
+
+    try:
+        asyncio.run(check())
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 @dnsbl.command("domain")
@@ -98,6 +254,57 @@ def _echo_check_result(chk):
     #     click.echo(f'  {v}')
 
 
+class _IpChecker(pydnsbl.DNSBLIpChecker):
+    # the result of check() has the responses (DNSBLResponse) of the providers
+    # (the answers with their return code and TTL) for the cache
+
+    async def check_async(self, request):
+        responses = await asyncio.gather(
+            *(self.dnsbl_request(request, provider) for provider in self.providers)
+        )
+        result = DNSBLResult(addr=request, results=responses)
+        result.responses = responses
+        return result
+
+
+def _provider_result(ip, response) -> dict:
+    # result of a pydnsbl provider in the format of dnsbl_lookup
+    result = {
+        "ip": ip,
+        "zone": response.provider.host,
+        "result": None,
+        "ret_code": None,
+        "ttl": None,
+    }
+    if response.error:
+        result["result"] = "lookup error"
+    elif not response.response:
+        result.update(result=DNSBL_NOT_LISTED, ret_code="NXDOMAIN")
+    else:
+        categories = response.provider.process_response(response.response)
+        result.update(
+            result=", ".join(sorted(categories)),
+            ret_code=response.response[0].host,
+            ttl=response.response[0].ttl,
+        )
+    return result
+
+
+def _cached_check_result(ip, results):
+    # looks like a pydnsbl.checker.DNSBLResult for _echo_check_result
+    detected_by = {
+        result["zone"]: result["result"].split(", ")
+        for result in results
+        if result["result"] != DNSBL_NOT_LISTED
+    }
+    return types.SimpleNamespace(
+        blacklisted=bool(detected_by),
+        addr=ip,
+        detected_by=detected_by,
+        failed_providers=[],
+    )
+
+
 SPAMHAUS_RET_CODES = {
     # https://www.spamhaus.org/faq/section/DNSBL%20Usage#200
     "127.0.0.2": DNSBL_CATEGORY_SPAM,
@@ -131,6 +338,233 @@ DNSBL_ZONES = {
 }
 
 
+DNSBL_CONCURRENCY = 500
+"""Default maximum number of DNS queries at once (:py:obj:`iter_dnsbl_results`)."""
+
+DNSBL_TIMEOUT = 5.0
+"""Default seconds to wait for the answer of a DNS query."""
+
+DNSBL_NOT_LISTED = "not listed"
+
+DNSBL_NEGATIVE_TTL = 900
+"""Default seconds a *not listed* answer is cached (:py:obj:`DNSBLCache`)."""
+
+DNSBL_CACHE_BATCH = 500
+"""Number of IPs looked up in (and results stored to) the cache at once."""
+
+
+class DNSBLCache(SQLiteCache):
+    """Cache of the DNSBL answers (:py:obj:`dnsbl_lookup`), keyed by ``(zone,
+    ip)``.  The return code and its category are cached until the TTL of the
+    DNS answer expires, a *not listed* answer (``NXDOMAIN``) for
+    ``negative_ttl`` seconds.  Lookup errors and return codes that are not a
+    listing of the zone (:py:obj:`DNSBL_ZONES`) are not cached.  The ``ttl``
+    of a cached result is the remaining TTL of the answer.
+
+    :param path: name of the SQLite file (default: ``dnsbl`` in the
+      :py:obj:`CACHE_DIR <.cache.CACHE_DIR>`)
+    :param negative_ttl: seconds until a *not listed* answer expires
+    :param refresh: don't read the cache (query all IPs and update the cache)
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        negative_ttl: float = DNSBL_NEGATIVE_TTL,
+        refresh: bool = False,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path or cache_path("dnsbl"), max_entries=max_entries)
+        self.negative_ttl = negative_ttl
+        self.refresh = refresh
+
+    def get_results(
+        self, keys: Iterable[tuple[str, str]]
+    ) -> dict[tuple[str, str], dict]:
+        """Results ``{(zone, ip): result}`` of the ``(zone, ip)`` keys in the
+        cache, the results have ``"cached": True``."""
+        if self.refresh:
+            return {}
+        found = self.get_many(f"{zone} {ip}" for zone, ip in keys)
+        results = {}
+        now = time.time()
+        for key, (result, ret_code, expires) in found.items():
+            zone, ip = key.split(" ", 1)
+            results[(zone, ip)] = {
+                "ip": ip,
+                "zone": zone,
+                "result": result,
+                "ret_code": ret_code,
+                "ttl": None if expires is None else max(int(expires - now), 0),
+                "cached": True,
+            }
+        return results
+
+    def set_results(self, results: Iterable[dict]):
+        """Store the ``results`` of :py:obj:`dnsbl_lookup` in the cache, the
+        entries with the same TTL are stored at once.  The time the DNS answer
+        expires is stored with the result (the remaining TTL of
+        :py:obj:`get_results`)."""
+        now = time.time()
+        by_ttl: dict[float, dict] = {}
+        for result in results:
+            if result["result"] == DNSBL_NOT_LISTED:
+                ttl = self.negative_ttl
+            elif _is_listed(result["zone"], result["ret_code"]):
+                ttl = result["ttl"] or 0
+            else:
+                continue
+            if ttl > 0:
+                by_ttl.setdefault(ttl, {})[f"{result['zone']} {result['ip']}"] = (
+                    result["result"],
+                    result["ret_code"],
+                    None if result["ttl"] is None else now + result["ttl"],
+                )
+        for ttl, items in by_ttl.items():
+            self.set_many(items, ttl=ttl)
+
+
+def _is_listed(zone: str, ret_code: str | None) -> bool:
+    # A return code of the zone (DNSBL_ZONES) is a listing, other answers
+    # (e.g. 127.255.255.254 of Spamhaus: query through a public resolver) are
+    # errors.  The zones of the pydnsbl providers list in 127.0.0.0/24.
+    if ret_code is None:
+        return False
+    if zone in DNSBL_ZONES:
+        return ret_code in DNSBL_ZONES[zone]["result"]
+    return ret_code.startswith("127.0.0.")
+
+
+# pylint: disable-next=too-many-locals
+async def iter_dnsbl_results(
+    ips: Iterable[str],
+    zones: Iterable[str],
+    resolver: aiodns.DNSResolver,
+    concurrency: int = DNSBL_CONCURRENCY,
+    cache: DNSBLCache | None = None,
+) -> AsyncIterator[dict]:
+    """Check each of the ``ips`` in each of the DNSBL ``zones``
+    (:py:obj:`DNSBL_ZONES`) and yield the results (:py:obj:`dnsbl_lookup`) in
+    the order they arrive.  Not more than ``concurrency`` queries are sent at
+    once (a result counts until it is yielded), the ``ips`` are read while the
+    queries are answered (the memory does not depend on the number of IPs).
+
+    With a ``cache`` the IPs are looked up in the cache in batches of
+    :py:obj:`DNSBL_CACHE_BATCH` before the queries of the batch are sent, the
+    cached results are yielded like the answers of the queries (not more than
+    ``concurrency`` are waiting).  The results of the queries are stored in the
+    cache.
+    """
+    zones = list(zones)
+    done: asyncio.Queue = asyncio.Queue()
+    window = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    def on_done(task):
+        tasks.discard(task)
+        done.put_nowait(task)
+
+    async def submit():
+        count = 0
+        try:
+            for batch in _iter_key_batches(ips, zones):
+                cached = cache.get_results(batch) if cache is not None else {}
+                for key in batch:
+                    count += 1
+                    # a slot of the window is released when the result is
+                    # taken from the queue, cached results too
+                    await window.acquire()
+                    if key in cached:
+                        done.put_nowait(cached[key])
+                        continue
+                    task = asyncio.ensure_future(dnsbl_lookup(resolver, key[1], key[0]))
+                    task.add_done_callback(on_done)
+                    tasks.add(task)
+        finally:
+            done.put_nowait(count)
+
+    feeder = asyncio.ensure_future(submit())
+    new_results = []
+    try:
+        total, received = None, 0
+        while total is None or received < total:
+            item = await done.get()
+            if isinstance(item, int):
+                total = item
+                continue
+            received += 1
+            window.release()
+            if isinstance(item, dict):
+                yield item
+                continue
+            result = item.result()
+            if cache is not None:
+                new_results.append(result)
+                if len(new_results) >= DNSBL_CACHE_BATCH:
+                    cache.set_results(new_results)
+                    new_results = []
+            yield result
+        await feeder
+    finally:
+        feeder.cancel()
+        for task in list(tasks):
+            task.cancel()
+        if new_results:
+            cache.set_results(new_results)
+
+
+def _iter_key_batches(
+    ips: Iterable[str], zones: list[str]
+) -> Iterator[list[tuple[str, str]]]:
+    batch = []
+    for ip in ips:
+        batch.extend((zone, ip) for zone in zones)
+        if len(batch) >= DNSBL_CACHE_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def dnsbl_lookup(resolver: aiodns.DNSResolver, ip: str, dns_zone: str) -> dict:
+    """Query the ``ip`` in the DNSBL ``dns_zone`` (:py:obj:`dnsxl_hostname`),
+    returns a dictionary with the ``ip``, the ``zone``, the ``result`` (the
+    category of the return code, :py:obj:`DNSBL_NOT_LISTED` or an error), the
+    ``ret_code`` (the address of the answer) and the ``ttl`` of the answer.
+
+    The answer ``NXDOMAIN`` (or no data) is *not listed*, other DNS errors
+    (e.g. a timeout) are a ``lookup error``.
+    """
+    result = {
+        "ip": ip,
+        "zone": dns_zone,
+        "result": None,
+        "ret_code": None,
+        "ttl": None,
+        "cached": False,
+    }
+    try:
+        hostname = dnsxl_hostname(ip, dns_zone)
+    except ValueError:
+        result["result"] = "invalid address"
+        return result
+    try:
+        answers = await resolver.query(hostname, "A")
+    except aiodns.error.DNSError as exc:
+        if exc.args[0] in (aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENODATA):
+            result.update(result=DNSBL_NOT_LISTED, ret_code="NXDOMAIN")
+        else:
+            result.update(result="lookup error", ret_code=exc.args[-1])
+        return result
+    ret_code = answers[0].host
+    result.update(
+        result=DNSBL_ZONES[dns_zone]["result"].get(ret_code, "dnsbl error"),
+        ret_code=ret_code,
+        ttl=answers[0].ttl,
+    )
+    return result
+
+
 def dnsxl_hostname(ip: str, dns_zone: str):
     """Generates a *hostname* for the IP that can be used in a DNSxL query
     (:rfc:`5782`).
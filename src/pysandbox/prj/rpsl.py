@@ -0,0 +1,361 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Streaming RPSL parser and the origin index (ASN → networks) of IRR dumps"""
+
+from __future__ import annotations
+from typing import IO, Iterable, Iterator
+from array import array
+from ipaddress import IPv4Network, IPv6Network
+import bisect
+import contextlib
+import itertools
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from .iplists import IPV4_BITS, IPV6_BITS, iter_blocks, str_to_network
+from .iplists.cidrset import U32, atomic_write
+from .iplists.compressed import MAGIC_SIZE, compression, open_decompressed
+
+log = logging.getLogger(__name__)
+
+
+ORIGIN_INDEX_MAGIC = b"PYSBORIG"
+ORIGIN_INDEX_VERSION = 1
+ORIGIN_INDEX_HEADER = struct.Struct("<8sH6xQQQ")
+"""Header of an origin index file: magic, version, number of ASN, number of
+IPv4 and number of IPv6 networks (see :py:obj:`build_origin_index`)."""
+
+ORIGIN_INDEX_SUFFIX = ".idx"
+"""Suffix of the origin index that is built next to a dump by
+:py:obj:`open_origin_index`."""
+
+_IPV6_NET = struct.Struct("<QQ")
+
+
+class OriginIndexError(Exception):
+    """Exception when an origin index file can't be read."""
+
+
+def iter_whois_objects(
+    chunks: Iterable[bytes],
+    attributes: Iterable[str] | None = None,
+    no_entries: str | None = None,
+) -> Iterator[dict[str, list[str]]]:
+    """Parse the RPSL objects of a WHOIS response or a dump from the blocks of
+    bytes in ``chunks`` (e.g. from :py:obj:`iter_whois_query
+    <.whois.iter_whois_query>`) and yield each object as
+    soon as it is complete.  Only the ``attributes`` (default: all) of the
+    objects are collected (``{name: [value, ..]}``, lower case names), objects
+    without one of the ``attributes`` are skipped.  The memory used does not
+    depend on the size of the response.
+
+    The lines are split in bytes and decoded one by one, a multibyte character
+    can't be split at the end of a block.  Lines with a comment (``%`` or
+    ``#``) are ignored, the response ends at the message ``no_entries`` (e.g.
+    ``no entries found``, the ``no entries`` of the WHOIS host setup).
+    """
+    attributes = None if attributes is None else {name.lower() for name in attributes}
+    obj: dict[str, list[str]] = {}
+    field = None
+    rest = b""
+
+    for chunk in itertools.chain(chunks, [b"\n"]):
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            line = line.decode("utf-8", errors="replace").rstrip("\r")
+            if not line.strip():
+                if obj:
+                    yield obj
+                obj, field = {}, None
+                continue
+            if line[0] in "%#":
+                if no_entries and no_entries in line.lower():
+                    log.info("WHOIS response: %s", line)
+                    return
+                continue
+            if line[0] in " \t+":
+                value = line[1:].strip()
+            else:
+                name, sep, value = line.partition(":")
+                if not sep:
+                    continue
+                field, value = name.strip().lower(), value.strip()
+                if attributes is not None and field not in attributes:
+                    field = None
+            if field is not None:
+                obj.setdefault(field, []).append(value)
+    if obj:
+        yield obj
+
+
+def iter_dump_routes(stream: IO) -> Iterator[tuple[int, int, int, int]]:
+    """Parse the route and route6 objects of a RPSL dump (binary ``stream``,
+    see :py:obj:`iter_whois_objects`), yields ``(asn, bits, network,
+    prefixlen)`` for each route.  Objects with an invalid ``origin`` or an
+    invalid network are skipped."""
+    chunks = iter_blocks(stream)
+    for obj in iter_whois_objects(
+        chunks, ("route", "route6", "origin"), no_entries=None
+    ):
+        origins = obj.get("origin")
+        if not origins:
+            continue
+        asn = asn_number(origins[0])
+        if asn is None:
+            continue
+        for value in obj.get("route", []) + obj.get("route6", []):
+            try:
+                bits, net, prefixlen = str_to_network(value.split("#", 1)[0])
+            except ValueError:
+                log.debug("invalid route of AS%s: %r", asn, value)
+                continue
+            yield asn, bits, net, prefixlen
+
+
+def asn_number(text: str) -> int | None:
+    """Number of the ASN in ``text`` (``AS3333``, ``3333`` or asdot
+    ``AS1.10``), ``None`` if ``text`` is not an ASN."""
+    text = text.split("#", 1)[0].strip().upper().removeprefix("AS")
+    high, _, low = text.rpartition(".")
+    try:
+        asn = (int(high) << 16) + int(low) if high else int(low)
+    except ValueError:
+        return None
+    return asn if 0 <= asn < 1 << 32 else None
+
+
+@contextlib.contextmanager
+def open_dump(path: str) -> Iterator[IO]:
+    """Open the (compressed) dump in ``path`` as a binary stream."""
+    with open(path, "rb") as f:
+        fmt = compression(f.peek(MAGIC_SIZE)[:MAGIC_SIZE])
+        if fmt is None:
+            yield f
+            return
+    with open_decompressed(path, fmt) as text:
+        yield text.buffer
+
+
+# pylint: disable-next=too-many-locals
+def build_origin_index(dumps: Iterable[str], path: str) -> tuple[int, int, int]:
+    """Build the origin index file ``path`` from the RPSL ``dumps`` (names of
+    the dump files, see :py:obj:`open_dump` and :py:obj:`iter_dump_routes`),
+    the file is replaced atomically.  Returns the number of ASN, IPv4 and IPv6
+    networks in the index.
+
+    The index file starts with a header (:py:obj:`ORIGIN_INDEX_HEADER`)
+    followed by:
+
+    - the sorted ASN (32 bit words)
+    - the start of the IPv4 and of the IPv6 networks of each ASN (32 bit words,
+      ``number of ASN + 1`` each)
+    - the IPv4 networks (32 bit words) and the IPv6 networks (two 64 bit
+      words: high, low)
+    - the prefix lengths of the IPv4 and of the IPv6 networks (bytes)
+
+    All values are little endian, the arrays are used directly from the memory
+    mapped file (:py:obj:`OriginIndex`).  Duplicate routes (e.g. a network
+    registered by more than one maintainer) are stored once.
+    """
+    routes: dict[int, dict[int, set[tuple[int, int]]]] = {}
+    for dump in dumps:
+        log.info("read RPSL dump %s", dump)
+        with open_dump(dump) as stream:
+            for asn, bits, net, prefixlen in iter_dump_routes(stream):
+                routes.setdefault(asn, {IPV4_BITS: set(), IPV6_BITS: set()})[bits].add(
+                    (net, prefixlen)
+                )
+
+    asns = array(U32, sorted(routes))
+    starts = {IPV4_BITS: array(U32, [0]), IPV6_BITS: array(U32, [0])}
+    nets = {IPV4_BITS: array(U32), IPV6_BITS: array("Q")}
+    prefixlens = {IPV4_BITS: array("B"), IPV6_BITS: array("B")}
+    for asn in asns:
+        for bits, items in routes.pop(asn).items():
+            for net, prefixlen in sorted(items):
+                if bits == IPV4_BITS:
+                    nets[bits].append(net)
+                else:
+                    nets[bits].extend((net >> 64, net & 0xFFFFFFFFFFFFFFFF))
+                prefixlens[bits].append(prefixlen)
+            starts[bits].append(len(prefixlens[bits]))
+
+    counts = len(asns), len(prefixlens[IPV4_BITS]), len(prefixlens[IPV6_BITS])
+    with atomic_write(path, "wb") as f:
+        f.write(
+            ORIGIN_INDEX_HEADER.pack(ORIGIN_INDEX_MAGIC, ORIGIN_INDEX_VERSION, *counts)
+        )
+        for words in (
+            asns,
+            starts[IPV4_BITS],
+            starts[IPV6_BITS],
+            nets[IPV4_BITS],
+            nets[IPV6_BITS],
+        ):
+            if sys.byteorder == "big":
+                words.byteswap()
+            f.write(words)
+        f.write(prefixlens[IPV4_BITS])
+        f.write(prefixlens[IPV6_BITS])
+    return counts
+
+
+def open_origin_index(path: str) -> OriginIndex:
+    """Open the origin index in ``path``.  If ``path`` is a RPSL dump (not an
+    index), the index is built next to the dump (:py:obj:`ORIGIN_INDEX_SUFFIX`)
+    and it is built again when the dump is newer than the index."""
+    with open(path, "rb") as f:
+        is_index = f.read(len(ORIGIN_INDEX_MAGIC)) == ORIGIN_INDEX_MAGIC
+    if is_index:
+        return OriginIndex(path)
+    index = path + ORIGIN_INDEX_SUFFIX
+    if not os.path.exists(index) or os.path.getmtime(index) < os.path.getmtime(path):
+        log.warning("build origin index %s from RPSL dump %s", index, path)
+        build_origin_index([path], index)
+    return OriginIndex(index)
+
+
+class OriginIndex:  # pylint: disable=too-many-instance-attributes
+    """Lookup of the networks of ASN in an origin index file (see
+    :py:obj:`build_origin_index`).  The file is memory mapped, an ASN is found
+    by a binary search, only the networks of the looked up ASN are read.
+
+    .. code:: python
+
+       with OriginIndex("radb.idx") as index:
+           ipv4_list, ipv6_list = index.asn_networks(["AS41947", "40193"])
+
+    :param path: name of the origin index file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:  # empty file
+                raise OriginIndexError(f"{path}: not an origin index") from exc
+        self._views: list[memoryview] = []
+        try:
+            self._map_arrays()
+        except OriginIndexError:
+            self.close()
+            raise
+
+    def _map_arrays(self):
+        if len(self._mmap) < ORIGIN_INDEX_HEADER.size:
+            raise OriginIndexError(f"{self.path}: not an origin index")
+        magic, version, count_asn, count_ipv4, count_ipv6 = (
+            ORIGIN_INDEX_HEADER.unpack_from(self._mmap)
+        )
+        if magic != ORIGIN_INDEX_MAGIC or version != ORIGIN_INDEX_VERSION:
+            raise OriginIndexError(
+                f"{self.path}: not an origin index (version {ORIGIN_INDEX_VERSION})"
+            )
+        if (
+            len(self._mmap)
+            != ORIGIN_INDEX_HEADER.size
+            + 12 * count_asn
+            + 8
+            + 5 * count_ipv4
+            + 17 * count_ipv6
+        ):
+            raise OriginIndexError(f"{self.path}: origin index is truncated")
+
+        offset = ORIGIN_INDEX_HEADER.size
+        self._asns = self._u32_array(offset, count_asn)
+        offset += 4 * count_asn
+        self._starts = {}
+        for bits in (IPV4_BITS, IPV6_BITS):
+            self._starts[bits] = self._u32_array(offset, count_asn + 1)
+            offset += 4 * (count_asn + 1)
+        self._ipv4_nets = self._u32_array(offset, count_ipv4)
+        offset += 4 * count_ipv4
+        self._ipv6_offset = offset
+        offset += 16 * count_ipv6
+        self._prefixlens = {}
+        for bits, count in ((IPV4_BITS, count_ipv4), (IPV6_BITS, count_ipv6)):
+            self._prefixlens[bits] = self._view(offset, count)
+            offset += count
+
+    def _view(self, offset: int, size: int) -> memoryview:
+        view = memoryview(self._mmap)[offset : offset + size]
+        self._views.append(view)
+        return view
+
+    def _u32_array(self, offset: int, count: int):
+        view = self._view(offset, 4 * count)
+        if sys.byteorder == "little":
+            view = view.cast(U32)
+            self._views.append(view)
+            return view
+        words = array(U32, view)
+        words.byteswap()
+        return words
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the memory mapped file."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return len(self._asns)
+
+    def __contains__(self, asn: str | int) -> bool:
+        return self._position(asn) is not None
+
+    def _position(self, asn: str | int) -> int | None:
+        asn = asn_number(asn) if isinstance(asn, str) else asn
+        if asn is None:
+            return None
+        i = bisect.bisect_left(self._asns, asn)
+        if i < len(self._asns) and self._asns[i] == asn:
+            return i
+        return None
+
+    def networks(self, asn: str | int) -> tuple[list[IPv4Network], list[IPv6Network]]:
+        """IPv4 and IPv6 networks of the ``asn``, empty lists if the ASN is not
+        in the index."""
+        i = self._position(asn)
+        if i is None:
+            return [], []
+        ipv4_list = [
+            IPv4Network((self._ipv4_nets[j], self._prefixlens[IPV4_BITS][j]))
+            for j in range(self._starts[IPV4_BITS][i], self._starts[IPV4_BITS][i + 1])
+        ]
+        ipv6_list = []
+        for j in range(self._starts[IPV6_BITS][i], self._starts[IPV6_BITS][i + 1]):
+            high, low = _IPV6_NET.unpack_from(self._mmap, self._ipv6_offset + 16 * j)
+            ipv6_list.append(
+                IPv6Network(((high << 64) | low, self._prefixlens[IPV6_BITS][j]))
+            )
+        return ipv4_list, ipv6_list
+
+    def asn_networks(
+        self, asn_list: Iterable[str | int]
+    ) -> tuple[list[IPv4Network], list[IPv6Network]]:
+        """Networks of the ASN in the ``asn_list`` in the order of the list
+        (like :py:obj:`asn_networks <.whois.asn_networks>`)."""
+        ipv4_list, ipv6_list = [], []
+        for asn in asn_list:
+            ipv4, ipv6 = self.networks(asn)
+            ipv4_list.extend(ipv4)
+            ipv6_list.extend(ipv6)
+        return ipv4_list, ipv6_list
+
+    def __repr__(self):
+        return (
+            f"<OriginIndex {self.path} ASN: {len(self._asns)},"
+            f" IPv4: {len(self._ipv4_nets)}, IPv6: {len(self._prefixlens[IPV6_BITS])}>"
+        )
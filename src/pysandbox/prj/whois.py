@@ -1,21 +1,40 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 """WHOIS tools"""
 
+# pylint: disable=too-many-lines
+
 # https://github.com/secynic/ipwhois is no longer maintained
 
 from __future__ import annotations
+from typing import Iterator
 
 import copy
+import functools
+import itertools
+import random
 import socket
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ipaddress import ip_network, IPv4Network, IPv6Network
 import json
 
 import requests
 import click
-from netaddr import cidr_merge
 
 from ._cli import prj
+from .cache import CACHE_MAX_ENTRIES, SQLiteCache, cache_path
+from .rpsl import (
+    OriginIndexError,
+    build_origin_index,
+    iter_whois_objects,
+    open_origin_index,
+)
+from .iplists import IPV4_BITS, IPV6_BITS, merge_networks, str_to_network
+from .iplists.cidrset import atomic_write
+from .iplists.formats import FORMATS, NFT_TABLE, write_networks
 
 log = logging.getLogger(__name__)
 
@@ -26,34 +45,278 @@ def whois():
 
 
 @whois.command("asn-cidr")
+@click.option(
+    "--connections",
+    type=click.IntRange(min=1),
+    default=None,
+    help="max. concurrent queries to a WHOIS server  [default: 8]",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(["auto", "irrd", "rpsl"]),
+    default=None,
+    help="query mode (irrd: persistent pipelined connection, rpsl: -i origin)  [default: auto]",
+)
+@click.option(
+    "--cache-ttl",
+    type=int,
+    show_default=True,
+    default=24 * 3600,
+    help="seconds the networks of an ASN are cached",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="query all ASN (don't read the cache) and update the cache",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="use the cache only (also expired entries), no queries",
+)
+@click.option("--no-cache", is_flag=True, default=False, help="don't use the cache")
+@click.option(
+    "--source",
+    show_default=True,
+    default="whois",
+    help="whois: query the WHOIS_HOSTS, dump:<path>: origin index or RPSL dump (see dump-index)",
+)
+@click.option(
+    "--hosts",
+    default=None,
+    help="comma separated list of WHOIS_HOSTS to query  [default: all]",
+)
+@click.option(
+    "--deadline",
+    type=click.FloatRange(min=0, min_open=True),
+    show_default=True,
+    default=30.0,
+    help="seconds to wait for all hosts, hosts without a result are reported and skipped",
+)
+@click.option(
+    "--merge",
+    is_flag=True,
+    default=False,
+    help="print also the merged union of the networks of all hosts",
+)
 @click.argument("asn", nargs=-1)
-def _asn_cidr(asn):
+def _asn_cidr(  # pylint: disable=too-many-locals,too-many-arguments,too-many-positional-arguments
+    connections,
+    mode,
+    cache_ttl,
+    refresh,
+    offline,
+    no_cache,
+    source,
+    hosts,
+    deadline,
+    merge,
+    asn,
+):
     """ASN origin lookups (CIDR)
 
     usage::
 
       $ whois asn-cidr AS41947 AS40193 35718 38337 39720 39770
 
+    The WHOIS hosts are queried concurrently, the networks of a host are
+    printed as soon as they arrive.  Hosts that have not answered within the
+    ``--deadline`` (or whose queries failed) are reported at the end (see
+    :py:obj:`asn_networks_hosts`).  With ``--merge`` the networks of all hosts
+    are merged into the smallest list of CIDR subnets::
+
+      $ whois asn-cidr --hosts RADB,RIPE,ARIN --deadline 10 --merge AS41947
+
+    The networks of an ASN are cached (``--cache-ttl``, see :py:obj:`ASNCache`),
+    with ``--offline`` only the cache is used.  With ``--source=dump:<path>``
+    the networks are looked up in a local origin index, no queries are sent
+    (see :py:obj:`OriginIndex <.rpsl.OriginIndex>`)::
+
+      $ whois asn-cidr --source dump:radb.db.gz AS41947 AS40193
     """
 
-    for whois_host in WHOIS_HOSTS:
-        ipv4_list, ipv6_list = asn_networks(asn, whois_host)
-        click.echo(f"# {whois_host} ..")
-        for item in ipv4_list:
+    if source != "whois":
+        with _origin_index(source) as index:
+            ipv4_list, ipv6_list = index.asn_networks(asn)
+        click.echo(f"# {source} ..")
+        for item in ipv4_list + ipv6_list:
             click.echo(item)
+        return
+
+    whois_hosts = _whois_hosts(hosts)
+    networks = {IPV4_BITS: [], IPV6_BITS: []}
+    failed = []
+    cache = _asn_cache(cache_ttl, refresh, offline, no_cache)
+    try:
+        for whois_host, result, exc in asn_networks_hosts(
+            asn, whois_hosts, deadline, connections=connections, mode=mode, cache=cache
+        ):
+            if exc is not None:
+                failed.append(whois_host)
+                click.echo(f"# {whois_host}: {exc}", err=True)
+                continue
+            click.echo(f"# {whois_host} ..")
+            for bits, items in zip((IPV4_BITS, IPV6_BITS), result):
+                for item in items:
+                    click.echo(item)
+                networks[bits].extend(
+                    (int(item.network_address), item.prefixlen) for item in items
+                )
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if merge:
+        click.echo(
+            f"# merged {len(whois_hosts) - len(failed)} of {len(whois_hosts)} hosts .."
+        )
+        for bits, items in networks.items():
+            for net, prefixlen in merge_networks(items, bits):
+                click.echo(ip_network((net, prefixlen)))
+    if failed:
+        raise click.ClickException(
+            f"no result from {len(failed)} of {len(whois_hosts)} WHOIS hosts"
+        )
+
+
+def _whois_hosts(hosts: str | None) -> list[str]:
+    if hosts is None:
+        return list(WHOIS_HOSTS)
+    whois_hosts = [host.strip() for host in hosts.split(",") if host.strip()]
+    unknown = [host for host in whois_hosts if host not in WHOIS_HOSTS]
+    if unknown or not whois_hosts:
+        raise click.BadParameter(
+            f"unknown WHOIS hosts: {', '.join(unknown) or repr(hosts)}",
+            param_hint="--hosts",
+        )
+    return whois_hosts
 
-        for item in ipv6_list:
-            click.echo(item)
+
+def _asn_cache(cache_ttl, refresh, offline, no_cache) -> ASNCache | None:
+    if refresh and offline:
+        raise click.UsageError("--refresh and --offline can't be combined")
+    if no_cache:
+        if offline:
+            raise click.UsageError("--offline needs the cache")
+        return None
+    return ASNCache(ttl=cache_ttl, refresh=refresh, offline=offline)
+
+
+def _resolve_asn(
+    asn_list, source, connections, mode, cache
+) -> dict[str, tuple[list[str], list[str]]]:
+    # networks (as strings) of each ASN, from RADB or from an origin index
+    if not asn_list:
+        return {}
+    if source != "whois":
+        with _origin_index(source) as index:
+            results = {asn: index.networks(asn) for asn in asn_list}
+    else:
+        try:
+            results = asn_networks_dict(
+                asn_list, "RADB", connections=connections, mode=mode, cache=cache
+            )
+        finally:
+            if cache is not None:
+                cache.close()
+    return {
+        asn: ([str(net) for net in ipv4], [str(net) for net in ipv6])
+        for asn, (ipv4, ipv6) in results.items()
+    }
+
+
+def _origin_index(source: str):
+    if not source.startswith("dump:"):
+        raise click.BadParameter(
+            f"{source!r} is not 'whois' or 'dump:<path>'", param_hint="--source"
+        )
+    try:
+        return open_origin_index(source[len("dump:") :])
+    except (OSError, OriginIndexError) as exc:
+        raise click.BadParameter(str(exc), param_hint="--source") from exc
 
 
 @whois.command("ASN-DROP")
 @click.option(
-    "--merge", is_flag=True, default=True, help="merge IPs and subnets to smallest possible list of CIDR subnets"
+    "--merge",
+    is_flag=True,
+    default=True,
+    help="merge IPs and subnets to smallest possible list of CIDR subnets",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(FORMATS),
+    show_default=True,
+    default="text",
+    help="format of the lists (ipset restore, nft -f, packed binary LPM prefixes)",
+)
+@click.option(
+    "--set-name",
+    show_default=True,
+    default="spamhaus_asn_drop",
+    help="--format: name of the set (+ _v4/_v6)",
+)
+@click.option(
+    "--nft-table",
+    show_default=True,
+    default=NFT_TABLE,
+    help="--format=nft: table of the set",
+)
+@click.option(
+    "--connections",
+    type=click.IntRange(min=1),
+    default=None,
+    help="max. concurrent queries to a WHOIS server  [default: 8]",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(["auto", "irrd", "rpsl"]),
+    default=None,
+    help="query mode (irrd: persistent pipelined connection, rpsl: -i origin)  [default: auto]",
+)
+@click.option(
+    "--cache-ttl",
+    type=int,
+    show_default=True,
+    default=24 * 3600,
+    help="seconds the networks of an ASN are cached",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="query all ASN (don't read the cache) and update the cache",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    default=False,
+    help="use the cache only (also expired entries), no queries",
+)
+@click.option("--no-cache", is_flag=True, default=False, help="don't use the cache")
+@click.option(
+    "--source",
+    show_default=True,
+    default="whois",
+    help="whois: query RADB, dump:<path>: origin index or RPSL dump (see dump-index)",
 )
 @click.argument("asn", nargs=-1)
-def _asn_drop(
+def _asn_drop(  # pylint: disable=too-many-locals,too-many-arguments,too-many-positional-arguments,unused-argument
     asn,
     merge,
+    connections,
+    mode,
+    cache_ttl,
+    refresh,
+    offline,
+    no_cache,
+    source,
+    output_format,
+    set_name,
+    nft_table,
 ):
     """Spamhaus ASN-DROP List (CIDR)
 
@@ -63,40 +326,128 @@ def _asn_drop(
       write IPv4 networks to ipv4_spamhaus_ASN-DROP.lst
       write IPv6 networks to ipv6_spamhaus_ASN-DROP.lst
 
+    With ``--format`` the lists are written in a format for the firewall (the
+    file extension is the name of the format)::
+
+      $ whois ASN-DROP --format=nft
+      write IPv4 networks to ipv4_spamhaus_ASN-DROP.nft
+      write IPv6 networks to ipv6_spamhaus_ASN-DROP.nft
+      $ nft -f ipv4_spamhaus_ASN-DROP.nft
+
+    The ASN are queried concurrently, ``--connections`` limits the number of
+    queries sent at once to the WHOIS server (see :py:obj:`asn_networks`).  RADB
+    is an IRRd server, by default the prefixes of the ASN are queried over one
+    persistent connection (``--mode=irrd``).  The networks of an ASN are cached
+    for a day (``--cache-ttl``), a repeated run sends no queries to RADB.
+
+    With ``--source=dump:<path>`` the networks of all ASN are looked up in one
+    pass in a local origin index built from the RADB dump (see ``dump-index``)::
+
+      $ curl -O https://ftp.radb.net/radb/dbase/radb.db.gz
+      $ whois ASN-DROP --source dump:radb.db.gz
+
+    The ETag and the date of the ASN-DROP feed and the networks of its ASN are
+    stored next to the lists (:py:obj:`ASN_DROP_STATE`).  The feed is requested
+    conditionally, if it has not been modified the lists are written from the
+    stored networks, otherwise only the ASN that have been added to the feed
+    are resolved.  ``--refresh`` fetches the feed and resolves all ASN again.
     """
-    ipv4_file = "ipv4_spamhaus_ASN-DROP.lst"
-    ipv6_file = "ipv6_spamhaus_ASN-DROP.lst"
+    ext = {"text": "lst", "binary": "bin"}.get(output_format, output_format)
+    ipv4_file = f"ipv4_spamhaus_ASN-DROP.{ext}"
+    ipv6_file = f"ipv6_spamhaus_ASN-DROP.{ext}"
 
-    url = "https://www.spamhaus.org/drop/asndrop.json"
-    headers = {"accept": "application/json"}
-    resp = requests.get(url, headers=headers, timeout=3)
-    resp.raise_for_status()
+    state = {} if refresh else load_asn_drop_state(ASN_DROP_STATE)
+    if state.get("source") != source:
+        state = {}
+    known = state.get("networks", {})
 
-    asn_list = []
-    for line in resp.text.split("\n"):
-        line = line.strip()
-        if not line:
-            continue
-        asn = json.loads(line).get("asn")
-        if not asn:
-            continue
-        asn_list.append(str(asn))
+    with requests.Session() as session:
+        feed = fetch_asn_drop(
+            session, etag=state.get("etag"), last_modified=state.get("last_modified")
+        )
+
+    if feed is None:
+        asn_list = list(known)
+        since = state.get("last_modified") or state.get("etag")
+        click.echo(f"ASN-DROP not modified since {since}: {len(asn_list)} ASN")
+    else:
+        asn_list, etag, last_modified = feed
+        added = [item for item in asn_list if item not in known]
+        removed = set(known) - set(asn_list)
+        click.echo(
+            f"ASN-DROP: {len(asn_list)} ASN, {len(added)} added, {len(removed)} removed"
+        )
+        cache = (
+            _asn_cache(cache_ttl, refresh, offline, no_cache)
+            if added and source == "whois"
+            else None
+        )
+        resolved = _resolve_asn(added, source, connections, mode, cache)
+        known.update(resolved)
+        known = {item: known[item] for item in asn_list if item in known}
+        save_asn_drop_state(
+            ASN_DROP_STATE,
+            {
+                "source": source,
+                "etag": etag,
+                "last_modified": last_modified,
+                "networks": known,
+            },
+        )
 
-    ipv4_list, ipv6_list = asn_networks(asn_list, "RADB")
+    pairs = {IPV4_BITS: [], IPV6_BITS: []}
+    for ipv4, ipv6 in known.values():
+        for item in ipv4 + ipv6:
+            bits, net, prefixlen = str_to_network(item)
+            pairs[bits].append((net, prefixlen))
+    ipv4_list, ipv6_list = pairs[IPV4_BITS], pairs[IPV6_BITS]
 
     if merge:
-        ipv4_list = cidr_merge([str(ip) for ip in ipv4_list])
-        ipv6_list = cidr_merge([str(ip) for ip in ipv6_list])
+        ipv4_list = merge_networks(ipv4_list, IPV4_BITS)
+        ipv6_list = merge_networks(ipv6_list, IPV6_BITS)
+
+    mode = "wb" if output_format == "binary" else "w"
+    encoding = None if output_format == "binary" else "utf-8"
+    for bits, fname, networks in (
+        (IPV4_BITS, ipv4_file, ipv4_list),
+        (IPV6_BITS, ipv6_file, ipv6_list),
+    ):
+        click.echo(f"write IPv{4 if bits == IPV4_BITS else 6} networks to {fname}")
+        with open(fname, mode, encoding=encoding) as f:
+            write_networks(
+                f, {bits: networks}, fmt=output_format, name=set_name, table=nft_table
+            )
 
-    click.echo(f"write IPv4 networks to {ipv4_file}")
-    with open(ipv4_file, "w", encoding="utf-8") as f:
-        for ip in ipv4_list:
-            f.write(f"{ip}\n")
 
-    click.echo(f"write IPv6 networks to {ipv6_file}")
-    with open(ipv6_file, "w", encoding="utf-8") as f:
-        for ip in ipv6_list:
-            f.write(f"{ip}\n")
+@whois.command("dump-index")
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="origin index file",
+)
+@click.argument(
+    "dumps", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+def _dump_index(output, dumps):
+    """Build an origin index from RPSL dumps (route & route6 objects)
+
+    usage::
+
+      $ curl -O https://ftp.radb.net/radb/dbase/radb.db.gz
+      $ whois dump-index -o radb.idx radb.db.gz
+      $ whois asn-cidr --source dump:radb.idx AS41947 AS40193
+      $ whois ASN-DROP --source dump:radb.idx
+
+    The dumps can be compressed (gzip, xz, bzip2, zstd), the route objects of
+    all dumps are merged into one index (e.g. the split ``route`` and
+    ``route6`` dumps of RIPE).
+    """
+    count_asn, count_ipv4, count_ipv6 = build_origin_index(dumps, output)
+    click.echo(
+        f"{output}: {count_asn} ASN, {count_ipv4} IPv4 and {count_ipv6} IPv6 networks"
+    )
 
 
 # implementations
@@ -106,11 +457,37 @@ def _asn_drop(
 
 WHOIS_DEFAULTS = {
     "no entries": "no entries found",
-    "timeout": 10,
+    "timeout": 10,  # seconds for one query (connect, send & receive)
+    "connections": 8,  # max. number of concurrent connections to the server
+    "retries": 3,
+    "backoff": 1.0,  # seconds to wait before the first retry, doubled for each retry
+    "mode": "auto",  # query mode, see WHOIS_MODES
 }
 
+WHOIS_MODES = ("auto", "irrd", "rpsl")
+"""Query modes of :py:obj:`asn_networks`: ``irrd`` queries the prefixes of the
+ASN over one persistent connection (:py:obj:`IRRdSession`), ``rpsl`` sends a
+``-i origin`` query for each ASN and ``auto`` tries ``irrd`` first and falls
+back to ``rpsl`` if the server does not support IRRd queries."""
+
+IRRD_BATCH = 64
+"""Number of ASN queried at once (pipelined) over an IRRd connection."""
+
+WHOIS_RECV_SIZE = 64 * 1024
+"""Maximum number of bytes received at once from a WHOIS server."""
+
+WHOIS_CACHE_TTL = 24 * 3600
+"""Default time (seconds) the networks of an ASN are cached (:py:obj:`ASNCache`)."""
+
+ASN_DROP_URL = "https://www.spamhaus.org/drop/asndrop.json"
+ASN_DROP_TIMEOUT = 10  # seconds to wait for data of the feed
+
+ASN_DROP_STATE = "spamhaus_ASN-DROP.state.json"
+"""File (next to the ASN-DROP lists) with the ETag and date of the ASN-DROP
+feed and the networks of its ASN (see :py:obj:`fetch_asn_drop`)."""
+
 WHOIS_HOSTS = {
-    "AFRINIC": {"server": "whois.afrinic.net", "port": 43},
+    "AFRINIC": {"server": "whois.afrinic.net", "port": 43, "mode": "rpsl"},
     "ALTDB": {
         "server": "whois.altdb.net",
         "port": 43,
@@ -118,6 +495,7 @@ WHOIS_HOSTS = {
     "APNIC": {
         "server": "whois.apnic.net",
         "port": 43,
+        "mode": "rpsl",
     },
     "ARIN": {
         "server": "rr.arin.net",
@@ -174,6 +552,7 @@ WHOIS_HOSTS = {
     "RIPE": {
         "server": "whois.ripe.net",
         "port": 43,  # 4444, RIPE near real time mirror
+        "mode": "rpsl",
     },
     "TC": {
         "server": "whois.bgp.net.br",
@@ -186,98 +565,546 @@ class WhoisLookupError(Exception):
     """Exception when a WHOIS query fails."""
 
 
-def asn_networks(asn_list: list[str], whois_host: str) -> tuple[list, list]:
-    """get networks of ASN in the ``asn_list``"""
+class IRRdNotSupported(WhoisLookupError):
+    """Exception when a WHOIS server does not answer IRRd queries."""
 
-    ipv4_list, ipv6_list = [], []
 
+def fetch_asn_drop(
+    session: requests.Session, etag: str | None = None, last_modified: str | None = None
+) -> tuple[list[str], str | None, str | None] | None:
+    """Fetch the Spamhaus ASN-DROP feed (:py:obj:`ASN_DROP_URL`), returns the
+    ASN of the feed (``AS<number>``) and the ``ETag`` and ``Last-Modified`` of
+    the response.  With ``etag`` or ``last_modified`` (of the last fetch) the
+    feed is requested conditionally, ``None`` is returned if it has not been
+    modified.  The feed (one JSON object per line) is parsed while it is
+    received."""
+    headers = {"accept": "application/json"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with session.get(
+        ASN_DROP_URL, headers=headers, timeout=ASN_DROP_TIMEOUT, stream=True
+    ) as resp:
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        asn_list = []
+        for line in resp.iter_lines():
+            if not line.strip():
+                continue
+            asn = json.loads(line).get("asn")
+            if asn:
+                asn_list.append(f"AS{asn}")
+        return asn_list, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+
+def load_asn_drop_state(path: str) -> dict:
+    """Load the state of the ASN-DROP lists (:py:obj:`ASN_DROP_STATE`), an empty
+    dictionary if there is no (valid) state."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        log.warning("ignore state of the ASN-DROP lists %s: %s", path, exc)
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def save_asn_drop_state(path: str, state: dict):
+    """Save the state of the ASN-DROP lists, the file is replaced atomically."""
+    with atomic_write(path, "w") as f:
+        json.dump(state, f)
+
+
+def whois_host_setup(whois_host: str, **kwargs) -> dict:
+    """Setup of the ``whois_host`` (:py:obj:`WHOIS_HOSTS`) completed by the
+    :py:obj:`WHOIS_DEFAULTS`, the ``kwargs`` (not ``None``) overwrite values of
+    the setup."""
+    host_setup = copy.deepcopy(WHOIS_DEFAULTS)
+    host_setup.update(WHOIS_HOSTS[whois_host])
+    host_setup.update({k: v for k, v in kwargs.items() if v is not None})
+    return host_setup
+
+
+def asn_networks(
+    asn_list: list[str],
+    whois_host: str,
+    connections: int | None = None,
+    mode: str | None = None,
+    cache: ASNCache | None = None,
+) -> tuple[list, list]:
+    """get networks of ASN in the ``asn_list``
+
+    In the query ``mode`` (default: ``mode`` of the host setup, see
+    :py:obj:`WHOIS_MODES`) ``irrd`` the networks are queried by
+    :py:obj:`asn_origin_irrd`.
+
+    In the ``rpsl`` mode the ASN are queried concurrently in a pool of threads,
+    not more than ``connections`` (default: ``connections`` of the host setup)
+    queries are sent to the WHOIS server at once.  If the lookup of one ASN
+    fails (after the retries of :py:obj:`asn_origin_cidr`) the pending lookups
+    are canceled and the :py:obj:`WhoisLookupError` is raised.
+
+    With a ``cache`` only the ASN that are not in the cache are queried, the
+    results of the queries are stored in the cache.
+
+    The networks are returned in the order of the ``asn_list``.
+    """
+
+    ipv4_list, ipv6_list = [], []
+    results = asn_networks_dict(
+        asn_list, whois_host, connections=connections, mode=mode, cache=cache
+    )
     for asn in asn_list:
-        ipv4, ipv6 = asn_origin_cidr(asn, whois_host)
+        ipv4, ipv6 = results.get(asn if asn.startswith("AS") else "AS" + asn, ([], []))
         ipv4_list.extend(ipv4)
         ipv6_list.extend(ipv6)
 
     return ipv4_list, ipv6_list
 
 
-def asn_origin_cidr(asn: str, whois_host: str) -> tuple[list[IPv4Network], list[IPv6Network]]:
-    """returns the CIDR of an ASN"""
-    ipv4_list, ipv6_list = [], []
+def asn_networks_dict(
+    asn_list: list[str],
+    whois_host: str,
+    connections: int | None = None,
+    mode: str | None = None,
+    cache: ASNCache | None = None,
+) -> dict[str, tuple[list, list]]:
+    """get networks of each ASN in the ``asn_list`` (see :py:obj:`asn_networks`),
+    returns ``{"AS<number>": (ipv4_list, ipv6_list)}``.  In the ``offline`` mode
+    of the ``cache`` the ASN that are not in the cache are missing."""
 
-    host_setup = copy.deepcopy(WHOIS_DEFAULTS)
-    host_setup.update(WHOIS_HOSTS[whois_host])
+    host_setup = whois_host_setup(whois_host, connections=connections, mode=mode)
+    asn_list = [asn if asn.startswith("AS") else "AS" + asn for asn in asn_list]
+
+    results = cache.get_networks(whois_host, asn_list) if cache is not None else {}
+    missing = [asn for asn in dict.fromkeys(asn_list) if asn not in results]
+    if missing and cache is not None and cache.offline:
+        log.warning("%s: %s ASN not in the cache (offline)", whois_host, len(missing))
+        missing = []
+    if missing:
+        queried = dict(zip(missing, _query_networks(missing, whois_host, host_setup)))
+        if cache is not None:
+            cache.set_networks(whois_host, queried)
+        results.update(queried)
+
+    return results
 
-    resp = asn_origin_whois(asn, host_setup=host_setup)
-    fields = parse_whois_resp(resp, host_setup=host_setup)
-    if not fields:
-        return ipv4_list, ipv6_list
 
-    for entry in fields:
-        for item in entry.get("route", []) + entry.get("route6", []):
-            net = ip_network(item, strict=False)
-            if net.version == 4:
-                ipv4_list.append(net)
-            else:
-                ipv6_list.append(net)
+def asn_networks_hosts(
+    asn_list: list[str], whois_hosts: list[str], deadline: float, **kwargs
+) -> Iterator[tuple[str, tuple[list, list] | None, Exception | None]]:
+    """get networks of ASN in the ``asn_list`` from all ``whois_hosts`` at once
+
+    Each host is queried in its own thread (:py:obj:`asn_networks`, the
+    ``kwargs`` are passed through) and ``(whois_host, (ipv4_list, ipv6_list),
+    None)`` is yielded as soon as the networks of a host arrive.  A host whose
+    lookup failed or which has no result within ``deadline`` seconds (from the
+    start) is yielded as ``(whois_host, None, exception)``, the stragglers at
+    the end in the order of ``whois_hosts``.  The wall time is that of the
+    slowest host but not more than ``deadline``.
+
+    The threads of the stragglers are not waited for (daemon threads), they end
+    with the ``timeout`` of their queries.
+    """
+    results: queue.Queue = queue.Queue()
+
+    def lookup(whois_host):
+        try:
+            results.put(
+                (whois_host, asn_networks(asn_list, whois_host, **kwargs), None)
+            )
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            results.put((whois_host, None, exc))
+
+    end = time.monotonic() + deadline
+    for whois_host in whois_hosts:
+        threading.Thread(
+            target=lookup, args=(whois_host,), name=f"whois-{whois_host}", daemon=True
+        ).start()
+
+    pending = set(whois_hosts)
+    while pending:
+        try:
+            item = results.get(timeout=max(end - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        pending.discard(item[0])
+        yield item
+
+    for whois_host in whois_hosts:
+        if whois_host in pending:
+            yield whois_host, None, WhoisLookupError(
+                f"no result within the deadline of {deadline} sec"
+            )
+
+
+def _query_networks(
+    asn_list: list[str], whois_host: str, host_setup: dict
+) -> list[tuple[list, list]]:
+    # networks of each ASN (in the order of the asn_list) from the WHOIS server
+    if host_setup["mode"] in ("auto", "irrd"):
+        try:
+            return asn_origin_irrd(asn_list, host_setup)
+        except IRRdNotSupported as exc:
+            if host_setup["mode"] == "irrd":
+                raise
+            log.info("%s: %s, fall back to RPSL queries", whois_host, exc)
+
+    with ThreadPoolExecutor(max_workers=host_setup["connections"]) as pool:
+        futures = [
+            pool.submit(asn_origin_cidr, asn, whois_host, host_setup)
+            for asn in asn_list
+        ]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def asn_origin_cidr(
+    asn: str, whois_host: str, host_setup: dict | None = None
+) -> tuple[list[IPv4Network], list[IPv6Network]]:
+    """returns the CIDR of an ASN
+
+    A failed query is repeated (``retries`` of the host setup), the time to
+    wait before a retry (``backoff``) is doubled with each retry.  A response
+    without any data is a failed query.  Comments of the routes are stripped
+    and invalid networks are skipped.
+    """
+    if host_setup is None:
+        host_setup = whois_host_setup(whois_host)
+
+    for retry in range(host_setup["retries"] + 1):
+        ipv4_list, ipv6_list = [], []
+        try:
+            with _connection_slots(host_setup["server"], host_setup["connections"]):
+                chunks = iter_whois_query(_origin_query(asn), host_setup)
+                first = next(chunks, None)
+                if first is None:
+                    # the server closed the connection without a response (not
+                    # even the "no entries" message)
+                    raise WhoisLookupError(f"empty WHOIS response of {asn}")
+                chunks = itertools.chain([first], chunks)
+                for obj in iter_whois_objects(
+                    chunks, ("route", "route6"), no_entries=host_setup["no entries"]
+                ):
+                    ipv4, ipv6 = _route_networks(
+                        obj.get("route", []) + obj.get("route6", []), asn
+                    )
+                    ipv4_list.extend(ipv4)
+                    ipv6_list.extend(ipv6)
+            break
+        except WhoisLookupError:
+            if retry == host_setup["retries"]:
+                raise
+            _backoff(host_setup, retry, f"ASN origin WHOIS query {asn}")
 
     return ipv4_list, ipv6_list
 
 
-def asn_origin_whois(asn: str, host_setup: dict) -> str:
-    """whois inverse origin ASN search"""
+def _route_networks(
+    values: list[str], asn: str
+) -> tuple[list[IPv4Network], list[IPv6Network]]:
+    # IPv4 and IPv6 networks of the route values of an ASN, comments are
+    # stripped and invalid networks are skipped (like rpsl.iter_dump_routes)
+    ipv4_list, ipv6_list = [], []
+    for value in values:
+        try:
+            net = ip_network(value.split("#", 1)[0].strip(), strict=False)
+        except ValueError:
+            log.debug("invalid route of %s: %r", asn, value)
+            continue
+        if net.version == 4:
+            ipv4_list.append(net)
+        else:
+            ipv6_list.append(net)
+    return ipv4_list, ipv6_list
+
 
+def asn_origin_irrd(
+    asn_list: list[str], host_setup: dict
+) -> list[tuple[list[IPv4Network], list[IPv6Network]]]:
+    """returns the CIDR of each ASN in the ``asn_list`` from an IRRd server
+
+    The prefixes of the ASN are queried by the IRRd commands ``!gASxxx`` (IPv4)
+    and ``!6ASxxx`` (IPv6) in batches of :py:obj:`IRRD_BATCH` over one
+    persistent connection (:py:obj:`IRRdSession`).  When the connection fails,
+    a new connection is opened and the queries are continued at the first ASN
+    without answers (``retries`` and ``backoff`` of the host setup, the retries
+    are counted from the last answered ASN).  Raises :py:obj:`IRRdNotSupported`
+    if the server does not answer IRRd queries, in the ``irrd`` mode of the
+    host setup only after the retries.
+    """
+    results = []
+    asn_list = [asn if asn.startswith("AS") else "AS" + asn for asn in asn_list]
+    retry = 0
+
+    while len(results) < len(asn_list):
+        try:
+            with (
+                _connection_slots(host_setup["server"], host_setup["connections"]),
+                IRRdSession(host_setup) as session,
+            ):
+                while len(results) < len(asn_list):
+                    batch = asn_list[len(results) : len(results) + IRRD_BATCH]
+                    answers = session.query(
+                        [f"!{cmd}{asn}" for asn in batch for cmd in "g6"]
+                    )
+                    for asn, ipv4, ipv6 in zip(batch, answers, answers):
+                        results.append(
+                            (
+                                _route_networks(ipv4, asn)[0],
+                                _route_networks(ipv6, asn)[1],
+                            )
+                        )
+                        retry = 0
+        except WhoisLookupError as exc:
+            # A server that answered IRRd queries of a previous session does
+            # support IRRd, the unanswered session is retried.  In the auto
+            # mode the caller falls back to RPSL queries at once.
+            if (
+                isinstance(exc, IRRdNotSupported)
+                and not results
+                and host_setup.get("mode") != "irrd"
+            ):
+                raise
+            if retry == host_setup["retries"]:
+                raise
+            _backoff(host_setup, retry, f"IRRd query {asn_list[len(results)]}")
+            retry += 1
+
+    return results
+
+
+class IRRdSession:
+    """Persistent connection to an IRRd server (``!!``), the queries of a batch
+    are sent at once (pipelined) and the answers are read in the order of the
+    queries.  An answer with data is framed by its length (including the
+    newline after the data)::
+
+      A<length>
+      <data>
+      C
+
+    ``C`` (without data) is a successful query without data and ``D`` a key
+    that was not found.  If the first query of the session is not answered
+    (timeout, or the connection is closed), the server does not support IRRd
+    queries (:py:obj:`IRRdNotSupported`).
+
+    .. code:: python
+
+       with IRRdSession(whois_host_setup("RADB")) as session:
+           ipv4, ipv6 = session.query(["!gAS3333", "!6AS3333"])
+
+    :param host_setup: setup of the WHOIS host (:py:obj:`whois_host_setup`),
+      the ``timeout`` is the time to wait for data of an answer
+    """
+
+    def __init__(self, host_setup: dict):
+        self.bytes_received = 0
+        try:
+            self._conn = socket.create_connection(
+                (host_setup["server"], host_setup["port"]), host_setup["timeout"]
+            )
+            self._conn.sendall(b"!!\n")
+        except OSError as exc:
+            raise WhoisLookupError(
+                f"IRRd connection to {host_setup['server']} failed: {exc}"
+            ) from exc
+        self._file = self._conn.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """End the session (``!q``) and close the connection."""
+        try:
+            self._conn.sendall(b"!q\n")
+        except OSError:
+            pass
+        self._file.close()
+        self._conn.close()
+
+    def query(self, queries: list[str]) -> Iterator[list[str]]:
+        """Send the ``queries`` at once and yield the words of each answer (an
+        empty list if there is no data) as soon as the answer is read."""
+        try:
+            self._conn.sendall("".join(f"{query}\n" for query in queries).encode())
+            for query in queries:
+                yield self._read_answer(query)
+        except OSError as exc:
+            if not self.bytes_received:
+                # a server that does not know the IRRd commands (``!!``) may
+                # wait for a query it understands, the timeout of the first
+                # command of the session is not a failure of the connection
+                raise IRRdNotSupported(
+                    f"no IRRd answer to {queries[0]}: {exc}"
+                ) from exc
+            raise WhoisLookupError(f"IRRd query failed: {exc}") from exc
+
+    def _read_answer(self, query: str) -> list[str]:
+        line = self._readline()
+        if line.startswith(b"A") and line[1:].strip().isdigit():
+            size = int(line[1:])
+            data = self._file.read(size)
+            self.bytes_received += len(data)
+            if len(data) < size:
+                raise WhoisLookupError(
+                    f"IRRd connection closed in the answer of {query}"
+                )
+            line = self._readline()
+            if not line:
+                # the length does not include the newline after the data
+                line = self._readline()
+            if not line.startswith(b"C"):
+                raise WhoisLookupError(
+                    f"invalid end of the IRRd answer of {query}: {line!r}"
+                )
+            return data.decode("utf-8", errors="replace").split()
+        if line.startswith((b"C", b"D")):
+            return []
+        raise IRRdNotSupported(f"no IRRd answer to {query}: {line[:80]!r}")
+
+    def _readline(self) -> bytes:
+        line = self._file.readline()
+        self.bytes_received += len(line)
+        if not line:
+            if not self.bytes_received:
+                raise IRRdNotSupported(
+                    "IRRd connection closed by the server without an answer"
+                )
+            raise WhoisLookupError("IRRd connection closed by the server")
+        return line.rstrip(b"\r\n")
+
+
+def _backoff(host_setup: dict, retry: int, what: str):
+    delay = host_setup["backoff"] * 2**retry
+    log.warning("%s failed, retry in %.1f sec", what, delay)
+    time.sleep(delay * random.uniform(1.0, 1.5))
+
+
+@functools.cache
+def _connection_slots(  # pylint: disable=unused-argument
+    server: str, connections: int
+) -> threading.BoundedSemaphore:
+    # one semaphore per server (the cache key), shared by all threads that
+    # query the server
+    return threading.BoundedSemaphore(connections)
+
+
+def _origin_query(asn: str) -> str:
     if not asn.startswith("AS"):
         asn = "AS" + asn
-    query = f" -i origin {asn}\r\n"
+    return f" -i origin {asn}\r\n"
+
 
+def asn_origin_whois(asn: str, host_setup: dict) -> str:
+    """whois inverse origin ASN search, the query (connect, send & receive) has
+    to be completed within the ``timeout`` of the host setup.  To parse the
+    response while it is received use :py:obj:`iter_whois_query`."""
+    resp = b"".join(iter_whois_query(_origin_query(asn), host_setup))
+    return resp.decode("utf-8", errors="replace")
+
+
+def iter_whois_query(query: str, host_setup: dict) -> Iterator[bytes]:
+    """Send the ``query`` to the WHOIS server and yield the blocks of bytes of
+    the response as they are received.  The query (connect, send & receive) has
+    to be completed within the ``timeout`` of the host setup, otherwise a
+    :py:obj:`WhoisLookupError` is raised."""
+
+    deadline = time.monotonic() + host_setup["timeout"]
     try:
-        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        conn.settimeout(host_setup["timeout"])
-        conn.connect((host_setup["server"], host_setup["port"]))
-        conn.send(query.encode())
-
-        resp = ""
-        while True:
-            d = conn.recv(4096).decode()
-            resp += d
-            if not d:
-                break
-        conn.close()
+        with socket.create_connection(
+            (host_setup["server"], host_setup["port"]), host_setup["timeout"]
+        ) as conn:
+            conn.sendall(query.encode())
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(
+                        f"no complete response within {host_setup['timeout']} sec"
+                    )
+                conn.settimeout(remaining)
+                data = conn.recv(WHOIS_RECV_SIZE)
+                if not data:
+                    return
+                yield data
 
     except (socket.timeout, socket.error) as exc:
-        log.error("ASN origin WHOIS query socket error: %s", exc)
-        raise WhoisLookupError(f"ASN origin WHOIS lookup failed for {asn}.") from exc
-
-    return resp
+        log.error("WHOIS query socket error: %s", exc)
+        raise WhoisLookupError(f"WHOIS query failed: {query.strip()}") from exc
 
 
 def parse_whois_resp(resp: str, host_setup: dict):
-    """parse a WHOIS response"""
+    """parse a WHOIS response (see :py:obj:`iter_whois_objects`)"""
+    return list(
+        iter_whois_objects([resp.encode()], no_entries=host_setup["no entries"])
+    )
 
-    entries = []
-    d = {}
-    last_field = None
-    for line in resp.split("\n"):
-        if not line:
-            if d:
-                entries.append(d)
-            d = {}
-            continue
-        if line.startswith("%"):
-            if host_setup["no entries"] in line.lower():
-                log.info("parse_whois_resp: %s", line)
-                break
-            continue
-        if line.startswith(" ") or line.startswith("\t"):
-            field = last_field
-            value = line.strip()
-        else:
-            field, value = line.split(":", 1)
-            field, value = field.strip(), value.strip()
-            last_field = field
-        l = d.get(field, [])
-        l.append(value)
-        d[field] = l
-    if d:
-        entries.append(d)
-
-    return entries
+
+class ASNCache(SQLiteCache):
+    """Cache of the networks of ASN (:py:obj:`asn_networks`), keyed by
+    ``(whois_host, asn)``.
+
+    :param path: name of the SQLite file (default: ``whois`` in the
+      :py:obj:`CACHE_DIR <.cache.CACHE_DIR>`)
+    :param ttl: seconds until a cached entry expires
+    :param refresh: don't read the cache (query all ASN and update the cache)
+    :param offline: read also expired entries, ASN not in the cache are not
+      queried (no network traffic)
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float = WHOIS_CACHE_TTL,
+        refresh: bool = False,
+        offline: bool = False,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(path or cache_path("whois"), max_entries=max_entries)
+        self.ttl = ttl
+        self.refresh = refresh
+        self.offline = offline
+
+    def get_networks(
+        self, whois_host: str, asn_list: list[str]
+    ) -> dict[str, tuple[list, list]]:
+        """Networks ``{asn: (ipv4, ipv6)}`` of the ASN in the cache."""
+        if self.refresh:
+            return {}
+        found = self.get_many(
+            (f"{whois_host} {asn}" for asn in asn_list),
+            max_age=self.ttl,
+            stale=self.offline,
+        )
+        return {
+            key.split(" ", 1)[1]: (
+                [ip_network(item) for item in ipv4],
+                [ip_network(item) for item in ipv6],
+            )
+            for key, (ipv4, ipv6) in found.items()
+        }
+
+    def set_networks(self, whois_host: str, networks: dict[str, tuple[list, list]]):
+        """Store the networks ``{asn: (ipv4, ipv6)}`` in the cache."""
+        self.set_many(
+            {
+                f"{whois_host} {asn}": (
+                    [str(net) for net in ipv4],
+                    [str(net) for net in ipv6],
+                )
+                for asn, (ipv4, ipv6) in networks.items()
+            },
+            ttl=self.ttl,
+        )
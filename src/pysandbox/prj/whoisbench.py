@@ -0,0 +1,640 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Fake WHOIS / IRRd server and benchmarks of the WHOIS lookups (offline)"""
+
+from __future__ import annotations
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+from ipaddress import ip_network
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import threading
+import time
+
+import click
+
+from .benchutil import git_commit
+from .iplists import int_to_ip, iter_blocks, str_to_network
+from .iplists.bench import BENCH_SEED
+from .rpsl import asn_number, iter_whois_objects, open_dump
+from .whois import (
+    WHOIS_HOSTS,
+    WHOIS_RECV_SIZE,
+    WhoisLookupError,
+    asn_networks,
+    asn_origin_whois,
+    whois,
+    whois_host_setup,
+)
+
+WHOIS_BENCH_ASNS = (100, 1000)
+"""Default sizes (number of ASN) of the benchmarks."""
+
+FAKE_WHOIS_HOST = "FAKE"
+"""Name of the fake server in the :py:obj:`WHOIS_HOSTS <.whois.WHOIS_HOSTS>`
+(see :py:obj:`FakeWhoisServer.register`)."""
+
+NO_ENTRIES = b"%ERROR:101: no entries found\n\n"
+
+
+# fixtures
+# --------
+#
+# A fixture is a dictionary with the RPSL objects (route & route6, see
+# iter_whois_objects) of each ASN (number).
+
+
+def synthetic_fixture(
+    asns: int, seed: int = BENCH_SEED
+) -> dict[int, list[dict[str, list[str]]]]:
+    """Generate the route objects of the ASN ``1`` to ``asns``.  The objects
+    depend only on ``asns`` and ``seed``.  An ASN has up to 8 route and up to 2
+    route6 objects, about one of 20 ASN has no objects (``no entries found``).
+    """
+    rnd = random.Random(seed)
+    fixture = {}
+    for asn in range(1, asns + 1):
+        if rnd.random() < 0.05:
+            continue
+        objects = []
+        for _ in range(rnd.randrange(1, 9)):
+            net = rnd.randrange(1 << 24, 224 << 24) & 0xFFFFFF00
+            objects.append(
+                {
+                    "route": [f"{int_to_ip(net)}/{rnd.choice((22, 23, 24))}"],
+                    "descr": [f"Fake network {asn} Müller ☃"],
+                    "origin": [f"AS{asn}"],
+                    "mnt-by": [f"MAINT-AS{asn}"],
+                    "source": ["FAKE"],
+                }
+            )
+        for _ in range(rnd.randrange(3)):
+            objects.append(
+                {
+                    "route6": [
+                        f"2001:{rnd.getrandbits(16):x}:{rnd.getrandbits(16):x}::/48"
+                    ],
+                    "origin": [f"AS{asn}"],
+                    "mnt-by": [f"MAINT-AS{asn}"],
+                    "source": ["FAKE"],
+                }
+            )
+        fixture[asn] = objects
+    return fixture
+
+
+def load_fixture(path: str) -> dict[int, list[dict[str, list[str]]]]:
+    """Load the route objects of a recorded RPSL response or a RPSL dump
+    (compressed or not, see :py:obj:`open_dump <.rpsl.open_dump>`).  Objects
+    with an invalid ``origin`` or an invalid network are skipped (like
+    :py:obj:`iter_dump_routes <.rpsl.iter_dump_routes>`)."""
+    fixture = {}
+    with open_dump(path) as stream:
+        for obj in iter_whois_objects(iter_blocks(stream)):
+            routes = obj.get("route", []) + obj.get("route6", [])
+            asn = asn_number(obj.get("origin", [""])[0])
+            if not routes or asn is None:
+                continue
+            try:
+                for value in routes:
+                    str_to_network(value.split("#", 1)[0])
+            except ValueError:
+                continue
+            fixture.setdefault(asn, []).append(obj)
+    return fixture
+
+
+def render_object(obj: dict[str, list[str]], padding: int = 0) -> bytes:
+    """RPSL text of the object ``obj`` (terminated by an empty line), with
+    ``padding`` the object is filled up with ``remarks`` of (about) ``padding``
+    bytes."""
+    lines = [
+        f"{name + ':':<16}{value}\n" for name, values in obj.items() for value in values
+    ]
+    for _ in range(0, padding, 64):
+        lines.append("remarks:        " + "x" * 47 + "\n")
+    return "".join(lines).encode() + b"\n"
+
+
+def check_fixture(fixture: dict[int, list[dict[str, list[str]]]]) -> list[int]:
+    """Check that the route objects of each ASN in the ``fixture`` parse like a
+    response of the :py:obj:`FakeWhoisServer`: the rendered objects
+    (:py:obj:`render_object`) are parsed by :py:obj:`iter_whois_objects
+    <.rpsl.iter_whois_objects>` and each route must be a network (without a
+    comment).  Returns the ASN whose objects don't parse."""
+    failed = []
+    for asn, objs in fixture.items():
+        resp = b"".join(render_object(obj) for obj in objs)
+        chunks = (
+            resp[pos : pos + WHOIS_RECV_SIZE]
+            for pos in range(0, len(resp), WHOIS_RECV_SIZE)
+        )
+        parsed = [
+            obj.get("route", []) + obj.get("route6", [])
+            for obj in iter_whois_objects(chunks, ("route", "route6"))
+        ]
+        expected = [obj.get("route", []) + obj.get("route6", []) for obj in objs]
+        try:
+            for value in itertools.chain.from_iterable(expected):
+                ip_network(value, strict=False)
+        except ValueError:
+            failed.append(asn)
+            continue
+        if parsed != [routes for routes in expected if routes]:
+            failed.append(asn)
+    return failed
+
+
+def _load_fixture(
+    path: str | None, asns: int, seed: int
+) -> dict[int, list[dict[str, list[str]]]]:
+    if not path:
+        return synthetic_fixture(asns, seed)
+    fixture = load_fixture(path)
+    failed = check_fixture(fixture)
+    if failed:
+        raise click.ClickException(
+            f"{path}: the route objects of {len(failed)} ASN don't parse: "
+            + ", ".join(f"AS{asn}" for asn in failed[:10])
+        )
+    return fixture
+
+
+# fake server
+# -----------
+
+
+class FakeWhoisServer:  # pylint: disable=too-many-instance-attributes
+    """A local WHOIS server (asyncio) that replays the route objects of a
+    fixture.  It answers inverse origin queries (``-i origin ASxxx``) and the
+    IRRd queries ``!gASxxx`` and ``!6ASxxx`` of a persistent connection
+    (``!!``), the server can be used in place of the servers in the
+    :py:obj:`WHOIS_HOSTS <.whois.WHOIS_HOSTS>`:
+
+    .. code:: python
+
+       with FakeWhoisServer(synthetic_fixture(1000), latency=0.01) as server:
+           server.register()
+           ipv4_list, ipv6_list = asn_networks(["AS17", "AS42"], FAKE_WHOIS_HOST)
+
+    The server runs in a background thread (:py:obj:`start`) or in the event
+    loop of the caller (:py:obj:`serve_forever`).  The counters
+    (``connections``, ``queries``, ``failures`` and ``bytes_sent``) are updated
+    by the server.
+
+    :param fixture: route objects of the ASN (see :py:obj:`synthetic_fixture`)
+    :param latency: seconds to wait before a query is answered
+    :param padding: bytes of ``remarks`` added to each object
+    :param fail_rate: rate of the queries that are dropped, the connection is
+      closed without an answer
+    :param irrd: answer IRRd queries, otherwise the server answers like RIPE
+      (``no entries found``)
+    :param seed: seed of the failures
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        fixture: dict[int, list[dict[str, list[str]]]],
+        latency: float = 0.0,
+        padding: int = 0,
+        fail_rate: float = 0.0,
+        irrd: bool = True,
+        seed: int = BENCH_SEED,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.irrd = irrd
+        self.asns = sorted(fixture)
+        self.connections = self.queries = self.failures = self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._responses = {
+            asn: b"".join(render_object(obj, padding) for obj in objs)
+            for asn, objs in fixture.items()
+        }
+        self._prefixes = {
+            (asn, key): " ".join(
+                dict.fromkeys(
+                    value.split("#", 1)[0].strip()
+                    for obj in objs
+                    for value in obj.get(key, [])
+                )
+            ).encode()
+            for asn, objs in fixture.items()
+            for key in ("route", "route6")
+        }
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def host_setup(self) -> dict:
+        """Setup of the server in the :py:obj:`WHOIS_HOSTS <.whois.WHOIS_HOSTS>`,
+        short timeout and backoff."""
+        return {"server": self.host, "port": self.port, "timeout": 5, "backoff": 0.01}
+
+    def register(self, name: str = FAKE_WHOIS_HOST):
+        """Add the server to the :py:obj:`WHOIS_HOSTS <.whois.WHOIS_HOSTS>`."""
+        WHOIS_HOSTS[name] = self.host_setup
+
+    def start(self) -> FakeWhoisServer:
+        """Start the server in a background thread, returns when the server
+        accepts connections (the ``port`` is set)."""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                server.close()
+                self._loop.run_until_complete(server.wait_closed())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-whois", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def close(self):
+        """Stop the server (background thread)."""
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    async def serve_forever(self):
+        """Run the server in the event loop of the caller."""
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            line = await reader.readline()
+            if line.strip() == b"!!" and self.irrd:
+                while True:
+                    line = await reader.readline()
+                    if not line or line.startswith(b"!q"):
+                        break
+                    if line.strip() and not await self._answer(
+                        writer, self._irrd_answer(line)
+                    ):
+                        break
+            elif line.strip():
+                await self._answer(writer, self._rpsl_answer(line))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _answer(self, writer: asyncio.StreamWriter, data: bytes) -> bool:
+        self.queries += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            self.failures += 1
+            return False
+        for pos in range(0, len(data), WHOIS_RECV_SIZE):
+            writer.write(data[pos : pos + WHOIS_RECV_SIZE])
+            await writer.drain()
+        self.bytes_sent += len(data)
+        return True
+
+    def _rpsl_answer(self, line: bytes) -> bytes:
+        words = line.decode(errors="replace").split()
+        if line.startswith(b"!") or "origin" not in words:
+            return b"% This is a fake WHOIS server.\n\n" + NO_ENTRIES
+        asn = asn_number(words[-1])
+        return b"% This is a fake WHOIS server.\n\n" + self._responses.get(
+            asn, NO_ENTRIES
+        )
+
+    def _irrd_answer(self, line: bytes) -> bytes:
+        query = line.strip().decode(errors="replace")
+        key = {"!g": "route", "!6": "route6"}.get(query[:2])
+        if key is None:
+            return b"F Unrecognized command\n"
+        data = self._prefixes.get((asn_number(query[2:]), key))
+        if not data:
+            return b"D\n"
+        return b"A%d\n%s\nC\n" % (len(data) + 1, data)
+
+
+# benchmarks
+# ----------
+#
+# A benchmark is a function that is called with the list of ASN, it prepares
+# the data (not measured) and returns the function which is timed.  The fake
+# server is registered as FAKE_WHOIS_HOST.
+
+
+def _bench_asn_networks(**kwargs) -> Callable[[list[str]], Callable]:
+    def bench(asn_list: list[str]) -> Callable:
+        return lambda: asn_networks(asn_list, FAKE_WHOIS_HOST, **kwargs)
+
+    return bench
+
+
+def _bench_parse(asn_list: list[str]) -> Callable:
+    responses = []
+    for asn in asn_list:
+        with contextlib.suppress(WhoisLookupError):
+            responses.append(
+                asn_origin_whois(asn, whois_host_setup(FAKE_WHOIS_HOST)).encode()
+            )
+
+    def run():
+        for resp in responses:
+            chunks = (
+                resp[pos : pos + WHOIS_RECV_SIZE]
+                for pos in range(0, len(resp), WHOIS_RECV_SIZE)
+            )
+            for _ in iter_whois_objects(chunks, ("route", "route6")):
+                pass
+        return sum(len(resp) for resp in responses)
+
+    return run
+
+
+WHOIS_BENCHMARKS: dict[str, Callable[[list[str]], Callable]] = {
+    "asn_networks irrd": _bench_asn_networks(mode="irrd"),
+    "asn_networks rpsl": _bench_asn_networks(mode="rpsl"),
+    "asn_networks rpsl -c1": _bench_asn_networks(mode="rpsl", connections=1),
+    "iter_whois_objects": _bench_parse,
+}
+"""Benchmarks by name, see :py:obj:`run_whois_benchmark`.  The benchmark
+``iter_whois_objects`` parses the responses of the server (received before the
+benchmark), the bytes/sec are the bytes parsed."""
+
+
+def run_whois_benchmark(name: str, server: FakeWhoisServer, asns: int) -> dict:
+    """Run the benchmark ``name`` with the first ``asns`` ASN of the (running)
+    ``server`` in a new process and return the result.  The bytes/sec are the
+    bytes sent by the server, the peak RSS (``max_rss``, KiB) is the maximum
+    resident set size of the process of the benchmark (the server is not
+    included).  If the lookups fail (e.g. too many failures of the server,
+    ``--fail-rate``) the ``error`` of the result is set."""
+    asn_list = [f"AS{asn}" for asn in server.asns[:asns]]
+    bytes_sent = server.bytes_sent
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        seconds, max_rss, parsed, error = pool.submit(
+            _run_whois_benchmark, name, server.host_setup, asn_list
+        ).result()
+    if parsed is None:
+        parsed = server.bytes_sent - bytes_sent
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "benchmark": name,
+        "asns": len(asn_list),
+        "latency": server.latency,
+        "fail_rate": server.fail_rate,
+        "seconds": round(seconds, 4),
+        "asn_per_sec": round(len(asn_list) / seconds) if seconds else 0,
+        "bytes_per_sec": round(parsed / seconds) if seconds else 0,
+        "max_rss": max_rss,
+        "error": error,
+    }
+
+
+def _run_whois_benchmark(
+    name: str, host_setup: dict, asn_list: list[str]
+) -> tuple[float, int, int | None, str | None]:
+    WHOIS_HOSTS[FAKE_WHOIS_HOST] = host_setup
+    run = WHOIS_BENCHMARKS[name](asn_list)
+    error = None
+    start = time.perf_counter()
+    try:
+        result = run()
+    except WhoisLookupError as exc:
+        result, error = None, str(exc)
+    seconds = time.perf_counter() - start
+    parsed = result if isinstance(result, int) else None
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, parsed, error
+
+
+# command line
+# ------------
+
+
+@whois.command("fake-server")
+@click.option(
+    "--port", type=int, show_default=True, default=4343, help="TCP port of the server"
+)
+@click.option(
+    "--asns",
+    type=click.IntRange(min=1),
+    show_default=True,
+    default=1000,
+    help="number of synthetic ASN",
+)
+@click.option(
+    "--fixture",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="RPSL objects to replay",
+)
+@click.option(
+    "--latency",
+    type=float,
+    show_default=True,
+    default=0.0,
+    help="seconds before each answer",
+)
+@click.option(
+    "--padding",
+    type=int,
+    show_default=True,
+    default=0,
+    help="bytes of remarks added to each object",
+)
+@click.option(
+    "--fail-rate",
+    type=click.FloatRange(0, 1),
+    show_default=True,
+    default=0.0,
+    help="rate of dropped queries",
+)
+@click.option(
+    "--no-irrd",
+    is_flag=True,
+    default=False,
+    help="don't answer IRRd queries (like RIPE)",
+)
+@click.option(
+    "--seed",
+    type=int,
+    show_default=True,
+    default=BENCH_SEED,
+    help="seed of the objects and failures",
+)
+def _fake_server(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    port, asns, fixture, latency, padding, fail_rate, no_irrd, seed
+):
+    """Run a fake WHOIS / IRRd server (see :py:obj:`FakeWhoisServer`)
+
+    usage::
+
+      $ whois fake-server --latency 0.05 --fail-rate 0.01
+      $ whois -h 127.0.0.1 -p 4343 -- '-i origin AS17'
+      $ printf '!!\\n!gAS17\\n!6AS17\\n!q\\n' | nc 127.0.0.1 4343
+
+    The server replays the route objects of the ASN ``1`` to ``--asns``
+    (synthetic) or the objects of a recorded response or dump (``--fixture``).
+    """
+    fixture = _load_fixture(fixture, asns, seed)
+    server = FakeWhoisServer(
+        fixture,
+        latency=latency,
+        padding=padding,
+        fail_rate=fail_rate,
+        irrd=not no_irrd,
+        seed=seed,
+        port=port,
+    )
+    click.echo(
+        f"fake WHOIS server with {len(fixture)} ASN on {server.host}:{port} (Ctrl-C to stop)"
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(server.serve_forever())
+
+
+@whois.command("bench")
+@click.option(
+    "-n",
+    "--asns",
+    "sizes",
+    type=click.IntRange(min=1),
+    multiple=True,
+    default=WHOIS_BENCH_ASNS,
+    show_default=True,
+    help="number of ASN, can be given more than once",
+)
+@click.option(
+    "-b",
+    "--benchmark",
+    "names",
+    type=click.Choice(list(WHOIS_BENCHMARKS)),
+    multiple=True,
+    help="benchmark to run, can be given more than once (default: all)",
+)
+@click.option(
+    "--fixture",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="RPSL objects to replay",
+)
+@click.option(
+    "--latency",
+    type=float,
+    show_default=True,
+    default=0.0,
+    help="seconds before each answer",
+)
+@click.option(
+    "--padding",
+    type=int,
+    show_default=True,
+    default=0,
+    help="bytes of remarks added to each object",
+)
+@click.option(
+    "--fail-rate",
+    type=click.FloatRange(0, 1),
+    show_default=True,
+    default=0.0,
+    help="rate of dropped queries",
+)
+@click.option(
+    "--seed",
+    type=int,
+    show_default=True,
+    default=BENCH_SEED,
+    help="seed of the objects and failures",
+)
+@click.option(
+    "--json",
+    "json_file",
+    type=click.File("a"),
+    default=None,
+    help="append the results (JSON lines)",
+)
+@click.option(
+    "--compare",
+    type=click.File("r"),
+    default=None,
+    help="compare with results from --json of a former run",
+)
+def _bench(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+    sizes,
+    names,
+    fixture,
+    latency,
+    padding,
+    fail_rate,
+    seed,
+    json_file,
+    compare,
+):
+    """Benchmark the WHOIS lookups against a fake server (offline)
+
+    The fake server (:py:obj:`FakeWhoisServer`) runs in this process, each
+    benchmark runs in a new process.  It prints the throughput (ASN/sec and
+    bytes/sec) and the peak RSS of the benchmark process.  The objects are
+    generated with the same seed, results from different commits are
+    comparable::
+
+      $ whois bench --latency 0.002 --json=main.jsonl
+      $ git checkout my-branch
+      $ whois bench --latency 0.002 --compare=main.jsonl
+    """
+    former = {}
+    for result in map(json.loads, filter(str.strip, compare or ())):
+        former[(result["benchmark"], result["asns"])] = result
+
+    objects = _load_fixture(fixture, max(sizes), seed)
+    with FakeWhoisServer(
+        objects, latency=latency, padding=padding, fail_rate=fail_rate, seed=seed
+    ) as server:
+        for asns in sizes:
+            for name in names or WHOIS_BENCHMARKS:
+                result = run_whois_benchmark(name, server, asns)
+                msg = (
+                    f"{name:<22} {result['asns']:>6} ASN {result['seconds']:>8.3f}s"
+                    f" {result['asn_per_sec']:>9,} ASN/s {result['bytes_per_sec']:>13,} B/s"
+                    f" {result['max_rss']:>9,} KiB"
+                )
+                if result["error"]:
+                    msg += f"  FAILED: {result['error']}"
+                old = former.get((name, result["asns"]))
+                if old and old["asn_per_sec"]:
+                    msg += f"  {result['asn_per_sec'] / old['asn_per_sec']:5.2f}x ({old['commit']})"
+                click.echo(msg)
+                if json_file:
+                    json_file.write(json.dumps(result) + "\n")
+                    json_file.flush()
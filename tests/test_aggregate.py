@@ -0,0 +1,42 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the hit counting and the prefix aggregation of ``ip-filter``"""
+
+from collections import Counter
+
+from click.testing import CliRunner
+
+from pysandbox.prj.iplists import iplists
+from pysandbox.prj.iplists.aggregate import aggregate_networks, merge_counts
+from pysandbox.prj.iplists.networks import IPV4_BITS, IPListOptions, ip_to_int
+
+
+def _net(text):
+    ip, _, prefixlen = text.partition("/")
+    return ip_to_int(ip), int(prefixlen or 32)
+
+
+def test_aggregate_and_merge_counts():
+    hits = Counter(
+        {
+            _net("10.0.0.1"): 2,
+            _net("10.0.0.2"): 1,
+            _net("10.0.1.1"): 5,
+            _net("10.0.0.0/16"): 1,
+        }
+    )
+    opts = IPListOptions(ipv4_agg_pref=24, agg_threshold=2)
+    aggregated = aggregate_networks(opts, hits, IPV4_BITS)
+    assert aggregated == Counter(
+        {_net("10.0.0.0/24"): 3, _net("10.0.1.1"): 5, _net("10.0.0.0/16"): 1}
+    )
+    assert merge_counts(aggregated, IPV4_BITS) == [(*_net("10.0.0.0/16"), 9)]
+
+
+def test_ip_filter_aggregate_with_defaults(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text("10.0.0.1\n10.0.0.2\n10.0.0.2\n192.0.2.1\n")
+    result = CliRunner().invoke(
+        iplists, ["ip-filter", "--aggregate=2", "--counts", str(log), "-"]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output == "10.0.0.0/24 3\n192.0.2.1/32 1\n"
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of :py:obj:`pysandbox.prj.iplists.cidrset.CidrSet`"""
+
+import ipaddress
+import random
+import sys
+
+import pytest
+
+from pysandbox.prj.iplists import IPV4_BITS
+from pysandbox.prj.iplists.cidrset import (
+    CidrIndexError,
+    CidrSet,
+    diff_networks,
+    str_to_network,
+)
+
+
+def _random_networks(rnd, count, base, prefixes):
+    # random networks in the /20 (IPv4) or /116 (IPv6) network base
+    base = ipaddress.ip_network(base)
+    nets = []
+    for _ in range(count):
+        prefixlen = rnd.choice(prefixes)
+        offset = rnd.getrandbits(base.max_prefixlen - base.prefixlen) & -(
+            1 << (base.max_prefixlen - prefixlen)
+        )
+        nets.append(f"{base.network_address + offset}/{prefixlen}")
+    return nets
+
+
+def _addresses(networks):
+    # set of all addresses of the networks (the address space is small)
+    addrs = set()
+    for net in networks:
+        net = ipaddress.ip_network(net)
+        addrs.update(range(int(net.network_address), int(net.broadcast_address) + 1))
+    return addrs
+
+
+@pytest.fixture(name="samples", params=[1, 2, 3])
+def fixture_samples(request):
+    rnd = random.Random(request.param)
+    a, b = [], []
+    for base, prefixes in (
+        ("10.0.0.0/20", [22, 24, 28, 30, 32]),
+        ("2001:db8::/116", [118, 120, 124, 128]),
+    ):
+        a += _random_networks(rnd, 40, base, prefixes)
+        b += _random_networks(rnd, 40, base, prefixes)
+    return a, b
+
+
+def test_set_algebra(samples):
+    a, b = samples
+    x, y = CidrSet(a), CidrSet(b)
+    assert _addresses(x | y) == _addresses(a) | _addresses(b)
+    assert _addresses(x & y) == _addresses(a) & _addresses(b)
+    assert _addresses(x - y) == _addresses(a) - _addresses(b)
+    assert list(x | y) == [str(net) for net in _collapse(a + b)]
+
+
+def _collapse(networks):
+    nets = [ipaddress.ip_network(net) for net in networks]
+    return [*ipaddress.collapse_addresses(n for n in nets if n.version == 4)] + [
+        *ipaddress.collapse_addresses(n for n in nets if n.version == 6)
+    ]
+
+
+def test_update_equals_union(samples):
+    a, b = samples
+    x = CidrSet(a)
+    x.update(CidrSet(b))
+    assert x == CidrSet(a) | CidrSet(b)
+
+
+def test_contains():
+    s = CidrSet(["10.0.0.0/24", "10.0.1.0/24", "2001:db8::/32"])
+    assert list(s) == ["10.0.0.0/23", "2001:db8::/32"]
+    assert "10.0.1.17" in s and "10.0.0.0/23" in s and "2001:db8:ffff::1" in s
+    assert "10.0.2.0/30" not in s and "10.0.0.0/22" not in s and "2001:db9::1" not in s
+
+
+def test_index_roundtrip(tmp_path, samples):
+    a, _ = samples
+    path = str(tmp_path / "set.idx")
+    CidrSet(a).save_index(path)
+    assert CidrSet.load_index(path) == CidrSet(a)
+
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 4)
+    with pytest.raises(CidrIndexError):
+        CidrSet.load_index(path)
+
+
+def test_index_mapped(tmp_path, samples):
+    # the intervals of a loaded index are used in place from the mapped file
+    a, b = samples
+    path = str(tmp_path / "set.idx")
+    CidrSet(a).save_index(path)
+    loaded = CidrSet.load_index(path)
+    if sys.byteorder == "little":
+        assert isinstance(loaded._intervals[IPV4_BITS][0], memoryview)
+    expected = CidrSet(a)
+    for addr in _addresses(a + b):
+        addr = str(ipaddress.ip_address(addr))
+        assert (addr in loaded) == (addr in expected)
+
+    # an update of the loaded set replaces its own index file
+    loaded.update(CidrSet(b))
+    loaded.save_index(path)
+    assert CidrSet.load_index(path) == CidrSet(a + b) == loaded
+
+
+def test_diff_networks():
+    old = CidrSet(["10.0.0.0/24", "10.0.8.0/24", "2001:db8::/48"])
+    new = CidrSet(["10.0.0.0/23", "10.0.8.0/24", "2001:db8:1::/48"])
+    for bits, (removed, added) in (
+        (32, (["10.0.0.0/24"], ["10.0.0.0/23"])),
+        (128, (["2001:db8::/48"], ["2001:db8:1::/48"])),
+    ):
+        got = diff_networks(old.networks(bits), new.networks(bits))
+        assert got == tuple(
+            [str_to_network(net)[1:] for net in nets] for nets in (removed, added)
+        )
@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the external merge (:py:obj:`pysandbox.prj.iplists.external`)"""
+
+import io
+import random
+
+import pytest
+
+from pysandbox.prj.iplists.external import NETWORK_SIZE, ExternalMerge, parse_size
+from pysandbox.prj.iplists.networks import (
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    collect_networks,
+    int_to_ip,
+    merge_networks,
+)
+
+
+def _log(lines: int, seed: int) -> str:
+    # addresses and networks of a few clustered ranges, many of them overlap
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        ipv4 = int_to_ip(0xC0000000 + rnd.getrandbits(14))
+        ipv6 = int_to_ip(0x20010DB8 << 96 | rnd.getrandbits(12) << 80, IPV6_BITS)
+        out.append(
+            f"GET / {ipv4}/{rnd.choice((24, 28, 32))} {ipv6}/{rnd.choice((44, 48, 128))}\n"
+        )
+    return "".join(out)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True], ids=["lines", "mmap"])
+def test_external_merge(tmp_path, use_mmap):
+    # the budget is checked after each block of lines, each of the (small)
+    # logs is one block
+    logs = [_log(500, seed) for seed in range(10)]
+    opts = IPListOptions()
+
+    with ExternalMerge(NETWORK_SIZE * 200, tmpdir=str(tmp_path)) as ext:
+        for i, log in enumerate(logs):
+            path = tmp_path / f"access-{i}.log"
+            path.write_text(log)
+            with open(path, "rb" if use_mmap else "r") as stream:
+                ext.collect(opts, stream, use_mmap=use_mmap)
+        # the networks are spilled in several runs of each address family
+        assert len(ext.runs[IPV4_BITS]) > 2 and len(ext.runs[IPV6_BITS]) > 2
+        merged = {bits: list(ext.merged(bits)) for bits in (IPV4_BITS, IPV6_BITS)}
+
+    networks = collect_networks(opts, io.StringIO("".join(logs)))
+    assert merged == {
+        bits: merge_networks(nets, bits) for bits, nets in networks.items()
+    }
+
+
+def test_external_merge_empty(tmp_path):
+    with ExternalMerge(NETWORK_SIZE, tmpdir=str(tmp_path)) as ext:
+        ext.collect(IPListOptions(), io.StringIO("no address\n"))
+        assert not list(ext.merged(IPV4_BITS)) and not list(ext.merged(IPV6_BITS))
+
+
+@pytest.mark.parametrize(
+    "text, size", [("512", 512), ("4K", 4096), ("1 MiB", 1024**2), ("2g", 2 * 1024**3)]
+)
+def test_parse_size(text, size):
+    assert parse_size(text) == size
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("1.5G")
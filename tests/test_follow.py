@@ -0,0 +1,106 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the ``--follow`` mode (:py:obj:`pysandbox.prj.iplists.follow`)"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from pysandbox.prj.iplists import iplists
+from pysandbox.prj.iplists.follow import iter_follow
+
+
+def _read_until_idle(blocks):
+    # read the blocks of iter_follow until there is no new data
+    data = b""
+    for block in blocks:
+        if not block:
+            return data
+        data += block
+    return data
+
+
+def test_follow_growing_and_rotated_file(tmp_path):
+    path = tmp_path / "access.log"
+    path.write_bytes(b"1.1.1.1\n")
+    with open(path, "rb") as f:
+        blocks = iter_follow(f, poll=0.01)
+        assert _read_until_idle(blocks) == b"1.1.1.1\n"
+
+        with open(path, "ab") as log:
+            log.write(b"2.2.2.2\n")
+        assert _read_until_idle(blocks) == b"2.2.2.2\n"
+
+        # rotate: the rest of the old file is read before the new file
+        with open(path, "ab") as log:
+            log.write(b"3.3.3.3\n")
+        os.rename(path, tmp_path / "access.log.1")
+        path.write_bytes(b"4.4.4.4\n")
+        data = _read_until_idle(blocks) + _read_until_idle(blocks)
+        assert b"3.3.3.3\n" in data and data.endswith(b"4.4.4.4\n")
+        blocks.close()
+
+
+def test_follow_stdin_pipe(tmp_path):
+    # The first block of a pipe is read into the buffer of stdin (magic number
+    # of InputFile), following the pipe must not drop it.
+    out = tmp_path / "botnet.lst"
+    cmd = [
+        "prj",
+        "iplists",
+        "ip-filter",
+        "--follow",
+        "--flush-interval",
+        "0.1",
+        "-",
+        str(out),
+    ]
+    with subprocess.Popen(
+        [sys.executable, "-c", "from pysandbox.cli import main; main()", *cmd],
+        stdin=subprocess.PIPE,
+    ) as proc:
+        proc.stdin.write(b"1.1.1.1\n2.2.2.2\n")
+        proc.stdin.flush()
+        time.sleep(1)
+        proc.stdin.write(b"3.3.3.3\n")
+        proc.stdin.close()
+        assert proc.wait(timeout=30) == 0
+    assert out.read_text() == "1.1.1.1/32\n2.2.2.2/32\n3.3.3.3/32\n"
+
+
+def test_follow_keeps_output(tmp_path):
+    # restarting the follower must not drop the networks already in OUTPUT
+    out = tmp_path / "keep.lst"
+    out.write_text("10.0.0.0/8\n")
+    cmd = ["prj", "iplists", "ip-filter", "--follow", "-", str(out)]
+    subprocess.run(
+        [sys.executable, "-c", "from pysandbox.cli import main; main()", *cmd],
+        input=b"10.1.2.3\n192.0.2.1\n",
+        check=True,
+        timeout=30,
+    )
+    assert out.read_text() == "10.0.0.0/8\n192.0.2.1/32\n"
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--aggregate=8"],
+        ["--counts"],
+        ["--memory-budget=1M"],
+        ["--jobs=2"],
+        ["--mmap"],
+        ["--no-merge"],
+    ],
+)
+def test_follow_rejects_options(tmp_path, args):
+    out = tmp_path / "keep.lst"
+    result = CliRunner().invoke(
+        iplists, ["ip-filter", "--follow", *args, "-", str(out)], input="192.0.2.1\n"
+    )
+    assert result.exit_code == 2
+    assert f"{args[0].split('=')[0]} can't be combined with --follow" in result.output
+    assert not out.exists()
@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the output formats (:py:obj:`pysandbox.prj.iplists.formats`)"""
+
+import io
+import struct
+
+import pytest
+from click.testing import CliRunner
+
+from pysandbox.prj.iplists import iplists
+from pysandbox.prj.iplists.cidrset import str_to_network
+from pysandbox.prj.iplists.formats import write_diff, write_networks
+from pysandbox.prj.iplists.networks import IPV4_BITS, IPV6_BITS
+
+
+def _networks(*cidrs):
+    networks = {IPV4_BITS: [], IPV6_BITS: []}
+    for cidr in cidrs:
+        bits, net, prefixlen = str_to_network(cidr)
+        networks[bits].append((net, prefixlen))
+    return networks
+
+
+NETWORKS = _networks("192.0.2.0/24", "198.51.100.7", "2001:db8::/48")
+
+
+def test_write_text():
+    out = io.StringIO()
+    assert write_networks(out, NETWORKS) == 3
+    assert out.getvalue() == "192.0.2.0/24\n198.51.100.7/32\n2001:db8::/48\n"
+
+
+def test_write_ipset():
+    out = io.StringIO()
+    write_networks(out, NETWORKS, fmt="ipset", name="botnet")
+    assert out.getvalue().splitlines() == [
+        "create botnet_v4 hash:net family inet maxelem 65536 -exist",
+        "flush botnet_v4",
+        "add botnet_v4 192.0.2.0/24",
+        "add botnet_v4 198.51.100.7/32",
+        "create botnet_v6 hash:net family inet6 maxelem 65536 -exist",
+        "flush botnet_v6",
+        "add botnet_v6 2001:db8::/48",
+    ]
+
+
+def test_write_nft():
+    out = io.StringIO()
+    write_networks(
+        out,
+        {IPV4_BITS: NETWORKS[IPV4_BITS], IPV6_BITS: iter([])},
+        fmt="nft",
+        name="botnet",
+    )
+    assert out.getvalue() == (
+        "add table inet filter\n"
+        "add set inet filter botnet_v4 { type ipv4_addr; flags interval; }\n"
+        "flush set inet filter botnet_v4\n"
+        "add element inet filter botnet_v4 {\n    192.0.2.0/24,\n    198.51.100.7/32\n}\n"
+        "add table inet filter\n"
+        "add set inet filter botnet_v6 { type ipv6_addr; flags interval; }\n"
+        "flush set inet filter botnet_v6\n"
+    )
+
+
+def test_write_binary():
+    out = io.BytesIO()
+    assert write_networks(out, {IPV6_BITS: NETWORKS[IPV6_BITS]}, fmt="binary") == 1
+    assert out.getvalue() == struct.pack("<I", 48) + bytes.fromhex("20010db8") + bytes(
+        12
+    )
+    out = io.BytesIO()
+    write_networks(out, {IPV4_BITS: NETWORKS[IPV4_BITS]}, fmt="binary")
+    assert [struct.unpack("<I4s", out.getvalue()[i : i + 8]) for i in (0, 8)] == [
+        (24, bytes([192, 0, 2, 0])),
+        (32, bytes([198, 51, 100, 7])),
+    ]
+    with pytest.raises(ValueError):
+        write_networks(io.BytesIO(), NETWORKS, fmt="binary")
+
+
+def test_write_diff():
+    out = io.StringIO()
+    removed, added = (
+        _networks("192.0.2.0/24")[IPV4_BITS],
+        _networks("192.0.2.0/23")[IPV4_BITS],
+    )
+    assert (
+        write_diff(out, {IPV4_BITS: (removed, added)}, fmt="ipset", name="botnet") == 2
+    )
+    assert (
+        out.getvalue()
+        == "del botnet_v4 192.0.2.0/24 -exist\nadd botnet_v4 192.0.2.0/23 -exist\n"
+    )
+
+
+def test_ip_filter_binary_needs_family(tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text("192.0.2.1 2001:db8::1\n")
+    out = tmp_path / "out.bin"
+    result = CliRunner().invoke(
+        iplists, ["ip-filter", "--format=binary", str(log), str(out)]
+    )
+    assert result.exit_code != 0 and "--family" in result.output
+    result = CliRunner().invoke(
+        iplists, ["ip-filter", "--format=binary", "--family=ipv4", str(log), str(out)]
+    )
+    assert result.exit_code == 0, result.output
+    assert out.read_bytes() == struct.pack("<I", 32) + bytes([192, 0, 2, 1])
+
+
+def test_diff_command(tmp_path):
+    old, new = tmp_path / "old.lst", tmp_path / "new.lst"
+    old.write_text("192.0.2.0/24\n198.51.100.7\n")
+    new.write_text("192.0.2.0/24\n2001:db8::/48\n")
+    result = CliRunner().invoke(iplists, ["diff", str(old), str(new)])
+    assert result.exit_code == 0, result.output
+    assert result.output == "-198.51.100.7/32\n+2001:db8::/48\n"
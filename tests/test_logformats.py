@@ -0,0 +1,77 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the extractors of known log formats (:py:obj:`pysandbox.prj.iplists.logformats`)"""
+
+import io
+import pathlib
+
+import pytest
+
+from pysandbox.prj.iplists.logformats import extract_access, extract_searxng
+from pysandbox.prj.iplists.networks import IPListOptions, collect_networks, int_to_ip
+
+
+def _cidrs(networks):
+    return sorted(
+        f"{int_to_ip(net, bits)}/{prefixlen}"
+        for bits, items in networks.items()
+        for net, prefixlen in items
+    )
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (
+            '192.0.2.17 - - [17/Oct/2024:05:47:58 +0000] "GET /?q=10.0.0.1 HTTP/1.1" 200 5',
+            [("192.0.2.17", "")],
+        ),
+        (
+            '2001:db8::17 - - [17/Oct/2024:05:47:58 +0000] "GET / HTTP/1.1" 200 5',
+            [("2001:db8::17", "")],
+        ),
+        (
+            "[pid: 1234|app: 0|req: 5/17] 192.0.2.17 () {34 vars in 612 bytes} [Thu Oct 17",
+            [("192.0.2.17", "")],
+        ),
+        (
+            '::ffff:192.0.2.17 - - [17/Oct/2024:05:47:58 +0000] "GET / HTTP/1.1" 200 5',
+            [("192.0.2.17", "")],
+        ),
+    ],
+)
+def test_extract_access(line, expected):
+    assert extract_access(IPListOptions(), line) == expected
+
+
+def test_extract_searxng():
+    opts = IPListOptions()
+    line = "ERROR:searx.botdetection: BLOCK: too many request from 192.0.2.0/24 in SUSPICIOUS_IP_WINDOW (redirect to /)"
+    assert extract_searxng(opts, line) == [("192.0.2.0", "/24")]
+    line = "BLOCK 2001:db8::/48, fe80::1%eth0 and 10.0.0.1 SUSPICIOUS_IP_WINDOW 198.51.100.1"
+    assert extract_searxng(opts, line) == [("2001:db8::", "/48"), ("10.0.0.1", "")]
+    assert not extract_searxng(opts, "BLOCK 192.0.2.1 without window")
+
+
+def test_collect_searxng_log():
+    log = (
+        "INFO:searx: 203.0.113.1 GET /search\n"
+        "ERROR:searx.botdetection: BLOCK: too many request from 192.0.2.0/24 in SUSPICIOUS_IP_WINDOW\n"
+        "ERROR:searx.botdetection: BLOCK: too many request from 2001:db8:1::/48 in SUSPICIOUS_IP_WINDOW\n"
+    )
+    opts = IPListOptions(ipv4_min_pref=8, ipv6_min_pref=16, log_format="searxng")
+    assert _cidrs(collect_networks(opts, io.StringIO(log))) == [
+        "192.0.2.0/24",
+        "2001:db8:1::/48",
+    ]
+
+
+def test_collect_journald_fixture():
+    # fixture of "data/run test.iplists": IPv4 and IPv6 addresses of the MESSAGE
+    fixture = pathlib.Path(__file__).parent.parent / "data" / "iplists"
+    opts = IPListOptions(ipv4_min_pref=8, ipv6_min_pref=16, log_format="journald")
+    with open(fixture / "journald_test_list.json", encoding="utf-8") as f:
+        networks = collect_networks(opts, f)
+    assert _cidrs(networks) == sorted(
+        (fixture / "journald_test_list_filtered.txt").read_text().split()
+    )
+    assert "2001:db8::1/128" in _cidrs(networks)
@@ -0,0 +1,91 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of :py:obj:`pysandbox.prj.iplists.lookup.CidrLookup`"""
+
+import io
+import ipaddress
+import random
+
+import pytest
+
+from pysandbox.prj.iplists import lookup as lookup_module
+from pysandbox.prj.iplists.cidrset import CidrSet
+from pysandbox.prj.iplists.lookup import CidrLookup
+
+LISTS = {
+    "botnet": [
+        "10.0.0.0/23",
+        "192.0.2.7",
+        "2001:db8::/48",
+        "2001:db8:ffff::1",
+        "ffff:ffff::/32",
+    ],
+    "drop": ["10.0.1.0/24", "2001:db8:0:8000::/49", "::/8"],
+}
+
+
+def _expected(addr):
+    ip = ipaddress.ip_address(addr)
+    found = []
+    for name, networks in LISTS.items():
+        for net in ipaddress.collapse_addresses(
+            ipaddress.ip_network(n)
+            for n in networks
+            if ipaddress.ip_network(n).version == ip.version
+        ):
+            if ip in net:
+                found.append((name, str(net)))
+    return tuple(found)
+
+
+def _addresses():
+    rnd = random.Random(7)
+    addrs = [
+        "10.0.0.0",
+        "10.0.1.255",
+        "10.0.2.0",
+        "192.0.2.6",
+        "192.0.2.7",
+        "192.0.2.8",
+        "0.0.0.0",
+    ]
+    addrs += [
+        "2001:db8::",
+        "2001:db8:0:ffff:ffff:ffff:ffff:ffff",
+        "2001:db8:1::",
+        "2001:db8:ffff::1",
+        "::1",
+    ]
+    addrs += [
+        "2001:db8:ffff::",
+        "2001:db8:ffff::2",
+    ]  # same high word as 2001:db8:ffff::1
+    addrs += ["ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", "ffff:fffe::1"]
+    for _ in range(500):
+        base = ipaddress.ip_network(rnd.choice(["10.0.0.0/22", "2001:db8::/47"]))
+        addrs.append(
+            str(
+                base.network_address
+                + rnd.getrandbits(base.max_prefixlen - base.prefixlen)
+            )
+        )
+    return addrs
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_lookup(use_numpy, monkeypatch):
+    if use_numpy and lookup_module.numpy is None:
+        pytest.skip("numpy is not installed")
+    if not use_numpy:
+        monkeypatch.setattr(lookup_module, "numpy", None)
+    lookup = CidrLookup({name: CidrSet(networks) for name, networks in LISTS.items()})
+    addrs = _addresses()
+    assert lookup.lookup(addrs) == [_expected(addr) for addr in addrs]
+
+
+def test_lookup_stream_skips_invalid():
+    lookup = CidrLookup({name: CidrSet(networks) for name, networks in LISTS.items()})
+    stream = io.StringIO("10.0.1.1\n# comment\n\nnot-an-ip\n2001:db8::1  # host\n")
+    assert list(lookup.lookup_stream(stream)) == [
+        ("10.0.1.1", (("botnet", "10.0.0.0/23"), ("drop", "10.0.1.0/24"))),
+        ("2001:db8::1", (("botnet", "2001:db8::/48"),)),
+    ]
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the parse-and-merge engine (:py:obj:`pysandbox.prj.iplists.networks`)"""
+
+import io
+import ipaddress
+import random
+
+import pytest
+
+from pysandbox.prj.iplists.networks import (
+    IPV4_BITS,
+    IPV6_BITS,
+    IPListOptions,
+    collect_networks,
+    collect_networks_buffer,
+    collect_networks_mmap,
+    filter_networks,
+    merge_networks,
+    range_to_cidrs,
+)
+
+LOG = """\
+2024-01-01 10:00:00 GET / 192.0.2.1 200
+2024-01-01 10:00:01 BLOCK 198.51.100.0/24 from 203.0.113.7
+2024-01-01 10:00:02 GET / 2001:db8::1 200
+2024-01-01 10:00:03 BLOCK 2001:db8:1::/48 and fe80::1%eth0
+2024-01-01 10:00:04 no address 999.1.2.3 010.1.2.3
+2024-01-01 10:00:05 GET / 192.0.2.1 304
+"""
+
+
+def _reference(opts, text):
+    # line by line parser (filter_networks) normalized with ipaddress
+    found = {IPV4_BITS: set(), IPV6_BITS: set()}
+    for ip, cidr in filter_networks(opts, io.StringIO(text)):
+        try:
+            net = ipaddress.ip_network(f"{ip}/{cidr}" if cidr else ip, strict=False)
+        except ValueError:
+            continue
+        found[net.max_prefixlen].add((int(net.network_address), net.prefixlen))
+    return found
+
+
+@pytest.mark.parametrize("re_substring", ["", r"\S+ \S+ BLOCK \S+"])
+def test_collectors_equal_line_parser(tmp_path, re_substring):
+    opts = IPListOptions(ipv4_min_pref=8, ipv6_min_pref=16, re_substring=re_substring)
+    expected = _reference(opts, LOG)
+    assert expected[IPV4_BITS] and expected[IPV6_BITS]
+
+    assert collect_networks(opts, io.StringIO(LOG)) == expected
+    assert collect_networks_buffer(opts, LOG.encode()) == expected
+
+    path = tmp_path / "access.log"
+    path.write_text(LOG)
+    with open(path, "rb") as f:
+        assert collect_networks_mmap(opts, f) == expected
+
+
+def test_merge_networks_like_collapse_addresses():
+    rnd = random.Random(42)
+    pairs = set()
+    for _ in range(2000):
+        prefixlen = rnd.choice([24, 28, 30, 31, 32, 32, 32])
+        net = rnd.getrandbits(32) & ~((1 << (32 - prefixlen)) - 1)
+        pairs.add((net & 0x00FFFFFF | 0x0A000000, prefixlen))  # 10.0.0.0/8
+    expected = ipaddress.collapse_addresses(
+        ipaddress.ip_network((net, prefixlen)) for net, prefixlen in pairs
+    )
+    got = [ipaddress.ip_network(pair) for pair in merge_networks(pairs, IPV4_BITS)]
+    assert got == list(expected)
+
+
+def test_range_to_cidrs():
+    first, last = int(ipaddress.ip_address("192.0.2.1")), int(
+        ipaddress.ip_address("192.0.2.10")
+    )
+    got = [
+        ipaddress.ip_network(pair) for pair in range_to_cidrs(first, last, IPV4_BITS)
+    ]
+    assert got == list(
+        ipaddress.summarize_address_range(
+            ipaddress.ip_address(first), ipaddress.ip_address(last)
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("error in std::string", []),
+        ("class a::b { dead::beef }", []),
+        ("GET / ::ffff:192.0.2.1 200", ["192.0.2.1/32"]),
+        ("GET / ::ffff:c000:201 200", ["::ffff:c000:201/128"]),
+        (
+            "1::8 fe80::1 2001:db8:: :: ::1",
+            ["::/128", "::1/128", "1::8/128", "2001:db8::/128", "fe80::1/128"],
+        ),
+        (
+            "from 2001:db8::1. [2001:db8::2]:443 2001:db8::3/64",
+            ["2001:db8::1/128", "2001:db8::2/128", "2001:db8::/64"],
+        ),
+    ],
+)
+def test_ipv6_matches(line, expected):
+    opts = IPListOptions(ipv6_min_pref=16)
+    found = collect_networks(opts, io.StringIO(line))
+    assert (
+        found == collect_networks_buffer(opts, line.encode()) == _reference(opts, line)
+    )
+    got = [
+        f"{ipaddress.ip_network(pair)}"
+        for bits in (IPV4_BITS, IPV6_BITS)
+        for pair in sorted(found[bits])
+    ]
+    assert sorted(got) == sorted(expected)
+
+
+def test_ipv6_norm_pref_no_scope_operators():
+    opts = IPListOptions(ipv6_min_pref=16, ipv6_norm_pref=64)
+    found = collect_networks(
+        opts, io.StringIO("error in std::string\nclass a::b\n2001:db8::1\n")
+    )
+    assert found == {
+        IPV4_BITS: set(),
+        IPV6_BITS: {(int(ipaddress.ip_address("2001:db8::")), 64)},
+    }
@@ -0,0 +1,242 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the DNSBL cache of :py:obj:`pysandbox.prj.pydnsbl`"""
+
+import asyncio
+import time
+import types
+
+import aiodns
+import pytest
+from click.testing import CliRunner
+from pydnsbl.checker import DNSBLResponse
+
+from pysandbox.prj import pydnsbl as pydnsbl_module
+from pysandbox.prj.pydnsbl import (
+    DNSBL_NOT_LISTED,
+    DNSBLCache,
+    dnsbl,
+    iter_dnsbl_results,
+)
+
+ZONE = "zen.spamhaus.org"
+
+
+def _result(ip, result, ret_code=None, ttl=None):
+    return {
+        "ip": ip,
+        "zone": ZONE,
+        "result": result,
+        "ret_code": ret_code,
+        "ttl": ttl,
+        "cached": False,
+    }
+
+
+class Clock:
+    """Replaces :py:obj:`time.time`, the time is moved by :py:obj:`sleep`."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeResolver:
+    """IPs with an even last octet are listed (``127.0.0.2``, TTL 300)."""
+
+    def __init__(self):
+        self.queries = 0
+
+    async def query(self, hostname, _qtype):
+        self.queries += 1
+        if int(hostname.split(".", 1)[0]) % 2:
+            raise aiodns.error.DNSError(
+                aiodns.error.ARES_ENOTFOUND, "Domain name not found"
+            )
+        return [types.SimpleNamespace(host="127.0.0.2", ttl=300)]
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture(name="cache")
+def fixture_cache(tmp_path, clock):  # pylint: disable=unused-argument
+    with DNSBLCache(str(tmp_path / "dnsbl.sqlite"), negative_ttl=900) as cache:
+        yield cache
+
+
+def test_cache_ttl(cache, clock):
+    cache.set_results(
+        [
+            _result("192.0.2.1", "spam", "127.0.0.2", 300),
+            _result("192.0.2.2", DNSBL_NOT_LISTED, "NXDOMAIN"),
+            _result(
+                "192.0.2.3", "lookup error", "Timeout while contacting DNS servers"
+            ),
+            _result("192.0.2.4", "spam", "127.0.0.2", 0),
+        ]
+    )
+    keys = [(ZONE, f"192.0.2.{i}") for i in range(1, 5)]
+    assert len(cache) == 2
+
+    clock.sleep(100)
+    results = cache.get_results(keys)
+    assert sorted(results) == keys[:2]
+    assert results[keys[0]] == {
+        **_result("192.0.2.1", "spam", "127.0.0.2", 200),
+        "cached": True,
+    }
+    assert results[keys[1]] == {
+        **_result("192.0.2.2", DNSBL_NOT_LISTED, "NXDOMAIN"),
+        "cached": True,
+    }
+
+    clock.sleep(250)
+    assert sorted(cache.get_results(keys)) == keys[1:2]
+    clock.sleep(600)
+    assert not cache.get_results(keys)
+
+
+def test_cache_error_codes(cache):
+    # the answers of Spamhaus to queries through a public resolver or when the
+    # rate limit is reached are not listings
+    cache.set_results(
+        [
+            _result("192.0.2.1", "dnsbl error", "127.255.255.254", 300),
+            _result("192.0.2.2", "dnsbl error", "127.255.255.252", 300),
+            _result("192.0.2.3", "dnsbl error", "127.0.0.99", 300),
+            _result("192.0.2.4", "spam", "127.0.0.3", 300),
+            {
+                **_result("192.0.2.5", "spam", "127.0.0.2", 300),
+                "zone": "b.barracudacentral.org",
+            },
+            {
+                **_result("192.0.2.6", "unknown", "127.255.255.255", 300),
+                "zone": "b.barracudacentral.org",
+            },
+        ]
+    )
+    keys = [(ZONE, f"192.0.2.{i}") for i in range(1, 5)] + [
+        ("b.barracudacentral.org", f"192.0.2.{i}") for i in (5, 6)
+    ]
+    assert sorted(cache.get_results(keys)) == sorted([keys[3], keys[4]])
+
+
+def test_cache_refresh(cache):
+    cache.set_results([_result("192.0.2.1", DNSBL_NOT_LISTED, "NXDOMAIN")])
+    cache.refresh = True
+    assert not cache.get_results([(ZONE, "192.0.2.1")])
+
+
+def test_cache_max_entries(tmp_path, clock):
+    with DNSBLCache(str(tmp_path / "dnsbl.sqlite"), max_entries=2) as cache:
+        for i in range(1, 4):
+            cache.set_results([_result(f"192.0.2.{i}", DNSBL_NOT_LISTED, "NXDOMAIN")])
+            clock.sleep(1)
+            cache.get_results([(ZONE, "192.0.2.1")])
+        assert sorted(
+            ip
+            for _, ip in cache.get_results((ZONE, f"192.0.2.{i}") for i in range(1, 4))
+        ) == [
+            "192.0.2.1",
+            "192.0.2.3",
+        ]
+
+
+async def _collect(ips, resolver, cache):
+    return [
+        result
+        async for result in iter_dnsbl_results(ips, [ZONE], resolver, cache=cache)
+    ]
+
+
+def test_iter_dnsbl_results_cached(cache, clock, monkeypatch):
+    monkeypatch.setattr(pydnsbl_module, "DNSBL_CACHE_BATCH", 3)
+    ips = [f"192.0.2.{i}" for i in range(10)]
+    resolver = FakeResolver()
+
+    first = asyncio.run(_collect(ips, resolver, cache))
+    assert resolver.queries == 10 and not any(result["cached"] for result in first)
+
+    clock.sleep(60)
+    second = asyncio.run(_collect(ips + ["192.0.2.10"], resolver, cache))
+    assert resolver.queries == 11
+    assert [result["ip"] for result in second if not result["cached"]] == ["192.0.2.10"]
+    listed = {
+        result["ip"]: result
+        for result in second
+        if result["cached"] and result["ttl"] is not None
+    }
+    assert sorted(listed) == ips[::2] and {
+        result["ttl"] for result in listed.values()
+    } == {240}
+
+
+def test_iter_dnsbl_results_streams_cached(cache):
+    # cached results are yielded while the IPs are read, not after the input
+    # has been read to the end
+    ips = [f"10.0.{i >> 8}.{i & 255}" for i in range(5000)]
+    asyncio.run(_collect(ips, FakeResolver(), cache))
+    consumed = 0
+
+    def iter_ips():
+        nonlocal consumed
+        for ip in ips:
+            consumed += 1
+            yield ip
+
+    async def first():
+        results = iter_dnsbl_results(
+            iter_ips(), [ZONE], FakeResolver(), concurrency=10, cache=cache
+        )
+        result = await anext(results)
+        await results.aclose()
+        return result
+
+    assert asyncio.run(first())["cached"]
+    assert consumed <= pydnsbl_module.DNSBL_CACHE_BATCH + 10
+
+
+def test_py_cached(tmp_path, monkeypatch, request):
+    queries = []
+
+    async def dnsbl_request(self, addr, provider):  # pylint: disable=unused-argument
+        queries.append(addr)
+        response = (
+            [types.SimpleNamespace(host="127.0.0.2", ttl=300)]
+            if provider.host == ZONE
+            else None
+        )
+        return DNSBLResponse(addr=addr, provider=provider, response=response)
+
+    monkeypatch.setattr(
+        pydnsbl_module, "cache_path", lambda name: str(tmp_path / f"{name}.sqlite")
+    )
+    monkeypatch.setattr(
+        pydnsbl_module._IpChecker, "dnsbl_request", dnsbl_request
+    )  # pylint: disable=protected-access
+    ips = tmp_path / "ips.txt"
+    ips.write_text("192.0.2.1\n")
+    # pydnsbl runs the queries in the event loop of the main thread
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    request.addfinalizer(loop.close)
+
+    outputs = []
+    for _ in range(2):
+        result = CliRunner().invoke(dnsbl, ["py", str(ips)])
+        assert result.exit_code == 0, result.output
+        outputs.append(result.output)
+    assert set(queries) == {"192.0.2.1"} and len(queries) == len(
+        pydnsbl_module._IpChecker().providers
+    )
+    assert outputs[0] == outputs[1]
+    assert "blacklisted: True" in outputs[0] and ZONE in outputs[0]
@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the IRRd queries and the fall back to RPSL queries of
+:py:obj:`pysandbox.prj.whois`"""
+
+import ipaddress
+import socketserver
+import threading
+import types
+
+import pytest
+
+from pysandbox.prj import whois
+from pysandbox.prj.whois import IRRdNotSupported, asn_networks, asn_origin_irrd
+from pysandbox.prj.whoisbench import FakeWhoisServer, synthetic_fixture
+
+ROUTES = {
+    64500: {"route": ["192.0.2.0/24"], "route6": ["2001:db8::/32"]},
+    64501: {"route": ["198.51.100.0/24", "203.0.113.0/24"]},
+}
+
+
+class RPSLServer(socketserver.ThreadingTCPServer):
+    """WHOIS server that knows only inverse origin queries, the IRRd command
+    ``!!`` is not answered (``silent``) or the connection is closed."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, silent: bool):
+        self.silent = silent
+        self.stop = threading.Event()
+        super().__init__(("127.0.0.1", 0), RPSLHandler)
+
+    @property
+    def host_setup(self) -> dict:
+        return {
+            "server": "127.0.0.1",
+            "port": self.server_address[1],
+            "timeout": 0.5,
+            "retries": 1,
+            "backoff": 0.01,
+        }
+
+
+class RPSLHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if line.startswith(b"!"):
+            if self.server.silent:
+                self.server.stop.wait(5)
+            return
+        asn = int(line.split()[-1].decode().removeprefix("AS"))
+        for key, networks in ROUTES.get(asn, {}).items():
+            for net in networks:
+                self.wfile.write(f"{key}: {net}\norigin: AS{asn}\n\n".encode())
+        if asn not in ROUTES:
+            self.wfile.write(b"%  no entries found\n")
+
+
+@pytest.fixture(name="rpsl_host", params=[True, False], ids=["silent", "closed"])
+def fixture_rpsl_host(request, monkeypatch):
+    server = RPSLServer(silent=request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+    yield "TEST"
+    server.stop.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="irrd_host")
+def fixture_irrd_host(monkeypatch):
+    fixture = {
+        asn: [{k: v} for k, v in routes.items()] for asn, routes in ROUTES.items()
+    }
+    with FakeWhoisServer(fixture) as server:
+        monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+        yield server
+
+
+def _expected(asn_list):
+    nets = [
+        ipaddress.ip_network(n)
+        for asn in asn_list
+        for v in ROUTES.get(asn, {}).values()
+        for n in v
+    ]
+    return [n for n in nets if n.version == 4], [n for n in nets if n.version == 6]
+
+
+def test_irrd(irrd_host):
+    assert asn_networks(
+        ["AS64500", "64501", "AS64999"], "TEST", mode="irrd"
+    ) == _expected([64500, 64501])
+    assert irrd_host.connections == 1
+
+
+def test_irrd_not_supported(rpsl_host):
+    with pytest.raises(IRRdNotSupported):
+        asn_origin_irrd(["AS64500"], whois.whois_host_setup(rpsl_host))
+    with pytest.raises(IRRdNotSupported):
+        asn_networks(["AS64500"], rpsl_host, mode="irrd")
+
+
+def test_auto_falls_back_to_rpsl(rpsl_host):
+    assert asn_networks(["AS64500", "AS64501"], rpsl_host, mode="auto") == _expected(
+        [64500, 64501]
+    )
+
+
+def test_irrd_retry_after_answer(irrd_host, monkeypatch):
+    # the server drops the connection in the second batch and at the first
+    # query of the next session, it answered IRRd queries before: the session
+    # is retried instead of falling back to RPSL queries
+    monkeypatch.setattr(whois, "IRRD_BATCH", 1)
+    drops = iter([1, 1, 0, 0])
+    monkeypatch.setattr(
+        irrd_host, "_random", types.SimpleNamespace(random=lambda: next(drops, 1))
+    )
+    irrd_host.fail_rate = 0.5
+    assert asn_networks(["AS64500", "AS64501"], "TEST", mode="irrd") == _expected(
+        [64500, 64501]
+    )
+    assert (irrd_host.connections, irrd_host.failures) == (3, 2)
+
+
+def _drop(server, monkeypatch, pattern):
+    # drop the queries of the server where the pattern is 0
+    drops = iter(pattern)
+    monkeypatch.setattr(
+        server, "_random", types.SimpleNamespace(random=lambda: next(drops, 1))
+    )
+    server.fail_rate = 0.5
+
+
+def test_irrd_keeps_answers_of_a_failed_batch(monkeypatch):
+    # the 15th answer of a batch (!6 of the 8th ASN) is dropped, the next
+    # session continues at the 8th ASN
+    fixture = {asn: [{"route": [f"10.{asn}.0.0/16"]}] for asn in range(1, 11)}
+    with FakeWhoisServer(fixture) as server:
+        monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+        _drop(server, monkeypatch, [1] * 14 + [0])
+        ipv4, ipv6 = asn_networks([f"AS{asn}" for asn in fixture], "TEST", mode="irrd")
+    assert (
+        ipv4 == [ipaddress.ip_network(f"10.{asn}.0.0/16") for asn in fixture]
+        and not ipv6
+    )
+    assert (server.connections, server.queries) == (2, 15 + 6)
+
+
+def test_irrd_retries_first_session(irrd_host, monkeypatch):
+    # in the irrd mode a failure of the first session is retried, no fall back
+    _drop(irrd_host, monkeypatch, [0])
+    assert asn_networks(["AS64500", "AS64501"], "TEST", mode="irrd") == _expected(
+        [64500, 64501]
+    )
+    assert irrd_host.connections == 2
+
+
+def test_irrd_fail_rate(monkeypatch):
+    # fault injection of the benchmarks (whois bench --fail-rate 0.05)
+    fixture = synthetic_fixture(300)
+    expected = {
+        key: sorted(
+            {
+                ipaddress.ip_network(net, strict=False)
+                for objs in fixture.values()
+                for obj in objs
+                for net in obj.get(key, [])
+            }
+        )
+        for key in ("route", "route6")
+    }
+    with FakeWhoisServer(fixture, fail_rate=0.05) as server:
+        monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+        ipv4, ipv6 = asn_networks([f"AS{asn}" for asn in fixture], "TEST", mode="irrd")
+    assert server.failures
+    assert (sorted(set(ipv4)), sorted(set(ipv6))) == (
+        expected["route"],
+        expected["route6"],
+    )
+
+
+@pytest.mark.parametrize("mode", ["irrd", "rpsl"])
+def test_route_comments(monkeypatch, mode):
+    # comments of the route values are stripped, invalid networks are skipped
+    fixture = {
+        64500: [
+            {"route": ["192.0.2.0/24 # foo"]},
+            {"route": ["no network"]},
+            {"route6": ["2001:db8::/32#x"]},
+        ]
+    }
+    with FakeWhoisServer(fixture) as server:
+        monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+        assert asn_networks(["AS64500"], "TEST", mode=mode) == _expected([64500])
+
+
+def test_rpsl_fail_rate(monkeypatch):
+    # a connection closed without a response is retried
+    fixture = {asn: [{"route": [f"10.{asn}.0.0/16"]}] for asn in range(1, 11)}
+    with FakeWhoisServer(fixture) as server:
+        monkeypatch.setitem(whois.WHOIS_HOSTS, "TEST", server.host_setup)
+        _drop(server, monkeypatch, [0, 1, 0])
+        ipv4, _ = asn_networks([f"AS{asn}" for asn in fixture], "TEST", mode="rpsl")
+    assert ipv4 == [ipaddress.ip_network(f"10.{asn}.0.0/16") for asn in fixture]
+    assert server.failures == 2
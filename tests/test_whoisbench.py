@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""Tests of the fixtures of :py:obj:`pysandbox.prj.whoisbench`"""
+
+from click.testing import CliRunner
+
+from pysandbox.prj.whois import whois
+from pysandbox.prj.whoisbench import (
+    check_fixture,
+    load_fixture,
+    render_object,
+    synthetic_fixture,
+)
+
+RECORDED = b"""\
+% This is a recorded response.
+
+route:          192.0.2.0/24
+origin:         AS64500
+source:         TEST
+
+route6:         2001:db8::/32
+descr:          continued
+                value
+origin:         AS64500
+
+route:          198.51.100.0/24
+origin:         AS64501
+"""
+
+
+def _record(tmp_path, data: bytes) -> str:
+    path = tmp_path / "recorded.txt"
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_synthetic_fixture_round_trip(tmp_path):
+    fixture = synthetic_fixture(200)
+    assert not check_fixture(fixture)
+    path = _record(
+        tmp_path,
+        b"".join(render_object(obj) for objs in fixture.values() for obj in objs),
+    )
+    assert load_fixture(path) == fixture
+
+
+def test_recorded_fixture(tmp_path):
+    fixture = load_fixture(_record(tmp_path, RECORDED))
+    assert sorted(fixture) == [64500, 64501]
+    assert [obj.get("route6") for obj in fixture[64500]] == [None, ["2001:db8::/32"]]
+    assert not check_fixture(fixture)
+
+
+def test_check_fixture():
+    fixture = {
+        1: [{"route": ["192.0.2.0/24"], "origin": ["AS1"]}],
+        2: [{"route": ["192.0.2.0/24 # comment"], "origin": ["AS2"]}],
+        3: [{"route": ["192.0.2.0/24"], "origin": ["AS3"], "remarks": ["", "text"]}],
+    }
+    assert check_fixture(fixture) == [2]
+
+
+def test_cli_rejects_fixture(tmp_path):
+    path = _record(
+        tmp_path, RECORDED + b"\nroute: 203.0.113.0/24 # comment\norigin: AS64502\n"
+    )
+    for command in ("bench", "fake-server"):
+        result = CliRunner().invoke(whois, [command, "--fixture", path])
+        assert result.exit_code == 1
+        assert "1 ASN don't parse: AS64502" in result.output